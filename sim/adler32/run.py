@@ -10,29 +10,17 @@ import zlib
 from vunit import VUnit
 
 
-def to_signed(int_):
-    """Convert a signed 32 bit number to an unsigned 32 bit number.
-    Useful for VUnit, since the "integer_array_t" needs signed int.
-    """
-    if int_ > 2**31-1:
-        return (2**32 - int_) * (-1)
-    return int_
-
-
 def generate_data(root, case):
-    filename = join(root, "gen", f"input_{case.name}.csv")
-    input_data_preprocessed = [int.from_bytes(datum, "big")
-                               for datum in case.data_in]
-    input_data_preprocessed = map(to_signed, input_data_preprocessed)
-    input_data_preprocessed = map(str, input_data_preprocessed)
-    with open(filename, "w") as infile:
-        infile.write(", ".join(input_data_preprocessed))
-
-    output_data = to_signed(zlib.adler32(b"".join(case.data_in)))
-
-    filename = join(root, "gen", f"output_{case.name}.csv")
-    with open(filename, "w") as outfile:
-        outfile.write(str(output_data))
+    # The words are split into bytes, since "integer_array_t" supports only 32 bit.
+    # The files are read by "load_raw()": One byte per input word and
+    # a signed 32 bit little endian word for the checksum.
+    filename = join(root, "gen", f"input_{case.name}.raw")
+    with open(filename, "wb") as infile:
+        infile.write(b"".join(case.data_in))
+
+    filename = join(root, "gen", f"output_{case.name}.raw")
+    with open(filename, "wb") as outfile:
+        outfile.write(zlib.adler32(b"".join(case.data_in)).to_bytes(4, "little"))
     return True
 
 
@@ -44,20 +32,21 @@ def create_test_suite(tb_lib):
 
     Case = namedtuple("Case", ["name", "data_in"])
     testcases = [
-        Case("8_bit_random", [randint(0, 255).to_bytes(1, "big")]),
-        Case("8_bit_serial",
-             [randint(0, 255).to_bytes(1, "big") for _ in range(4)]),
-        # TODO: For now only 8 bit input is supported.
-        # Case("24_bit", [b"\x61\x62\x63"]),
-        # Case("32_bit_random", [randint(0, 2 ** 31 - 1).to_bytes(4, "big")]),
-        # Case("IEND", [b"\x49\x45\x4e\x44"]),
-        # Case("32_bit_serial",
-        #      [randint(0, 2 ** 31 - 1).to_bytes(4, "big") for _ in range(4)]),
-        # Case("trigger_overflow", [b"FF" for _ in range(100)]),
+        Case("24_bit", [b"\x61\x62\x63"]),
+        Case("32_bit_IEND", [b"\x49\x45\x4e\x44"]),
     ]
+    for bytes_ in (1, 2, 4, 8):
+        bits = bytes_ * 8
+        testcases.extend([
+            Case(f"{bits}_bit_random", [randint(0, 2 ** bits - 1).to_bytes(bytes_, "big")]),
+            Case(f"{bits}_bit_serial",
+                 [randint(0, 2 ** bits - 1).to_bytes(bytes_, "big") for _ in range(100)]),
+            # The sums exceed the modulo base after a few words.
+            Case(f"{bits}_bit_trigger_overflow",
+                 [b"\xff" * bytes_ for _ in range(6000 // bytes_)]),
+        ])
 
     for case in testcases:
-        # TODO: sequential processing
         generics = {
             "id": case.name,
             "C_INPUT_BITWIDTH": len(case.data_in[0]) * 8
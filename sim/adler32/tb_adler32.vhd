@@ -52,11 +52,9 @@ begin
   begin
     test_runner_setup(runner, runner_cfg);
     set_stop_level(failure);
-    data_src := load_csv(tb_path(runner_cfg) & "gen/input_" & id & ".csv");
-    data_ref := load_csv(tb_path(runner_cfg) & "gen/output_" & id & ".csv");
-    check_relation(width(data_ref) /= 0);
-    check_relation(height(data_ref) /= 0);
-    check_relation(depth(data_ref) /= 0);
+    data_src := load_raw(tb_path(runner_cfg) & "gen/input_" & id & ".raw", 8, false);
+    data_ref := load_raw(tb_path(runner_cfg) & "gen/output_" & id & ".raw");
+    check_relation(length(data_ref) = 1);
 
     wait until (stimuli_done and
                 data_check_done and
@@ -73,13 +71,17 @@ begin
     sl_start <= '0';
     wait until rising_edge(sl_clk);
 
-    for i in 0 to width(data_src) - 1 loop
-      wait until rising_edge(sl_clk);
+    -- The input file contains bytes. The first byte of a word is in the most significant bits.
+    -- A word is sent in each cycle.
+    for i in 0 to length(data_src) / (C_INPUT_BITWIDTH / 8) - 1 loop
       sl_valid_in <= '1';
-      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i, 0), slv_data_in'length));
+      for byte in 0 to C_INPUT_BITWIDTH / 8 - 1 loop
+        slv_data_in(C_INPUT_BITWIDTH - 1 - byte * 8 downto C_INPUT_BITWIDTH - 8 - byte * 8) <=
+          std_logic_vector(to_unsigned(get(data_src, i * C_INPUT_BITWIDTH / 8 + byte), 8));
+      end loop;
       wait until rising_edge(sl_clk);
-      sl_valid_in <= '0';
     end loop;
+    sl_valid_in <= '0';
 
     stimuli_done <= true;
     wait;
@@ -91,11 +93,9 @@ begin
     data_check_done <= false;
 
     wait until rising_edge(sl_clk) and stimuli_done;
-    -- 3 cycles delay
-    wait until rising_edge(sl_clk);
-    wait until rising_edge(sl_clk);
+    -- 1 cycle delay
     wait until rising_edge(sl_clk);
-    check_equal(slv_data_out, std_logic_vector(to_unsigned(get(data_ref, 0, 0), slv_data_out'length)));
+    check_equal(slv_data_out, std_logic_vector(to_signed(get(data_ref, 0), slv_data_out'length)));
     
     report ("Done checking");
     data_check_done <= true;
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+"""Benchmark the png encoder for a sweep of generics over a fixed corpus.
+
+For each point of the sweep, the cycles per input byte, the output size and the
+compression ratio are recorded to a JSON and a CSV file. Optionally, the
+results are compared with a baseline. The run fails, if the throughput or the
+compression ratio got worse. With the reference model, the cycles are only
+estimated. Thus only the output size is compared, and it has to match exactly.
+
+Examples:
+    ./benchmark.py -p4 --baseline benchmark_baseline.json
+    ./benchmark.py -p4 --save-baseline benchmark_baseline.json
+    ./benchmark.py -p4 --reduced --baseline base.json  # a few points, like the CI
+    ./benchmark.py --model --baseline benchmark_baseline_model.json
+"""
+
+import csv
+from functools import partial
+import itertools
+import json
+import os
+from os.path import join, dirname
+import resource
+import sys
+from typing import Dict, List
+
+from vunit import VUnit, VUnitCLI
+
+import png_model
+import stimuli
+from run_all import add_libraries
+
+
+# The corpus is generated, so that the results are reproducible.
+CORPUS_SIZE = (32, 24)
+CORPUS = ("gradient", "tiles", "noise", "sensor")
+
+SWEEP = {
+    "input_buffer_size": (8, 12, 16),
+    "search_buffer_size": (12, 24),
+    "max_match_length_user": (7, 15),
+    "row_filter_type": (0, 1, 5),
+    "color_type": (0, 2),
+}
+
+# A few points of the sweep, which can be simulated for each change by the CI.
+# They cover the smallest and largest buffers, both match lengths and the
+# adaptive row filter.
+REDUCED_SWEEP = (
+    ("gradient", (12, 12, 15, 0, 2)),
+    ("tiles", (8, 12, 7, 1, 0)),
+    ("noise", (16, 24, 15, 5, 2)),
+    ("sensor", (16, 24, 7, 5, 0)),
+)
+
+
+class Point:
+    """A single benchmark, i. e. an image and a set of generics."""
+
+    def __init__(self, image: str, **kwargs):
+        self.image = image
+        self.generics = png_model.Generics(*CORPUS_SIZE, **kwargs)
+        self.data_in = list(stimuli.to_bytes(stimuli.Stimulus(
+            image, *CORPUS_SIZE, self.generics.depth)))
+
+    @property
+    def id_(self) -> str:
+        generics = self.generics
+        return (f"bench_{self.image}_ib_{generics.input_buffer_size}_"
+                f"sb_{generics.search_buffer_size}_"
+                f"ml_{generics.max_match_length_user}_"
+                f"row_filter_{generics.row_filter_type}_"
+                f"color_{generics.color_type}")
+
+    def result(self, cycles: int, output_bytes: int) -> Dict:
+        result = {"id": self.id_, "image": self.image}
+        result.update({key: getattr(self.generics, key) for key in SWEEP})
+        result.update({
+            "input_bytes": len(self.data_in),
+            "cycles": cycles,
+            "cycles_per_byte": cycles / len(self.data_in),
+            "output_bytes": output_bytes,
+            "ratio": len(self.data_in) / output_bytes,
+        })
+        return result
+
+
+def create_points(reduced: bool = False) -> List[Point]:
+    if reduced:
+        return [Point(image, **dict(zip(SWEEP, values)))
+                for image, values in REDUCED_SWEEP]
+    return [Point(image, **dict(zip(SWEEP, values)))
+            for image in CORPUS
+            for values in itertools.product(*SWEEP.values())]
+
+
+def create_stimuli(root: str, point: Point):
+    filename = join(root, "gen", f"input_{point.id_}.raw")
+    with open(filename, "wb") as infile:
+        infile.write(bytes(point.data_in))
+    return True
+
+
+def record_result(root: str, point: Point, results: Dict[str, Dict]):
+    output_bytes = os.path.getsize(join(root, "gen", f"png_{point.id_}.raw"))
+    with open(join(root, "gen", f"cycles_{point.id_}.txt")) as infile:
+        cycles = int(infile.read())
+    results[point.id_] = point.result(cycles, output_bytes)
+    return True
+
+
+def create_test_suite(tb_lib, points: List[Point], results: Dict[str, Dict]):
+    root = join(dirname(__file__), "png_encoder")
+    os.makedirs(join(root, "gen"), exist_ok=True)
+
+    tb_png_encoder = tb_lib.entity("tb_png_encoder")
+    for point in points:
+        generics = {"id": point.id_, **point.generics.to_vhdl()}
+        tb_png_encoder.add_config(
+            name=point.id_, generics=generics,
+            pre_config=partial(create_stimuli, root, point),
+            post_check=partial(record_result, root, point, results))
+
+
+def estimate_results(points: List[Point]) -> Dict[str, Dict]:
+    results = {}
+    for point in points:
+        output_bytes = len(png_model.png_encoder(point.data_in, point.generics))
+        cycles = png_model.estimate_cycles(point.data_in, point.generics)
+        results[point.id_] = point.result(cycles, output_bytes)
+    return results
+
+
+def write_results(results: Dict[str, Dict], basename: str):
+    rows = [results[id_] for id_ in sorted(results)]
+    with open(f"{basename}.json", "w") as outfile:
+        json.dump(rows, outfile, indent=2)
+    if rows:
+        with open(f"{basename}.csv", "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def compare_with_baseline(results: Dict[str, Dict], filename: str,
+                          tolerance: float, size_only: bool = False) -> bool:
+    """Check the throughput and the compression ratio for regressions.
+    size_only: Only check that the output size equals the baseline."""
+    with open(filename) as infile:
+        baseline = {row["id"]: row for row in json.load(infile)}
+
+    ok = True
+    for id_, result in sorted(results.items()):
+        if id_ not in baseline:
+            print(f"{id_}: not in baseline")
+            continue
+        reference = baseline[id_]
+        if size_only:
+            if result["output_bytes"] != reference["output_bytes"]:
+                print(f"{id_}: output size changed "
+                      f"{reference['output_bytes']} -> {result['output_bytes']}")
+                ok = False
+            continue
+        if result["cycles_per_byte"] > reference["cycles_per_byte"] * (1 + tolerance):
+            print(f"{id_}: throughput regression, cycles per byte "
+                  f"{reference['cycles_per_byte']:.3f} -> {result['cycles_per_byte']:.3f}")
+            ok = False
+        if result["ratio"] < reference["ratio"] * (1 - tolerance):
+            print(f"{id_}: compression ratio regression "
+                  f"{reference['ratio']:.3f} -> {result['ratio']:.3f}")
+            ok = False
+    return ok
+
+
+def post_run(args, results: Dict[str, Dict]):
+    write_results(results, args.output)
+    if args.save_baseline:
+        write_results(results, os.path.splitext(args.save_baseline)[0])
+    if args.baseline and not compare_with_baseline(
+            results, args.baseline, args.tolerance, size_only=args.model):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    CLI = VUnitCLI()
+    CLI.parser.add_argument(
+        "--model", action="store_true",
+        help="calculate the results by the reference model instead of simulating. "
+             "The cycles are only a rough estimate. Thus only the output size "
+             "is compared with the baseline.")
+    CLI.parser.add_argument(
+        "--reduced", action="store_true",
+        help="only run a few points of the sweep, e.g. for the CI")
+    CLI.parser.add_argument(
+        "--output", default="benchmark",
+        help="basename of the JSON and CSV result files")
+    CLI.parser.add_argument("--baseline", help="JSON file to compare with")
+    CLI.parser.add_argument("--save-baseline", help="JSON file to save the results as baseline")
+    CLI.parser.add_argument(
+        "--tolerance", type=float, default=0.01,
+        help="relative tolerance of the comparison with the baseline")
+    ARGS = CLI.parse_args()
+
+    POINTS = create_points(ARGS.reduced)
+    RESULTS: Dict[str, Dict] = {}
+
+    if ARGS.model:
+        RESULTS = estimate_results(POINTS)
+        post_run(ARGS, RESULTS)
+        sys.exit(0)
+
+    os.environ["VUNIT_SIMULATOR"] = "ghdl"
+
+    # See also "run_all.py".
+    resource.setrlimit(resource.RLIMIT_STACK, (resource.RLIM_INFINITY,
+                                               resource.RLIM_INFINITY))
+
+    PRJ = VUnit.from_args(ARGS)
+    PRJ.add_vhdl_builtins()
+    create_test_suite(add_libraries(PRJ, ["tb_png_encoder"]), POINTS, RESULTS)
+    PRJ.main(post_run=lambda results: post_run(ARGS, RESULTS))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""Offline store of the compression corpus.
+
+The corpus directory is "sim/corpus" or the directory given by the environment
+variable PICO_PNG_CORPUS. It contains the files of the Calgary and Canterbury
+corpora and optionally raw image dumps (*.raw). The files of the corpora are
+verified by their published size and SHA-256 hash, which are pinned below.
+Files without a pinned hash are only checked by their size.
+The raw image dumps are supplied by the user. They are verified by their hash,
+listed in "SHA256SUMS" of the corpus directory. Files that are missing or not
+listed are skipped. Files with a wrong size or hash raise an error.
+
+Additionally, a few images are generated by "stimuli.py". They are always
+available, so that the deflate testbench runs even without a corpus directory.
+
+Examples:
+    ./corpus.py  # list the available files
+    ./corpus.py --fetch  # download the corpora, extract and verify them
+    ./corpus.py --record  # record the hashes of the raw image dumps
+"""
+
+import argparse
+import dataclasses
+import hashlib
+from io import BytesIO
+import os
+from os.path import join, dirname, isfile
+from typing import Dict, List
+import zipfile
+
+import stimuli
+
+
+CORPUS_DIR = os.environ.get("PICO_PNG_CORPUS", join(dirname(__file__), "corpus"))
+HASH_FILE = "SHA256SUMS"
+
+# Name and size of the files.
+CALGARY = {
+    "bib": 111261, "book1": 768771, "book2": 610856, "geo": 102400,
+    "news": 377109, "obj1": 21504, "obj2": 246814, "paper1": 53161,
+    "paper2": 82199, "paper3": 46526, "paper4": 13286, "paper5": 11954,
+    "paper6": 38105, "pic": 513216, "progc": 39611, "progl": 71646,
+    "progp": 49379, "trans": 93695,
+}
+CANTERBURY = {
+    "alice29.txt": 152089, "asyoulik.txt": 125179, "cp.html": 24603,
+    "fields.c": 11150, "grammar.lsp": 3721, "kennedy.xls": 1029744,
+    "lcet10.txt": 426754, "plrabn12.txt": 481861, "ptt5": 513216,
+    "sum": 38240, "xargs.1": 4227,
+}
+# SHA-256 hashes of the files of the corpora. They are checked in addition to
+# the size. The other files are only checked by their size, until their hash
+# is verified against an independent copy of the corpus.
+SHA256 = {
+    "alice29.txt": "7467306ee0feed4971260f3c87421154a05be571d944e9cb021a5713700c38f0",
+    "asyoulik.txt": "eaa3526fe53859f34ecdf255712f9ecf0b2c903451d4755b2edaa2e2599cb0fc",
+    "lcet10.txt": "5314ba1dbb03f471df88bec6cd120a938ef60d0fd3511c5c1dce61bf7463245f",
+    "plrabn12.txt": "07e2e0b461af78c7c647cb53dab39de560198e16f799b4516eccf0fbd69f764c",
+}
+URLS = {
+    "calgary": "http://www.data-compression.info/files/corpora/calgarycorpus.zip",
+    "canterbury": "https://corpus.canterbury.ac.nz/resources/cantrbry.zip",
+}
+
+# Generated images, i. e. raw RGB dumps of 128x96 pixel.
+IMAGES = {
+    f"{pattern}_128x96_rgb.raw": stimuli.Stimulus(pattern, 128, 96, 3)
+    for pattern in ("gradient", "tiles", "sensor")
+}
+
+
+class CorpusError(Exception):
+    """A corpus file doesn't match its hash or size."""
+
+
+@dataclasses.dataclass(frozen=True)
+class CorpusFile:
+    name: str
+    collection: str  # "calgary", "canterbury", "raw" or "generated"
+    directory: str = CORPUS_DIR
+
+    @property
+    def id_(self) -> str:
+        """Name without dots, usable for VUnit configurations."""
+        return self.name.replace(".", "_")
+
+    def read(self) -> bytes:
+        if self.collection == "generated":
+            return stimuli.to_bytes(IMAGES[self.name])
+        return read_verified(self.name, self.directory)
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_hashes(directory: str = CORPUS_DIR) -> Dict[str, str]:
+    """Parse the hash file of the raw image dumps. The format is the output
+    of sha256sum."""
+    filename = join(directory, HASH_FILE)
+    if not isfile(filename):
+        return {}
+    hashes = {}
+    with open(filename) as infile:
+        for line in infile:
+            if line.strip():
+                hash_, name = line.split(maxsplit=1)
+                hashes[name.strip().lstrip("*")] = hash_
+    return hashes
+
+
+def verify(name: str, data: bytes):
+    """Check a file of the corpora against its pinned size and hash."""
+    expected_size = {**CALGARY, **CANTERBURY}[name]
+    if len(data) != expected_size:
+        raise CorpusError(f"{name}: {len(data)} bytes, expected {expected_size} bytes")
+    if name in SHA256 and sha256(data) != SHA256[name]:
+        raise CorpusError(f"{name}: hash doesn't match the published corpus")
+
+
+def read_verified(name: str, directory: str = CORPUS_DIR) -> bytes:
+    with open(join(directory, name), "rb") as infile:
+        data = infile.read()
+    if name in CALGARY or name in CANTERBURY:
+        verify(name, data)
+    elif sha256(data) != read_hashes(directory).get(name):
+        raise CorpusError(f"{name}: hash doesn't match {HASH_FILE}")
+    return data
+
+
+def collection_of(name: str) -> str:
+    if name in CALGARY:
+        return "calgary"
+    if name in CANTERBURY:
+        return "canterbury"
+    return "raw"
+
+
+def files(directory: str = CORPUS_DIR) -> List[CorpusFile]:
+    """All available files. Raw image dumps are only considered with a
+    recorded hash."""
+    names = [*CALGARY, *CANTERBURY,
+             *(name for name in read_hashes(directory) if name.endswith(".raw"))]
+    available = [
+        CorpusFile(name, collection_of(name), directory)
+        for name in sorted(names) if isfile(join(directory, name))
+    ]
+    return available + [CorpusFile(name, "generated") for name in IMAGES]
+
+
+def record(directory: str = CORPUS_DIR):
+    """Record the hashes of the raw image dumps in the directory."""
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".raw"))
+    with open(join(directory, HASH_FILE), "w") as outfile:
+        for name in names:
+            with open(join(directory, name), "rb") as infile:
+                outfile.write(f"{sha256(infile.read())}  {name}\n")
+    print(f"recorded {len(names)} files in {join(directory, HASH_FILE)}")
+
+
+def fetch(directory: str = CORPUS_DIR):
+    """Download and extract the Calgary and Canterbury corpora. Each file is
+    verified before it's written."""
+    import requests  # only needed for downloading
+
+    os.makedirs(directory, exist_ok=True)
+    for collection, url in URLS.items():
+        response = requests.get(url)
+        response.raise_for_status()
+        names = CALGARY if collection == "calgary" else CANTERBURY
+        with zipfile.ZipFile(BytesIO(response.content)) as archive:
+            for member in archive.namelist():
+                name = os.path.basename(member)
+                if name in names:
+                    data = archive.read(member)
+                    verify(name, data)
+                    with open(join(directory, name), "wb") as outfile:
+                        outfile.write(data)
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    PARSER.add_argument("--directory", default=CORPUS_DIR, help="corpus directory")
+    PARSER.add_argument("--fetch", action="store_true",
+                        help="download and verify the corpora")
+    PARSER.add_argument("--record", action="store_true",
+                        help="record the hashes of the raw image dumps in the corpus directory")
+    ARGS = PARSER.parse_args()
+
+    if ARGS.fetch:
+        fetch(ARGS.directory)
+    elif ARGS.record:
+        record(ARGS.directory)
+    for corpus_file in files(ARGS.directory):
+        data = corpus_file.read()
+        print(f"{corpus_file.collection:10} {corpus_file.name:24} {len(data):8} bytes")
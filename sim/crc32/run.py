@@ -10,29 +10,17 @@ import zlib
 from vunit import VUnit
 
 
-def to_signed(int_: int) -> int:
-    """Convert a signed 32 bit number to an unsigned 32 bit number.
-    Useful for VUnit, since the "integer_array_t" needs signed int.
-    """
-    if int_ > 2**31-1:
-        return (2**32 - int_) * (-1)
-    return int_
-
-
 def generate_data(root, case):
-    filename = join(root, "gen", f"input_{case.name}.csv")
-    input_data_preprocessed = [int.from_bytes(datum, "big")
-                               for datum in case.data_in]
-    input_data_preprocessed = map(to_signed, input_data_preprocessed)
-    input_data_preprocessed = map(str, input_data_preprocessed)
-    with open(filename, "w") as infile:
-        infile.write(", ".join(input_data_preprocessed))
+    # The words are split into bytes, since "integer_array_t" supports only 32 bit.
+    # The files are read by "load_raw()": One byte per input word and
+    # a signed 32 bit little endian word for the checksum.
+    filename = join(root, "gen", f"input_{case.name}.raw")
+    with open(filename, "wb") as infile:
+        infile.write(b"".join(case.data_in))
 
-    output_data = to_signed(zlib.crc32(b"".join(case.data_in)))
-
-    filename = join(root, "gen", f"output_{case.name}.csv")
-    with open(filename, "w") as outfile:
-        outfile.write(str(output_data))
+    filename = join(root, "gen", f"output_{case.name}.raw")
+    with open(filename, "wb") as outfile:
+        outfile.write(zlib.crc32(b"".join(case.data_in)).to_bytes(4, "little"))
     return True
 
 
@@ -62,21 +50,17 @@ def create_test_suite(tb_lib):
         Case("word_64_bit_input_64_bit_datums_1",
              [b"".join([randint(0, 2 ** 64 - 1).to_bytes(8, "big")])]),
     )
+    # all supported input widths
+    testcases += tuple(
+        Case(f"word_{bytes_ * 8}_bit_input_{bytes_ * 8}_bit_datums_{datums}",
+             [randint(0, 2 ** (bytes_ * 8) - 1).to_bytes(bytes_, "big")
+              for _ in range(datums)])
+        for bytes_, datums in ((2, 1), (2, 50), (8, 50)))
 
     for case in testcases:
-        stimuli = []
-        for datum in case.data_in:
-            for byte_ in datum[::-1]:
-                stimuli.append((bin(byte_)[2:].zfill(8))[::-1])
-            stimuli.append(", ")
-
-        stimuli = ("".join(stimuli))[:-2]
-        reference = to_signed(zlib.crc32(b"".join(case.data_in)))
         generics = {
             "id": case.name,
             "C_INPUT_BITWIDTH": len(case.data_in[0]) * 8,
-            "input_data": stimuli,
-            "reference_data": reference,
         }
         tb_crc32.add_config(
             name=case.name, generics=generics,
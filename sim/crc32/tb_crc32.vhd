@@ -17,53 +17,21 @@ entity tb_crc32 is
   generic (
     runner_cfg       : string;
     id               : string;
-    C_INPUT_BITWIDTH : integer;
-    input_data       : string;
-    reference_data   : integer
+    C_INPUT_BITWIDTH : integer
   );
 end entity;
 
 architecture tb of tb_crc32 is
-  type t_slv_array is array(natural range <>) of std_logic_vector(C_INPUT_BITWIDTH-1 downto 0);
-  
-  -- Decode an slv array from a string. Separators are ", ".
-  impure function decode_integer_array(encoded_integer_vector : string) return t_slv_array is
-    variable parts : lines_t := split(encoded_integer_vector, ", ");
-    variable return_value : t_slv_array(0 to parts'LENGTH-1);
-  begin
-    for i in parts'range loop
-      return_value(i) := str_to_slv(parts(i).all);
-    end loop;
-    return return_value;
-  end;
-  
-  -- Decode a slv from a string. Valid characters are only '0' and '1'.
-  function str_to_slv(encoded_slv_string : string) return std_logic_vector is
-    variable slv : std_logic_vector(encoded_slv_string'length-1 downto 0);
-  begin
-    for i in encoded_slv_string'range loop
-      case encoded_slv_string(i) is
-        when '0' =>
-          slv(i-1) := '0';
-        when '1' =>
-          slv(i-1) := '1';
-        when others =>
-          slv(i-1) := 'U';
-      end case;
-    end loop;
-    return slv;
-  end function str_to_slv;
-
   signal sl_clk : std_logic := '0';
   signal sl_valid_in : std_logic := '0';
   signal slv_data_in : std_logic_vector(C_INPUT_BITWIDTH-1 downto 0) := (others => '0');
   signal sl_valid_out : std_logic := '0';
   signal slv_data_out : std_logic_vector(31 downto 0) := (others => '0');
 
-  signal data_check_done, stimuli_done : boolean := false;
+  shared variable data_src : integer_array_t;
+  shared variable data_ref : integer_array_t;
 
-  constant C_INPUT_DATA : t_slv_array := decode_integer_array(input_data);
-  constant C_REFERENCE_DATA : std_logic_vector(31 downto 0) := std_logic_vector(to_signed(reference_data, 32));
+  signal data_check_done, stimuli_done : boolean := false;
 
 begin
   dut : entity png_lib.crc32
@@ -72,6 +40,7 @@ begin
   )
   port map (
     isl_clk     => sl_clk,
+    isl_start   => '0',
     isl_valid   => sl_valid_in,
     islv_data   => slv_data_in,
     oslv_data   => slv_data_out
@@ -83,6 +52,9 @@ begin
   begin
     test_runner_setup(runner, runner_cfg);
     set_stop_level(failure);
+    data_src := load_raw(tb_path(runner_cfg) & "gen/input_" & id & ".raw", 8, false);
+    data_ref := load_raw(tb_path(runner_cfg) & "gen/output_" & id & ".raw");
+    check_relation(length(data_ref) = 1);
 
     wait until (stimuli_done and
                 data_check_done and
@@ -94,13 +66,17 @@ begin
   proc_stimuli: process
   begin
     wait until rising_edge(sl_clk);
-    for i in 0 to C_INPUT_DATA'LENGTH-1 loop
-      wait until rising_edge(sl_clk);
+    -- The input file contains bytes. The first byte of a word is in the most significant bits.
+    -- A word is sent in each cycle.
+    for i in 0 to length(data_src) / (C_INPUT_BITWIDTH / 8) - 1 loop
       sl_valid_in <= '1';
-      slv_data_in <= C_INPUT_DATA(i);
+      for byte in 0 to C_INPUT_BITWIDTH / 8 - 1 loop
+        slv_data_in(C_INPUT_BITWIDTH - 1 - byte * 8 downto C_INPUT_BITWIDTH - 8 - byte * 8) <=
+          std_logic_vector(to_unsigned(get(data_src, i * C_INPUT_BITWIDTH / 8 + byte), 8));
+      end loop;
       wait until rising_edge(sl_clk);
-      sl_valid_in <= '0';
     end loop;
+    sl_valid_in <= '0';
 
     stimuli_done <= true;
     wait;
@@ -112,7 +88,7 @@ begin
     data_check_done <= false;
 
     wait until rising_edge(sl_clk) and stimuli_done;
-    check_equal(slv_data_out, C_REFERENCE_DATA);
+    check_equal(slv_data_out, std_logic_vector(to_signed(get(data_ref, 0), slv_data_out'length)));
 
     wait until rising_edge(sl_clk);
     
@@ -10,36 +10,90 @@
 # compression ratio: 3.401056335694736 (513216 Byte / 150899 Byte)
 
 from functools import partial
-from io import BytesIO
+import json
 import os
 from os.path import join, dirname
-from pathlib import Path
-import zipfile
-
-import requests
+import zlib
 
 from vunit import VUnit
 
+import corpus
+import png_model
+
+
+class MaxDistance:
+    """Sequence, which repeats after exactly 32768 bytes. The zeros in between
+    don't collide with the hashes of the sequence. Thus lzss_hash emits matches
+    of the maximum deflate distance."""
+    name = "max_distance"
+    collection = "generated"
+    id_ = "max_distance"
+
+    @staticmethod
+    def read() -> bytes:
+        sequence = bytes(range(0x41, 0x51))
+        return sequence + bytes(32768 - len(sequence)) + sequence
 
-def get_calgary_corpus(filename):
-    """Download the calgary corpus and extract it if needed."""
-    response = requests.get("http://www.data-compression.info/files/corpora/calgarycorpus.zip")
-    response.raise_for_status()
-    if filename != "complete":
-        filebytes = BytesIO(response.content)
-        with zipfile.ZipFile(filebytes) as myzip:
-            with myzip.open(filename) as infile:
-                return infile.read()
-    return response.content
-
-
-def create_stimuli(root, filename):
-    filepath = Path(f"{root}/gen/{filename}.csv")
-    if not filepath.is_file():
-        data = get_calgary_corpus(filename)
-        # convert bytes to csv of integers and save it
-        with open(filepath.resolve(), "w") as outfile:
-            outfile.write(",".join([str(byte_) for byte_ in data]))
+
+def create_stimuli(root, corpus_file):
+    # The corpus file is read by "load_raw()" as it is.
+    with open(join(root, "gen", f"{corpus_file.id_}.raw"), "wb") as outfile:
+        outfile.write(corpus_file.read())
+    return True
+
+
+def check_and_report(root, corpus_file, id_, generics):
+    """Check that the output inflates to the input and equals the output of
+    the reference model. Compare the output size with the zlib levels 1, 6
+    and 9."""
+    data = corpus_file.read()
+    with open(join(root, "gen", f"output_{id_}.raw"), "rb") as infile:
+        output_bytes = infile.read()
+    with open(join(root, "gen", f"perf_{id_}.json")) as infile:
+        perf = json.load(infile)
+
+    try:
+        inflated = zlib.decompress(output_bytes, wbits=-15)
+    except zlib.error as error:
+        print(f"output can't be inflated: {error}")
+        return False
+    if inflated != data:
+        print("inflated output differs from the input")
+        return False
+    # tb_deflate doesn't set the match length. The default of deflate is 8.
+    output_ref = png_model.deflate(list(data), png_model.Generics(
+        input_buffer_size=generics["C_INPUT_BUFFER_SIZE"],
+        search_buffer_size=generics["C_SEARCH_BUFFER_SIZE"],
+        max_match_length_user=8, window_type=generics["C_WINDOW_TYPE"],
+        btype=generics["C_BTYPE"], block_size=generics["C_BLOCK_SIZE"],
+        stored_fallback=generics["C_STORED_FALLBACK"]))
+    if output_bytes != output_ref:
+        print("output differs from the reference model")
+        return False
+
+    report = {
+        "file": corpus_file.name,
+        "collection": corpus_file.collection,
+        "input_bytes": len(data),
+        "cycles": perf["cycles"],
+        "cycles_per_byte": perf["cycles"] / len(data),
+        "output_bytes": len(output_bytes),
+    }
+    # The huffman output includes the block headers.
+    tokens = perf["literals"] + perf["matches"]
+    if tokens:
+        report["huffman_bits_per_token"] = 8 * perf["huffman_bytes"] / tokens
+    for level in (1, 6, 9):
+        # raw deflate stream, like the output of the testbench
+        compressor = zlib.compressobj(level, wbits=-15)
+        report[f"zlib_{level}_bytes"] = len(
+            compressor.compress(data) + compressor.flush())
+    with open(join(root, "gen", f"report_{id_}.json"), "w") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    print(f"{corpus_file.name}: {report['cycles_per_byte']:.2f} cycles per byte, "
+          f"{report['output_bytes']} bytes (zlib -1: {report['zlib_1_bytes']}, "
+          f"-6: {report['zlib_6_bytes']}, -9: {report['zlib_9_bytes']})")
     return True
 
 
@@ -49,13 +103,46 @@ def create_test_suite(tb_lib):
 
     tb_deflate = tb_lib.entity("tb_deflate")
 
-    filename = "obj1"
     generics = {
-        "filename": filename,
         "C_INPUT_BUFFER_SIZE": 12,
         "C_SEARCH_BUFFER_SIZE": 12,
         "C_BTYPE": 1,
+        "C_WINDOW_TYPE": 0,
+        "C_BLOCK_SIZE": 1024,
+        "C_STORED_FALLBACK": 0,
+        "C_STALL_PERCENT": 0,
     }
-    tb_deflate.add_config(
-        name="tb_deflate", generics=generics,
-        pre_config=partial(create_stimuli, root, filename))
+    variants = {
+        "fixed": generics,
+        "dynamic": dict(generics, C_BTYPE=2),
+        "stored": dict(generics, C_BTYPE=0),
+        "fallback": dict(generics, C_STORED_FALLBACK=1),
+    }
+    # The output of all variants has to stop one cycle after it got stalled.
+    variants.update({f"{name}_stall": dict(variant_generics, C_STALL_PERCENT=50)
+                     for name, variant_generics in list(variants.items())})
+    # Full deflate window, stored in BRAM and searched by a hash table.
+    generics_hash = dict(generics, C_SEARCH_BUFFER_SIZE=32768, C_WINDOW_TYPE=1)
+
+    # All variants are tested with a generated image. Each file of the corpus
+    # is compressed with the full window, as well as a match of the maximum
+    # distance.
+    configs = [(name, variant_generics, corpus.CorpusFile(
+                    "sensor_128x96_rgb.raw", "generated"))
+               for name, variant_generics in variants.items()]
+    configs.extend(("hash", generics_hash, corpus_file)
+                   for corpus_file in corpus.files())
+    configs.append(("hash", generics_hash, MaxDistance()))
+
+    for name, config_generics, corpus_file in configs:
+        id_ = f"{name}_{corpus_file.id_}"
+        tb_deflate.add_config(
+            name=id_,
+            generics=dict(config_generics, id=id_, filename=corpus_file.id_),
+            pre_config=partial(create_stimuli, root, corpus_file),
+            post_check=partial(check_and_report, root, corpus_file, id_,
+                               config_generics),
+            # The files of the corpora run only in the full tier.
+            # See also "run_all.py".
+            attributes=({".full": None} if corpus_file.collection != "generated"
+                        else None))
@@ -1,11 +1,16 @@
+-- only use the textio namespace to avoid naming conflicts with vunit, i. e. for "width"
+use std.textio;
+
 library ieee;
 use ieee.std_logic_1164.all;
 use ieee.numeric_std.all;
+use ieee.math_real.all;
 
 library png_lib;
 
 library util;
 use util.math_pkg.all;
+use util.png_pkg.all;
 
 library sim;
 use sim.vunit_common_pkg.all;
@@ -16,10 +21,16 @@ context vunit_lib.vunit_context;
 entity tb_deflate is
   generic (
     runner_cfg           : string;
+    id                   : string;
     filename             : string;
     C_INPUT_BUFFER_SIZE  : integer;
     C_SEARCH_BUFFER_SIZE : integer;
-    C_BTYPE              : integer
+    C_BTYPE              : integer;
+    C_BLOCK_SIZE         : integer;
+    C_STORED_FALLBACK    : integer;
+    C_WINDOW_TYPE        : integer;
+    -- Probability of an output stall in percent.
+    C_STALL_PERCENT      : integer
   );
 end entity;
 
@@ -32,8 +43,11 @@ architecture tb of tb_deflate is
   signal slv_data_out : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_finish_out : std_logic := '0';
   signal sl_rdy : std_logic := '0';
+  signal sl_get : std_logic := '1';
+  signal rec_stats : t_deflate_stats;
 
   shared variable data_src : integer_array_t;
+  shared variable data_out : integer_array_t;
 
   signal data_check_done, stimuli_done : boolean := false;
 
@@ -44,16 +58,22 @@ begin
   generic map (
     C_INPUT_BUFFER_SIZE  => C_INPUT_BUFFER_SIZE,
     C_SEARCH_BUFFER_SIZE => C_SEARCH_BUFFER_SIZE,
-    C_BTYPE              => C_BTYPE
+    C_BTYPE              => C_BTYPE,
+    C_BLOCK_SIZE         => C_BLOCK_SIZE,
+    C_STORED_FALLBACK    => C_STORED_FALLBACK,
+    C_WINDOW_TYPE        => C_WINDOW_TYPE
   )
   port map (
     isl_clk     => sl_clk,
     isl_flush   => sl_flush,
+    isl_get     => sl_get,
     isl_valid   => sl_valid_in,
     islv_data   => slv_data_in,
     oslv_data   => slv_data_out,
     osl_valid   => sl_valid_out,
-    osl_finish  => sl_finish_out
+    osl_rdy     => sl_rdy,
+    osl_finish  => sl_finish_out,
+    orec_stats  => rec_stats
   );
   
   clk_gen(sl_clk, 10 ns);
@@ -62,7 +82,7 @@ begin
   begin
     test_runner_setup(runner, runner_cfg);
     set_stop_level(failure);
-    data_src := load_csv(tb_path(runner_cfg) & "gen/" & filename & ".csv");
+    data_src := load_raw(tb_path(runner_cfg) & "gen/" & filename & ".raw", 8, false);
 
     wait until (stimuli_done and
                 data_check_done and
@@ -74,10 +94,12 @@ begin
   proc_stimuli : process
   begin
     wait until rising_edge(sl_clk);
-    for i in 0 to width(data_src) - 1 loop
-      report "### input: " & integer'image(i);
+    for i in 0 to length(data_src) - 1 loop
+      while sl_rdy = '0' loop
+        wait until rising_edge(sl_clk);
+      end loop;
       sl_valid_in <= '1';
-      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i, 0), slv_data_in'length));
+      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i), slv_data_in'length));
       wait until rising_edge(sl_clk);
       sl_valid_in <= '0';
       wait until rising_edge(sl_clk);
@@ -95,20 +117,73 @@ begin
   end process;
 
   proc_output_data : process
+    file file_perf : textio.text open write_mode is tb_path(runner_cfg) & "gen/perf_" & id & ".json";
+    variable row : textio.line;
+    variable v_int_cycles, v_int_input_stall : integer := 0;
+    variable v_int_lzss_busy, v_int_lzss_stall, v_int_huffman_busy, v_int_huffman_stall : integer := 0;
+    variable v_int_huffman_bytes : integer := 0;
+    variable v_int_literals, v_int_matches : integer := 0;
+    variable v_int_match_length_sum, v_int_match_offset_sum : integer := 0;
+    variable seed1, seed2 : positive := 2;
+    variable v_rand : real;
+    variable v_sl_get_prev : std_logic := '1';
   begin
     wait until rising_edge(sl_clk);
     data_check_done <= false;
+    data_out := new_1d(bit_width => 8, is_signed => false);
 
     while sl_finish_out = '0' loop
+      -- Random backpressure at the output.
+      uniform(seed1, seed2, v_rand);
+      if v_rand * 100.0 < real(C_STALL_PERCENT) then
+        sl_get <= '0';
+      else
+        sl_get <= '1';
+      end if;
       wait until rising_edge(sl_clk);
+
+      -- No output is allowed one cycle after the output was stalled.
+      check(sl_valid_out = '0' or v_sl_get_prev = '1', "output while stalled");
+      v_sl_get_prev := sl_get;
       if sl_valid_out = '1' then
         int_output_count <= int_output_count + 1;
+        append(data_out, to_integer(unsigned(slv_data_out)));
       end if;
+
+      -- performance statistics
+      v_int_cycles := v_int_cycles + 1;
+      if sl_rdy = '0' then
+        v_int_input_stall := v_int_input_stall + 1;
+      end if;
+      v_int_literals := v_int_literals + rec_stats.int_literals;
+      v_int_matches := v_int_matches + rec_stats.int_matches;
+      v_int_match_length_sum := v_int_match_length_sum + rec_stats.int_match_length;
+      v_int_match_offset_sum := v_int_match_offset_sum + rec_stats.int_match_offset;
+      v_int_lzss_busy := v_int_lzss_busy + rec_stats.int_lzss_busy;
+      v_int_lzss_stall := v_int_lzss_stall + rec_stats.int_lzss_stall;
+      v_int_huffman_busy := v_int_huffman_busy + rec_stats.int_huffman_busy;
+      v_int_huffman_stall := v_int_huffman_stall + rec_stats.int_huffman_stall;
+      v_int_huffman_bytes := v_int_huffman_bytes + rec_stats.int_huffman_bytes;
     end loop;
+
+    textio.write(row, "{""cycles"": " & integer'image(v_int_cycles) &
+                      ", ""input_stall"": " & integer'image(v_int_input_stall) &
+                      ", ""literals"": " & integer'image(v_int_literals) &
+                      ", ""matches"": " & integer'image(v_int_matches) &
+                      ", ""match_length_sum"": " & integer'image(v_int_match_length_sum) &
+                      ", ""match_offset_sum"": " & integer'image(v_int_match_offset_sum) &
+                      ", ""lzss_busy"": " & integer'image(v_int_lzss_busy) &
+                      ", ""lzss_stall"": " & integer'image(v_int_lzss_stall) &
+                      ", ""huffman_busy"": " & integer'image(v_int_huffman_busy) &
+                      ", ""huffman_stall"": " & integer'image(v_int_huffman_stall) &
+                      ", ""huffman_bytes"": " & integer'image(v_int_huffman_bytes) &
+                      ", ""output_bytes"": " & integer'image(int_output_count) & "}");
+    textio.writeline(file_perf, row);
+    save_raw(data_out, tb_path(runner_cfg) & "gen/output_" & id & ".raw");
     
-    report "input bytes: " & integer'image(width(data_src));
+    report "input bytes: " & integer'image(length(data_src));
     report "output bytes: " & integer'image(int_output_count);
-    report "compression ratio: " & real'image(real(width(data_src)) / real(int_output_count));
+    report "compression ratio: " & real'image(real(length(data_src)) / real(int_output_count));
     
     report ("Done checking");
     data_check_done <= true;
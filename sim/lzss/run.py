@@ -2,40 +2,30 @@
 
 from dataclasses import dataclass
 from functools import partial
-from math import ceil, log2
 import os
 from os.path import join, dirname
+from random import Random
 from typing import List, Union
 
 from vunit import VUnit
 
+from png_model import Literal, Match, lzss, lzss_bitwidths, token_to_int
 
-def create_stimuli(root, case):
-    filename = join(root, "gen", f"input_{case.name}.csv")
-    with open(filename, "w") as infile:
-        infile.write(", ".join(map(str, case.data_in)))
 
-    filename = join(root, "gen", f"output_{case.name}.csv")
-    with open(filename, "w") as outfile:
-        outfile.write(", ".join(map(str, case.data_out_int)))
+def create_stimuli(root, case):
+    # The files are read by "load_raw()": One byte per input datum and
+    # a 32 bit little endian word per output token.
+    filename = join(root, "gen", f"input_{case.name}.raw")
+    with open(filename, "wb") as infile:
+        infile.write(bytes(case.data_in))
+
+    filename = join(root, "gen", f"output_{case.name}.raw")
+    with open(filename, "wb") as outfile:
+        outfile.write(b"".join(token.to_bytes(4, "little")
+                               for token in case.data_out_int))
     return True
 
 
-def lb(size):
-    return ceil(log2(size))
-
-
-@dataclass
-class Match:
-    offset: int
-    length: int
-
-
-@dataclass
-class Literal:
-    value: int
-
-
 @dataclass
 class Case:
     name: str
@@ -44,33 +34,18 @@ class Case:
     max_match_length: int
     data_in: List[int]
     data_out: List[Union[Literal, Match]]
+    # 0: first match, 1: longest match, 2: longest match with lazy matching
+    match_mode: int = 0
+    # Long simulations run only in the full tier. See also "run_all.py".
+    full_tier: bool = False
 
     @property
     def data_out_int(self) -> List[int]:
-        match_offset = lb(self.search_buffer_size)
-        match_length = lb(
-            min(self.input_buffer_size, self.max_match_length) + 1)
         # Assure a bitwidth of at least 8 bit. See also "lzss.vhd".
-        if match_offset + match_length < 8:
-            match_offset = 8 - match_length
-        buffer_size = match_offset + match_length
-
-        data_out_int = []
-        for datum in self.data_out:
-            if isinstance(datum, Literal):
-                # non match structure:
-                # MSB: 0 (non match), literal data, rest is ignored
-                value_int = datum.value << (buffer_size - 8)
-            else:
-                # match structure:
-                # MSB: 1 (match), match offset, match length
-                value_int = (
-                    (1 << buffer_size) +
-                    (datum.offset << match_length) +
-                    datum.length
-                )
-            data_out_int.append(value_int)
-        return data_out_int
+        bitwidths = lzss_bitwidths(self.input_buffer_size,
+                                   self.search_buffer_size,
+                                   self.max_match_length)
+        return [token_to_int(datum, *bitwidths) for datum in self.data_out]
 
 
 def create_test_suite(tb_lib):
@@ -88,6 +63,19 @@ def create_test_suite(tb_lib):
     encode_dict = {"I": 0, "n": 1, " ": 2, "U": 3, "l": 4, "m": 5, ",": 6,
                    "u": 7, "d": 8, "h": 9, "e": 10, "r": 11, ".": 12}
     complex_list = [encode_dict[letter] for letter in complex_sentence]
+    complex_out = [
+        Literal(0), Literal(1), Literal(2), Literal(3), Literal(4),
+        Literal(5), Literal(6), Literal(2), Literal(7), Literal(5),
+        Match(8, 7), Literal(encode_dict["n"]),
+        Literal(encode_dict["d"]),
+        Match(12, 7), Literal(encode_dict[" "]),
+        Literal(encode_dict["h"]),
+        Literal(encode_dict["e"]),
+        Literal(encode_dict["r"]),
+        Literal(encode_dict["u"]),
+        Literal(encode_dict["m"]),
+        Literal(encode_dict["."]),
+    ]
 
     testcases = [
         Case("no_compression", 10, 12, max_match_length,
@@ -99,29 +87,67 @@ def create_test_suite(tb_lib):
         Case("max_match_offset", 4, 8, 4, [0, 1, 2, 3] * 3,
              [Literal(0), Literal(1), Literal(2), Literal(3),
               Match(4, 4), Match(8, 4)]),
+        # The offset field has to hold an offset of the full search buffer.
+        Case("max_match_offset_power_of_two", 16, 16, 16, list(range(16)) * 2,
+             [Literal(i) for i in range(16)] + [Match(16, 16)]),
         Case("repeat", 11, 10, max_match_length,
              [0, 1, 2, 0, 1, 2, 0, 1, 2, 0],
              [Literal(0), Literal(1), Literal(2), Match(3, 7)]),
         # Smoke test: Data doesn't matter. Just check if it compiles.
         Case("max_buffers", 258, 32768, max_match_length,
-             [0], [Literal(0)]),
-        Case("complex", 10, 12, max_match_length, complex_list,
-             [Literal(0), Literal(1), Literal(2), Literal(3), Literal(4),
-              Literal(5), Literal(6), Literal(2), Literal(7), Literal(5),
-              Match(8, 7), Literal(encode_dict["n"]),
-              Literal(encode_dict["d"]),
-              Match(12, 7), Literal(encode_dict[" "]),
-              Literal(encode_dict["h"]),
-              Literal(encode_dict["e"]),
-              Literal(encode_dict["r"]),
-              Literal(encode_dict["u"]),
-              Literal(encode_dict["m"]),
-              Literal(encode_dict["."]),
-             ]),
+             [0], [Literal(0)], full_tier=True),
+        Case("complex", 10, 12, max_match_length, complex_list, complex_out),
         Case("match_at_max_size", 3, 3, 4, [0, 1, 2, 0, 1, 2],
              [Literal(0), Literal(1), Literal(2), Match(3, 3)]),
     ]
 
+    # The first match (largest offset) is not the longest match.
+    first_not_best = [0, 1, 2, 5, 0, 1, 2, 3, 4, 0, 1, 2, 3, 4]
+    testcases.extend([
+        Case("first_not_best_first_match", 8, 12, 8, first_not_best,
+             [Literal(0), Literal(1), Literal(2), Literal(5), Match(4, 3),
+              Literal(3), Literal(4), Match(9, 3), Literal(3), Literal(4)],
+             match_mode=0),
+        Case("first_not_best_longest_match", 8, 12, 8, first_not_best,
+             [Literal(0), Literal(1), Literal(2), Literal(5), Match(4, 3),
+              Literal(3), Literal(4), Match(5, 5)],
+             match_mode=1),
+    ])
+
+    # The match at the next datum is longer than the current match.
+    lazy = [1, 2, 3, 9, 2, 3, 4, 5, 6, 7, 1, 2, 3, 4, 5, 6]
+    testcases.extend([
+        Case("lazy_longest_match", 8, 16, 8, lazy,
+             [Literal(i) for i in lazy[:10]] + [Match(10, 3), Match(7, 3)],
+             match_mode=1),
+        Case("lazy_lazy_match", 8, 16, 8, lazy,
+             [Literal(i) for i in lazy[:11]] + [Match(7, 5)],
+             match_mode=2),
+        Case("complex_lazy_match", 10, 12, max_match_length, complex_list,
+             complex_out, match_mode=2),
+    ])
+
+    # The hand written outputs have to match the reference model.
+    for case in testcases:
+        assert case.data_out == lzss(
+            case.data_in, case.input_buffer_size, case.search_buffer_size,
+            case.max_match_length, case.match_mode), case.name
+
+    # Random data with few symbols gives many overlapping matches.
+    # The expected output is obtained by the reference model.
+    # Each case has its own seed. Thus the data doesn't depend on the other
+    # cases or on the global random state.
+    for seed, (input_buffer_size, search_buffer_size, match_mode) in enumerate((
+            (4, 3, 0), (12, 12, 0), (12, 12, 1), (12, 12, 2), (20, 40, 2))):
+        rng = Random(seed)
+        data_in = [rng.randint(0, 3) for _ in range(200)]
+        testcases.append(Case(
+            f"random_{input_buffer_size}_{search_buffer_size}_{match_mode}",
+            input_buffer_size, search_buffer_size, max_match_length, data_in,
+            lzss(data_in, input_buffer_size, search_buffer_size,
+                 max_match_length, match_mode),
+            match_mode=match_mode))
+
     for case in testcases:
         generics = {
             "id": case.name,
@@ -129,7 +155,9 @@ def create_test_suite(tb_lib):
             "C_SEARCH_BUFFER_SIZE": case.search_buffer_size,
             "C_MIN_MATCH_LENGTH": 3,
             "C_MAX_MATCH_LENGTH_USER": case.max_match_length,
+            "C_MATCH_MODE": case.match_mode,
         }
         tb_lzss.add_config(
             name=case.name, generics=generics,
-            pre_config=partial(create_stimuli, root, case))
+            pre_config=partial(create_stimuli, root, case),
+            attributes={".full": None} if case.full_tier else None)
@@ -21,7 +21,8 @@ entity tb_lzss is
     C_INPUT_BUFFER_SIZE  : integer;
     C_SEARCH_BUFFER_SIZE : integer;
     C_MIN_MATCH_LENGTH   : integer;
-    C_MAX_MATCH_LENGTH_USER : integer
+    C_MAX_MATCH_LENGTH_USER : integer;
+    C_MATCH_MODE         : integer
   );
 end entity;
 
@@ -33,6 +34,7 @@ architecture tb of tb_lzss is
   signal slv_data_in : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_valid_out : std_logic := '0';
   signal slv_data_out : std_logic_vector(calc_huffman_bitwidth(1, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER) - 1 downto 0);
+  signal sl_finish_out : std_logic := '0';
   signal sl_rdy : std_logic := '0';
 
   shared variable data_src : integer_array_t;
@@ -40,21 +42,26 @@ architecture tb of tb_lzss is
 
   signal data_check_done, stimuli_done : boolean := false;
 
+  signal int_cycle_count : integer := 0;
+
 begin
   dut : entity png_lib.lzss
   generic map (
     C_INPUT_BUFFER_SIZE    => C_INPUT_BUFFER_SIZE,
     C_SEARCH_BUFFER_SIZE   => C_SEARCH_BUFFER_SIZE,
     C_MIN_MATCH_LENGTH     => C_MIN_MATCH_LENGTH,
-    C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER
+    C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+    C_MATCH_MODE           => C_MATCH_MODE
   )
   port map (
     isl_clk     => sl_clk,
     isl_flush   => sl_flush,
+    isl_get     => sl_get,
     isl_valid   => sl_valid_in,
     islv_data   => slv_data_in,
     oslv_data   => slv_data_out,
-    osl_valid   => sl_valid_out
+    osl_valid   => sl_valid_out,
+    osl_finish  => sl_finish_out
   );
   
   clk_gen(sl_clk, 10 ns);
@@ -63,11 +70,9 @@ begin
   begin
     test_runner_setup(runner, runner_cfg);
     set_stop_level(failure);
-    data_src := load_csv(tb_path(runner_cfg) & "gen/input_" & id & ".csv");
-    data_ref := load_csv(tb_path(runner_cfg) & "gen/output_" & id & ".csv");
-    check_relation(width(data_ref) /= 0);
-    check_relation(height(data_ref) /= 0);
-    check_relation(depth(data_ref) /= 0);
+    data_src := load_raw(tb_path(runner_cfg) & "gen/input_" & id & ".raw", 8, false);
+    data_ref := load_raw(tb_path(runner_cfg) & "gen/output_" & id & ".raw");
+    check_relation(length(data_ref) /= 0);
 
     wait until (stimuli_done and
                 data_check_done and
@@ -79,12 +84,10 @@ begin
   proc_stimuli: process
   begin
     wait until rising_edge(sl_clk);
-    for i in 0 to width(data_src)-1 loop
+    for i in 0 to length(data_src)-1 loop
       report "### input: " & integer'image(i);
       sl_valid_in <= '1';
-      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i, 0), slv_data_in'length));
-      wait until rising_edge(sl_clk);
-      sl_valid_in <= '0';
+      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i), slv_data_in'length));
       wait until rising_edge(sl_clk);
     end loop;
     sl_valid_in <= '0';
@@ -104,14 +107,29 @@ begin
     wait until rising_edge(sl_clk);
     data_check_done <= false;
 
-    for i in 0 to width(data_ref) - 1 loop
+    for i in 0 to length(data_ref) - 1 loop
       wait until rising_edge(sl_clk) and sl_valid_out = '1';
-      report integer'image(get(data_ref, i, 0));
-      check_equal(slv_data_out, std_logic_vector(to_unsigned(get(data_ref, i, 0), slv_data_out'length)));
+      report integer'image(get(data_ref, i));
+      check_equal(slv_data_out, std_logic_vector(to_unsigned(get(data_ref, i), slv_data_out'length)));
     end loop;
 
     report ("Done checking");
     data_check_done <= true;
     wait;
   end process;
+
+  proc_cycle_count : process
+  begin
+    -- Count the cycles from the first input until the end of processing.
+    wait until rising_edge(sl_clk) and sl_valid_in = '1';
+    while sl_finish_out = '0' loop
+      int_cycle_count <= int_cycle_count + 1;
+      wait until rising_edge(sl_clk);
+    end loop;
+
+    report "input bytes: " & integer'image(length(data_src));
+    report "cycles: " & integer'image(int_cycle_count);
+    report "cycles per input byte: " & real'image(real(int_cycle_count) / real(length(data_src)));
+    wait;
+  end process;
 end;
\ No newline at end of file
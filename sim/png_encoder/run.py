@@ -1,62 +1,232 @@
 """Test cases for the png_encoder module."""
 
 import dataclasses
-from functools import partial
+from functools import cached_property, partial
 import io
 import itertools
 import os
 from os.path import join, dirname
-from random import randint
-from typing import List
+from typing import List, Optional
 import zlib
 
+import numpy as np
 from PIL import Image
 
+import png_model
+import stimuli
 
-def create_stimuli(root: str, case):
-    # write out csv only for debugging purposes
-    filename = join(root, "gen", f"input_{case.id_}.csv")
-    with open(filename, "w") as infile:
-        infile.write(", ".join(map(str, case.data_in)))
 
+def create_stimuli(root: str, case):
     filename = join(root, "gen", f"input_{case.id_}.raw")
     with open(filename, "wb") as infile:
-        infile.write(bytes(case.data_in))  # only works for 8 bit values!
+        infile.write(stimuli.to_bytes(case.stimulus))
+
+    if case.color_type == 3:
+        filename = join(root, "gen", f"palette_{case.id_}.raw")
+        with open(filename, "wb") as infile:
+            infile.write(case.palette)
     return True
 
 
-def apply_filter(data: bytes) -> List[int]:
-    """Reconstruct original data from filter type and filtered data."""
+def paeth_predictor(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+def apply_filter(data: bytes, prior: List[int], bpp: int) -> List[int]:
+    """Reconstruct original data from filter type and filtered data.
+
+    prior is the reconstructed previous scanline (all zeros for the first
+    scanline) and bpp the amount of bytes per pixel.
+    """
     filter_type = data[0]
-    if filter_type == 0:
-        # no filter
-        return list(data[1:])
-    elif filter_type == 1:
-        original_data = []
-        last_value = 0
-        for datum in data[1:]:
-            reconstructed_value = (datum + last_value) % 256
-            original_data.append(reconstructed_value)
-            last_value = reconstructed_value
-        return original_data
-    else:
+    if filter_type not in range(5):
         raise ValueError(f"Filter type {data[0]} not implemented.")
 
+    original_data: List[int] = []
+    for index, datum in enumerate(data[1:]):
+        left = original_data[index - bpp] if index >= bpp else 0
+        above = prior[index]
+        upper_left = prior[index - bpp] if index >= bpp else 0
+        if filter_type == 0:
+            predictor = 0
+        elif filter_type == 1:
+            predictor = left
+        elif filter_type == 2:
+            predictor = above
+        elif filter_type == 3:
+            predictor = (left + above) // 2
+        else:
+            predictor = paeth_predictor(left, above, upper_left)
+        original_data.append((datum + predictor) % 256)
+    return original_data
+
+
+def unfilter_scanlines(filtered: np.ndarray, filter_types: np.ndarray,
+                       bpp: int) -> np.ndarray:
+    """Reconstruct the original data of all scanlines.
+
+    The filter types "none", "sub" and "up" are undone row by row by numpy.
+    "average" and "paeth" depend on the previous byte and fall back to
+    apply_filter().
+    """
+    height, row_bytes = filtered.shape
+    # The first row is the prior of the first scanline.
+    data = np.zeros((height + 1, row_bytes), dtype=np.uint8)
+    for row, filter_type in enumerate(filter_types):
+        line, prior = filtered[row], data[row]
+        if filter_type == 0:
+            data[row + 1] = line
+        elif filter_type == 1:
+            data[row + 1] = np.cumsum(line.reshape(-1, bpp), axis=0,
+                                      dtype=np.uint8).reshape(-1)
+        elif filter_type == 2:
+            data[row + 1] = line + prior
+        else:
+            data[row + 1] = apply_filter(
+                bytes([filter_type]) + line.tobytes(), prior.tolist(), bpp)
+    return data[1:]
+
+
+def compare_arrays(name: str, data: np.ndarray, data_ref: np.ndarray,
+                   filter_types: Optional[np.ndarray] = None) -> bool:
+    """Compare arrays of the shape (rows, columns, channels).
+
+    Only the first mismatch and the amount of mismatches are reported, since
+    the whole arrays are too large for the log.
+    """
+    if data.shape != data_ref.shape:
+        print(f"{name}: shape {data.shape} differs from {data_ref.shape}")
+        return False
+    mismatches = np.argwhere(data != data_ref)
+    if len(mismatches) == 0:
+        return True
+
+    row, column, channel = mismatches[0]
+    print(f"{name}: {len(mismatches)} of {data.size} values differ, "
+          f"the first at row {row}, column {column}, channel {channel}: "
+          f"{data[row, column, channel]} instead of "
+          f"{data_ref[row, column, channel]}")
+    if filter_types is not None:
+        print(f"filter type of row {row}: {filter_types[row]}")
+        print("filter types per row:", "".join(map(str, filter_types)))
+    return False
+
+
+def check_scanlines(png_bytes: bytes, case) -> bool:
+    """Verify the IDAT data by zlib, independently of the reference model.
+
+    A stream that can't be decompressed points to a bug in deflate. Wrong data
+    after undoing the row filter points to a bug in the row filter.
+    """
+    idat_data = bytearray()
+    index = 8
+    while index < len(png_bytes):
+        length = int.from_bytes(png_bytes[index:index + 4], "big")
+        if png_bytes[index + 4:index + 8] == b"IDAT":
+            idat_data += png_bytes[index + 8:index + 8 + length]
+        index += 12 + length
+
+    try:
+        decoded_data = zlib.decompress(idat_data)
+    except zlib.error as error:
+        print(f"IDAT data can't be decompressed: {error}")
+        return False
+
+    generics = case.generics
+    height, row_bytes = case.height, generics.row_bytes
+    if len(decoded_data) != height * (row_bytes + 1):
+        print(f"decompressed IDAT data has {len(decoded_data)} bytes, "
+              f"expected {height * (row_bytes + 1)} bytes")
+        return False
+    scanlines = np.frombuffer(decoded_data, dtype=np.uint8).reshape(
+        height, row_bytes + 1)
+    filter_types = scanlines[:, 0]
+    if filter_types.max() > 4:
+        row = int(np.argmax(filter_types > 4))
+        print(f"invalid filter type {filter_types[row]} at row {row}")
+        return False
+
+    # Samples of less than eight bit are compared as packed bytes.
+    bpp = generics.bytes_per_pixel
+    data = unfilter_scanlines(scanlines[:, 1:], filter_types, bpp)
+    data_ref = np.array(png_model.pack_samples(case.data_in, generics),
+                        dtype=np.uint8)
+    return compare_arrays("unfiltered IDAT data",
+                          data.reshape(height, -1, bpp),
+                          data_ref.reshape(height, -1, bpp), filter_types)
+
+
+def check_chunks(png_bytes: bytes, max_idat_length: int) -> bool:
+    """Check the CRC of all chunks and the length of the IDAT chunks."""
+    index = 8  # skip the signature
+    while index < len(png_bytes):
+        length = int.from_bytes(png_bytes[index:index + 4], "big")
+        chunk_type = png_bytes[index + 4:index + 8]
+        chunk_data = png_bytes[index + 8:index + 8 + length]
+        crc = int.from_bytes(
+            png_bytes[index + 8 + length:index + 12 + length], "big")
+        if zlib.crc32(chunk_type + chunk_data) != crc:
+            print(f"invalid CRC of chunk {chunk_type} at byte {index}")
+            return False
+        if chunk_type == b"IDAT" and length > max_idat_length:
+            print(f"IDAT chunk at byte {index} is too long: {length}")
+            return False
+        index += 12 + length
+    return True
+
 
 # TODO: use getfullargspec() API to allow type annotations
 def assemble_and_check_png(root, case):
-    with open(join(root, "gen", f"png_{case.id_}.txt"), "r") as infile:
-        binary_strings = infile.readlines()
-
-    png_bytes = bytearray()
-    for byte_str in binary_strings:
-        assert len(byte_str) == 9, len(byte_str)  # 8 bit + newline
-        png_bytes.append(int(byte_str, 2))
-
-    # switch header and data. header is sent later, because the chunk
-    # length has to be specified there.
-    # strip the last three bytes of the header. they are only padded.
-    png_bytes = png_bytes[-44:-3] + png_bytes[:-44]
+    # The testbench writes the output bytes by "save_raw()".
+    with open(join(root, "gen", f"png_{case.id_}.raw"), "rb") as infile:
+        output_bytes = infile.read()
+
+    # All frames are encoded from the same image. Thus they have to be equal.
+    png_bytes_ref = png_model.png_encoder(case.data_in, case.generics,
+                                          case.palette)
+    frame_length = len(png_bytes_ref) + (3 if case.idat_chunk_size == 0 else 0)
+    if len(output_bytes) != case.frames * frame_length:
+        print(f"output has {len(output_bytes)} bytes, expected {case.frames} "
+              f"frames of {frame_length} bytes")
+        return False
+    frames = [output_bytes[index:index + frame_length]
+              for index in range(0, len(output_bytes), frame_length)]
+    if any(frame != frames[0] for frame in frames[1:]):
+        print("frames differ")
+        return False
+    png_bytes = frames[0]
+
+    if case.idat_chunk_size == 0:
+        # switch header and data. header is sent later, because the chunk
+        # length has to be specified there.
+        # strip the last three bytes of the header. they are only padded.
+        header_length = 44
+        if case.color_type == 3:
+            header_length += 12 + len(case.palette)
+        png_bytes = (png_bytes[-header_length:-3] +
+                     png_bytes[:-header_length])
+    elif not check_chunks(png_bytes, case.idat_chunk_size):
+        return False
+
+    # Decode the IDAT data first. It locates the bug, if the output differs
+    # from the reference model.
+    if not check_scanlines(png_bytes, case):
+        return False
+
+    # compare byte by byte with the reference model
+    if png_bytes != png_bytes_ref:
+        mismatch = next(
+            (index for index, (datum, datum_ref) in
+             enumerate(zip(png_bytes, png_bytes_ref)) if datum != datum_ref),
+            min(len(png_bytes), len(png_bytes_ref)))
+        print(f"output differs from the reference model at byte {mismatch}")
+        return False
     with open(join(root, "gen", f"test_img_{case.id_}.png"), "wb") as outfile:
         outfile.write(png_bytes)
 
@@ -69,44 +239,16 @@ def assemble_and_check_png(root, case):
         # https://pillow.readthedocs.io/en/latest/reference/Image.html#PIL.Image.Image.size
         assert png_img.size == (case.width, case.height)
 
-        # flatten the value list if needed:
         # https://pillow.readthedocs.io/en/latest/handbook/concepts.html#modes
-        if png_img.mode == "L":
-            png_img_data = list(png_img.getdata())
+        # Bilevel images would be converted to booleans by numpy.
+        if png_img.mode == "1":
+            png_img_data = np.asarray(png_img.convert("L"))
         else:
-            png_img_data = list(itertools.chain(*png_img.getdata()))
-        print("input data:", case.data_in)
-        print("reconstructed data:", png_img_data)
-        return case.data_in == png_img_data
-
-    # This is the old verification code. Only useful for debugging.
-    # There is a bug at the row filter.
-    # verify the IDAT data with zlib
-    idat_index = png_bytes.index(b"IDAT")
-    idat_length = int.from_bytes(png_bytes[idat_index - 4:idat_index], "big")
-    idat_data = png_bytes[idat_index + 4:idat_index + 4 + idat_length]
-
-    print("debug info:")
-    print([hex(d) for d in idat_data])
-    print(["".join(reversed(bin(d)[2:].zfill(8))) for d in idat_data])
-    print("infgen command:\n",
-          "echo -n -e",
-          "".join(["\\\\x" + hex(d)[2:].zfill(2) for d in idat_data]),
-          "| ./infgen")
-
-    decoded_data = zlib.decompress(idat_data)
-    # apply filter types to compare with original data
-    line_size = case.width * case.depth
-    scanlines = [decoded_data[x:x + line_size + 1]
-                 for x in range(0, len(decoded_data), line_size + 1)]
-    reconstructed_data = []
-    for line in scanlines:
-        reconstructed_data.extend(apply_filter(line))
-
-    input_data = bytearray(case.data_in)
-    print("input data:", input_data, list(input_data))
-    print("reconstructed data:", reconstructed_data)
-    return list(input_data) == reconstructed_data
+            png_img_data = np.asarray(png_img)
+    png_img_data = png_img_data.reshape(case.height, case.width, -1)
+    return compare_arrays("decoded image", png_img_data,
+                          np.array(case.pillow_data).reshape(
+                              case.height, case.width, -1))
 
 
 @dataclasses.dataclass
@@ -117,24 +259,81 @@ class Testcase:
     color_type: int
     block_type: int
     row_filter: int
+    block_size: int = 1024
+    stored_fallback: int = 0
+    idat_chunk_size: int = 0
+    lanes: int = 1
+    input_bytes: int = 1
+    frames: int = 1
+    frame_buffer_size: int = 0
+    bit_depth: int = 8
+    palette_size: int = 256
+    entropy: float = 8.0  # only "noise"
+    # Long simulations run only in the full tier. See also "run_all.py".
+    full_tier: bool = False
 
-    def __post_init__(self):
-        # assign data_in only once, because random values are used
-        range_ = range(self.height * self.width * self.depth)
-        if self.name == "increment":
-            self.data_in = [i % 256 for i in range_]
-        elif self.name == "ones":
-            self.data_in = [1 for _ in range_]
-        elif self.name == "random":
-            self.data_in = [randint(0, 255) for _ in range_]
-        else:
-            raise ValueError(f"invalid name {self.name}")
+    @property
+    def stimulus(self) -> stimuli.Stimulus:
+        # Samples of less than eight bit are sent one per byte.
+        max_value = None
+        if self.color_type == 3:
+            max_value = min(2 ** self.bit_depth, self.palette_size) - 1
+        return stimuli.Stimulus(
+            self.name, self.width, self.height, self.generics.depth,
+            bit_depth=self.bit_depth, max_value=max_value,
+            entropy=self.entropy)
+
+    @cached_property
+    def data_in(self) -> List[int]:
+        return list(stimuli.to_bytes(self.stimulus))
+
+    @property
+    def palette(self) -> Optional[bytes]:
+        if self.color_type != 3:
+            return None
+        return stimuli.to_bytes(
+            stimuli.Stimulus("random", self.palette_size, 1, 3, seed=1))
 
     @property
     def id_(self) -> str:
-        return (f"{self.name}_{self.width}x{self.height}_"
-                f"row_filter_{self.row_filter}_color_{self.color_type}_"
-                f"btype_{self.block_type}")
+        id_ = (f"{self.name}_{self.width}x{self.height}_"
+               f"row_filter_{self.row_filter}_color_{self.color_type}_"
+               f"btype_{self.block_type}")
+        if self.block_type in (0, 2) or self.stored_fallback:
+            id_ += f"_block_{self.block_size}"
+        if self.stored_fallback:
+            id_ += "_fallback"
+        if self.idat_chunk_size:
+            id_ += f"_chunk_{self.idat_chunk_size}"
+        if self.lanes != 1:
+            id_ += f"_lanes_{self.lanes}"
+        if self.input_bytes != 1:
+            id_ += f"_input_bytes_{self.input_bytes}"
+        if self.frames != 1:
+            id_ += f"_frames_{self.frames}"
+        if self.frame_buffer_size:
+            id_ += f"_frame_buffer_{self.frame_buffer_size}"
+        if self.bit_depth != 8:
+            id_ += f"_bit_depth_{self.bit_depth}"
+        if self.color_type == 3:
+            id_ += f"_palette_{self.palette_size}"
+        if self.name == "noise":
+            id_ += f"_entropy_{self.entropy:g}"
+        return id_
+
+    @property
+    def generics(self) -> png_model.Generics:
+        return png_model.Generics(
+            img_width=self.width, img_height=self.height,
+            color_type=self.color_type, bit_depth=self.bit_depth,
+            palette_size=self.palette_size, input_bytes=self.input_bytes,
+            input_buffer_size=12,
+            search_buffer_size=12, max_match_length_user=7,
+            btype=self.block_type, block_size=self.block_size,
+            stored_fallback=self.stored_fallback, lanes=self.lanes,
+            row_filter_type=self.row_filter,
+            idat_chunk_size=self.idat_chunk_size,
+            frame_buffer_size=self.frame_buffer_size)
 
     @property
     def depth(self) -> int:
@@ -143,13 +342,35 @@ class Testcase:
         elif self.color_type == 2:
             return 3  # RGB
         elif self.color_type == 3:
-            return 1  # palette (TODO: is this correct?)
+            return 1  # palette index
         elif self.color_type == 4:
             return 2  # gray with alpha
         elif self.color_type == 6:
             return 4  # RGB with alpha
         raise ValueError(f"invalid color type {self.color_type}")
 
+    @property
+    def pillow_data(self) -> List[int]:
+        """The input data, as it gets decoded by pillow.
+
+        Pillow scales greyscale samples of less than eight bit to eight bit.
+        Samples of 16 bit are reduced to their most significant byte, except of
+        greyscale. Greyscale with alpha gets converted to RGBA.
+        """
+        data = self.data_in
+        if self.bit_depth == 16:
+            if self.color_type == 0:
+                return [(msb << 8) | lsb for msb, lsb in zip(data[::2], data[1::2])]
+            data = data[::2]
+            if self.color_type == 4:
+                return list(itertools.chain(*(
+                    (grey, grey, grey, alpha)
+                    for grey, alpha in zip(data[::2], data[1::2]))))
+            return data
+        if self.bit_depth < 8 and self.color_type == 0:
+            return [sample * 255 // (2 ** self.bit_depth - 1) for sample in data]
+        return data
+
 
 def create_test_suite(tb_lib):
     root = dirname(__file__)
@@ -160,7 +381,7 @@ def create_test_suite(tb_lib):
     testcases = []
     for name, img_size, color_type, block_type, row_filter in itertools.product(
             ("increment", "ones", "random"), ((4, 4), (12, 12), (60, 80)),
-            (0, 2, 4, 6), (1,), (0, 1)):
+            (0, 2, 4, 6), (1,), range(6)):
         if row_filter != 0 and img_size != (12, 12):
             continue  # skip some tests to reduce execution time
 
@@ -174,23 +395,124 @@ def create_test_suite(tb_lib):
         Testcase("ones", 5, 3, 4, 1, 0),
     ])
 
+    # row filters with a previous row, odd sizes and a single column
+    for name, row_filter in itertools.product(
+            ("increment", "random"), range(2, 6)):
+        testcases.extend([
+            Testcase(name, 5, 3, 2, 1, row_filter),
+            Testcase(name, 1, 4, 0, 1, row_filter),
+        ])
+    testcases.append(Testcase("random", 60, 80, 0, 2, 5))
+
+    # dynamic huffman, with a single and with multiple blocks
+    for name, block_size in itertools.product(
+            ("increment", "ones", "random"), (1024, 16)):
+        testcases.extend([
+            Testcase(name, 12, 12, 2, 2, 1, block_size),
+            Testcase(name, 60, 80, 0, 2, 0, block_size),
+        ])
+
+    # no compression and fallback to stored blocks for incompressible data
+    for name, block_type, stored_fallback in itertools.product(
+            ("increment", "ones", "random"), (0, 1, 2), (0, 1)):
+        if block_type == 0 and stored_fallback == 1:
+            continue
+        if block_type == 1 and stored_fallback == 0:
+            continue  # covered above
+        if block_type == 2 and stored_fallback == 0:
+            continue  # covered above
+        testcases.append(
+            Testcase(name, 12, 12, 2, block_type, 0, 64, stored_fallback))
+    # The input is a multiple of the block size, i. e. 16 bytes per row.
+    testcases.extend([
+        Testcase("random", 15, 4, 0, 0, 0, 16),
+        Testcase("random", 15, 4, 0, 0, 0, 32, lanes=2),
+        Testcase("increment", 15, 4, 0, 0, 1, 64, frames=3),
+    ])
+
+    # streaming with multiple IDAT chunks
+    for name, block_type, idat_chunk_size in itertools.product(
+            ("increment", "ones", "random"), (0, 1, 2), (16, 100, 8192)):
+        testcases.append(Testcase(name, 12, 12, 2, block_type, 1, 64,
+                                  idat_chunk_size=idat_chunk_size))
+    # The chunk overhead and the bursts of the lanes fill the IDAT buffer.
+    # Thus zlib gets stalled.
+    for block_type, lanes in itertools.product((0, 1), (1, 3)):
+        testcases.append(Testcase("random", 60, 80, 0, block_type, 0, 1024,
+                                  idat_chunk_size=16, lanes=lanes))
+
+    # multiple lanes, the last lane gets the remaining rows
+    for name, block_type, lanes in itertools.product(
+            ("increment", "ones", "random"), (0, 1, 2), (2, 3)):
+        testcases.extend([
+            Testcase(name, 12, 12, 2, block_type, 1, 64, lanes=lanes),
+            Testcase(name, 60, 80, 0, block_type, 4, 1024, lanes=lanes),
+        ])
+    testcases.append(
+        Testcase("random", 12, 4, 2, 1, 0, stored_fallback=1, lanes=4))
+
+    # a pixel or multiple bytes per input word
+    for name, color_type, row_filter in itertools.product(
+            ("increment", "random"), (2, 4, 6), (0, 1, 5)):
+        depth = png_model.get_img_depth(color_type)
+        testcases.append(Testcase(name, 12, 12, color_type, 1, row_filter,
+                                  input_bytes=depth))
+    testcases.extend([
+        Testcase("random", 12, 12, 0, 1, 4, input_bytes=8),
+        Testcase("random", 5, 4, 6, 2, 3, input_bytes=8),
+        Testcase("increment", 4, 4, 2, 1, 2, input_bytes=2, lanes=2),
+    ])
+
+    # multiple frames in a row, with and without frame buffer
+    for name, idat_chunk_size, frame_buffer_size in itertools.product(
+            ("increment", "random"), (0, 100), (0, 64)):
+        testcases.append(Testcase(name, 12, 12, 2, 1, 1,
+                                  idat_chunk_size=idat_chunk_size, frames=3,
+                                  frame_buffer_size=frame_buffer_size))
+    testcases.extend([
+        Testcase("random", 12, 12, 6, 2, 5, 64, input_bytes=4, frames=3,
+                 frame_buffer_size=512),
+        Testcase("ones", 4, 4, 0, 1, 0, frames=4, frame_buffer_size=1),
+    ])
+
+    # bit depths other than eight bit and indexed-color
+    for name, (color_type, bit_depth), row_filter in itertools.product(
+            ("increment", "random"),
+            ((0, 1), (0, 2), (0, 4), (0, 16), (2, 16), (4, 16), (6, 16),
+             (3, 1), (3, 2), (3, 4), (3, 8)),
+            (0, 5)):
+        testcases.append(Testcase(name, 13, 5, color_type, 1, row_filter,
+                                  bit_depth=bit_depth,
+                                  palette_size=min(2 ** bit_depth, 256)))
+    testcases.extend([
+        Testcase("random", 12, 12, 3, 2, 4, 64, palette_size=20),
+        Testcase("random", 12, 12, 3, 1, 1, bit_depth=4, palette_size=16,
+                 idat_chunk_size=100),
+        Testcase("increment", 12, 12, 3, 1, 0, bit_depth=2, palette_size=3,
+                 frames=3, frame_buffer_size=64),
+        Testcase("random", 7, 12, 0, 0, 2, 64, bit_depth=1, lanes=2),
+        Testcase("random", 12, 12, 2, 1, 4, bit_depth=16, input_bytes=6),
+        Testcase("random", 12, 12, 0, 2, 5, 64, bit_depth=16, input_bytes=2,
+                 idat_chunk_size=100),
+    ])
+
+    # realistic content
+    for name, color_type, row_filter in itertools.product(
+            ("gradient", "tiles", "sensor"), (0, 2, 6), (0, 5)):
+        testcases.append(Testcase(name, 60, 40, color_type, 2, row_filter))
+    for entropy in (1, 4, 7):
+        testcases.append(Testcase("noise", 60, 40, 2, 2, 5, entropy=entropy))
+    testcases.append(
+        Testcase("sensor", 60, 40, 0, 2, 5, bit_depth=16, input_bytes=2))
+
     # comparison to https://ipbloq.files.wordpress.com/2017/09/ipb-png-e-pb.pdf
-    testcases.append(Testcase("ones", 800, 480, 2, 1, 0))
+    testcases.append(Testcase("ones", 800, 480, 2, 1, 0, full_tier=True))
 
     for case in testcases:
-        generics = {
-            "id": case.id_,
-            "C_IMG_WIDTH": case.width,
-            "C_IMG_HEIGHT": case.height,
-            "C_IMG_BIT_DEPTH": 8,
-            "C_COLOR_TYPE": case.color_type,
-            "C_INPUT_BUFFER_SIZE": 12,
-            "C_SEARCH_BUFFER_SIZE": 12,
-            "C_BTYPE": case.block_type,
-            "C_ROW_FILTER_TYPE": case.row_filter,
-            "C_MAX_MATCH_LENGTH_USER": 7,
-        }
+        generics = {"id": case.id_, "C_FRAMES": case.frames,
+                    **case.generics.to_vhdl()}
         tb_png_encoder.add_config(
             name=case.id_, generics=generics,
             pre_config=partial(create_stimuli, root, case),
-            post_check=partial(assemble_and_check_png, root, case))
+            post_check=partial(assemble_and_check_png, root, case),
+            attributes={".full": None} if case.full_tier else None)
@@ -26,14 +26,25 @@ entity tb_png_encoder is
     C_IMG_HEIGHT         : integer;
     C_IMG_BIT_DEPTH      : integer;
     C_COLOR_TYPE         : integer;
+    C_PALETTE_SIZE       : integer;
+    C_INPUT_BYTES        : integer;
 
     C_INPUT_BUFFER_SIZE  : integer;
     C_SEARCH_BUFFER_SIZE : integer;
     C_MAX_MATCH_LENGTH_USER : integer;
 
     C_BTYPE              : integer;
+    C_BLOCK_SIZE         : integer;
+    C_STORED_FALLBACK    : integer;
+    C_LANES              : integer;
 
-    C_ROW_FILTER_TYPE    : integer
+    C_ROW_FILTER_TYPE    : integer;
+
+    C_IDAT_CHUNK_SIZE    : integer;
+    C_FRAME_BUFFER_SIZE  : integer;
+
+    -- The same image is encoded C_FRAMES times in a row.
+    C_FRAMES             : integer := 1
   );
 end entity;
 
@@ -41,13 +52,45 @@ architecture tb of tb_png_encoder is
   signal sl_clk : std_logic := '0';
   signal sl_start : std_logic := '0';
   signal sl_valid_in : std_logic := '0';
-  signal slv_data_in : std_logic_vector(7 downto 0) := (others => '0');
+  signal slv_data_in : std_logic_vector(C_INPUT_BYTES*8-1 downto 0) := (others => '0');
   signal sl_valid_out : std_logic := '0';
   signal slv_data_out : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_rdy : std_logic := '0';
   signal sl_finish : std_logic := '0';
+  signal slv_counter_select : std_logic_vector(4 downto 0) := (others => '0');
+  signal slv_counter : std_logic_vector(31 downto 0) := (others => '0');
+  signal sl_palette_we : std_logic := '0';
+  signal slv_palette_addr : std_logic_vector(7 downto 0) := (others => '0');
+  signal slv_palette_data : std_logic_vector(23 downto 0) := (others => '0');
+
+  -- names of the performance counters, see doc/toplevel_interface.md
+  function counter_name(index : integer) return string is
+  begin
+    case index is
+      when 0 => return "cycles";
+      when 1 => return "input_stall";
+      when 2 => return "row_filter_busy";
+      when 3 => return "row_filter_stall";
+      when 4 => return "zlib_stall";
+      when 5 => return "literals";
+      when 6 => return "matches";
+      when 7 => return "match_length_sum";
+      when 8 => return "match_offset_sum";
+      when 9 => return "huffman_stall";
+      when 10 => return "zlib_bytes";
+      when 11 => return "adler32_busy";
+      when 12 => return "crc32_busy";
+      when 13 => return "output_bytes";
+      when 14 => return "lzss_busy";
+      when 15 => return "lzss_stall";
+      when 16 => return "huffman_busy";
+      when others => return "huffman_bytes";
+    end case;
+  end function;
 
   shared variable data_src : integer_array_t;
+  shared variable palette_src : integer_array_t;
+  shared variable data_out : integer_array_t;
 
   signal data_check_done, stimuli_done : boolean := false;
 
@@ -58,14 +101,24 @@ begin
     C_IMG_HEIGHT => C_IMG_HEIGHT,
     C_IMG_BIT_DEPTH => C_IMG_BIT_DEPTH,
     C_COLOR_TYPE => C_COLOR_TYPE,
+    C_PALETTE_SIZE => C_PALETTE_SIZE,
+    C_INPUT_BYTES => C_INPUT_BYTES,
 
     C_INPUT_BUFFER_SIZE => C_INPUT_BUFFER_SIZE,
     C_SEARCH_BUFFER_SIZE => C_SEARCH_BUFFER_SIZE,
     C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
 
     C_BTYPE => C_BTYPE,
+    C_BLOCK_SIZE => C_BLOCK_SIZE,
+    C_STORED_FALLBACK => C_STORED_FALLBACK,
+    C_LANES => C_LANES,
 
-    C_ROW_FILTER_TYPE => C_ROW_FILTER_TYPE
+    C_ROW_FILTER_TYPE => C_ROW_FILTER_TYPE,
+
+    C_IDAT_CHUNK_SIZE => C_IDAT_CHUNK_SIZE,
+    C_FRAME_BUFFER_SIZE => C_FRAME_BUFFER_SIZE,
+
+    C_PERF_COUNTERS => 1
   )
   port map (
     isl_clk     => sl_clk,
@@ -75,7 +128,13 @@ begin
     oslv_data   => slv_data_out,
     osl_valid   => sl_valid_out,
     osl_rdy     => sl_rdy,
-    osl_finish  => sl_finish
+    osl_finish  => sl_finish,
+    isl_get     => '1',
+    isl_palette_we => sl_palette_we,
+    islv_palette_addr => slv_palette_addr,
+    islv_palette_data => slv_palette_data,
+    islv_counter_select => slv_counter_select,
+    oslv_counter => slv_counter
   );
   
   clk_gen(sl_clk, 10 ns);
@@ -86,10 +145,16 @@ begin
     -- https://github.com/VUnit/vunit/blob/209e27d28cf9abb93b2d4f7ccc9e26882df11859/vunit/vhdl/array/src/array_pkg.vhd#L38
     data_src := load_raw(tb_path(runner_cfg) & "gen/input_" & id & ".raw", 8, false);
 
-    check_equal(width(data_src), C_IMG_WIDTH*C_IMG_HEIGHT*get_img_depth(C_COLOR_TYPE)*C_IMG_BIT_DEPTH/8);
+    -- Samples of less than eight bit are sent one per byte.
+    check_equal(width(data_src), C_IMG_WIDTH*C_IMG_HEIGHT*get_img_depth(C_COLOR_TYPE)*max_int(1, C_IMG_BIT_DEPTH/8));
     check_equal(height(data_src), 1);
     check_equal(depth(data_src), 1);
 
+    if C_COLOR_TYPE = 3 then
+      palette_src := load_raw(tb_path(runner_cfg) & "gen/palette_" & id & ".raw", 8, false);
+      check_equal(width(palette_src), 3*C_PALETTE_SIZE);
+    end if;
+
     wait until (stimuli_done and
                 data_check_done and
                 rising_edge(sl_clk));
@@ -100,20 +165,45 @@ begin
   proc_stimuli: process
   begin
     wait until rising_edge(sl_clk);
-    sl_start <= '1';
-    wait until rising_edge(sl_clk);
-    sl_start <= '0';
 
-    for i in 0 to width(data_src)-1 loop
-      while sl_rdy = '0' loop
-        sl_valid_in <= '0';
+    -- The palette has to be written before the start.
+    if C_COLOR_TYPE = 3 then
+      for i in 0 to C_PALETTE_SIZE-1 loop
+        sl_palette_we <= '1';
+        slv_palette_addr <= std_logic_vector(to_unsigned(i, slv_palette_addr'length));
+        slv_palette_data <= std_logic_vector(to_unsigned(get(palette_src, 3*i, 0), 8)) &
+                            std_logic_vector(to_unsigned(get(palette_src, 3*i+1, 0), 8)) &
+                            std_logic_vector(to_unsigned(get(palette_src, 3*i+2, 0), 8));
         wait until rising_edge(sl_clk);
       end loop;
-      sl_valid_in <= '1';
-      slv_data_in <= std_logic_vector(to_unsigned(get(data_src, i, 0), slv_data_in'length));
+      sl_palette_we <= '0';
+    end if;
+
+    for frame in 0 to C_FRAMES-1 loop
+      -- Without frame buffer, the next frame can be started only after the previous frame is finished.
+      -- With frame buffer, the next frame is started directly after the last word of the previous frame.
+      if frame /= 0 and C_FRAME_BUFFER_SIZE = 0 then
+        wait until rising_edge(sl_clk) and sl_finish = '1';
+      end if;
+      sl_start <= '1';
       wait until rising_edge(sl_clk);
+      sl_start <= '0';
+
+      -- The first byte of a word is in the most significant bits.
+      for i in 0 to width(data_src)/C_INPUT_BYTES-1 loop
+        while sl_rdy = '0' loop
+          sl_valid_in <= '0';
+          wait until rising_edge(sl_clk);
+        end loop;
+        sl_valid_in <= '1';
+        for byte in 0 to C_INPUT_BYTES-1 loop
+          slv_data_in(slv_data_in'high-byte*8 downto slv_data_in'high-byte*8-7) <=
+            std_logic_vector(to_unsigned(get(data_src, i*C_INPUT_BYTES+byte, 0), 8));
+        end loop;
+        wait until rising_edge(sl_clk);
+      end loop;
+      sl_valid_in <= '0';
     end loop;
-    sl_valid_in <= '0';
     wait until rising_edge(sl_clk);
 
     stimuli_done <= true;
@@ -121,21 +211,70 @@ begin
   end process;
 
   proc_data_check: process
-    file file_handler     : textio.text open write_mode is tb_path(runner_cfg) & "gen/png_" & id & ".txt";
+    file file_cycles      : textio.text open write_mode is tb_path(runner_cfg) & "gen/cycles_" & id & ".txt";
+    file file_perf        : textio.text open write_mode is tb_path(runner_cfg) & "gen/perf_" & id & ".json";
     variable row          : textio.line;
     variable v_data_write : integer;
+    variable v_int_cycles : integer := 0;
+    variable v_int_cycles_first_frame : integer := 0;
   begin
-    wait until rising_edge(sl_clk);
+    -- The cycles are counted from the first start, i. e. after the palette is written.
+    wait until sl_start = '1';
     data_check_done <= false;
+    data_out := new_1d(bit_width => 8, is_signed => false);
 
-    while sl_finish = '0' loop
-      if sl_valid_out = '1' then
-        textio.write(row, to_string(slv_data_out));
-        textio.writeline(file_handler, row);
+    -- All frames are collected and written to the same file.
+    for frame in 0 to C_FRAMES-1 loop
+      if frame /= 0 then
+        v_int_cycles := v_int_cycles + 1;
+        wait until rising_edge(sl_clk);
       end if;
+
+      while sl_finish = '0' loop
+        if sl_valid_out = '1' then
+          append(data_out, to_integer(unsigned(slv_data_out)));
+        end if;
+        v_int_cycles := v_int_cycles + 1;
+        wait until rising_edge(sl_clk);
+      end loop;
+
+      report "frame " & integer'image(frame) & " finished after " & integer'image(v_int_cycles) & " cycles";
+      if frame = 0 then
+        v_int_cycles_first_frame := v_int_cycles;
+      end if;
+    end loop;
+    save_raw(data_out, tb_path(runner_cfg) & "gen/png_" & id & ".raw");
+
+    -- The cycles from start to finish are needed for benchmarking.
+    report "cycles: " & integer'image(v_int_cycles);
+    textio.write(row, v_int_cycles);
+    textio.writeline(file_cycles, row);
+
+    -- The first frame includes the latency of the pipeline. Thus only the following frames
+    -- are used to obtain the sustained frame rate. The clock period is 10 ns.
+    if C_FRAMES > 1 then
+      report "sustained cycles per frame: " &
+        real'image(real(v_int_cycles - v_int_cycles_first_frame) / real(C_FRAMES - 1));
+      report "sustained frames per second at 100 MHz: " &
+        real'image(100.0e6 * real(C_FRAMES - 1) / real(v_int_cycles - v_int_cycles_first_frame));
+    end if;
+
+    -- Harvest the performance counters. The counter output is registered.
+    textio.write(row, string'("{"));
+    textio.writeline(file_perf, row);
+    for i in 0 to 17 loop
+      slv_counter_select <= std_logic_vector(to_unsigned(i, slv_counter_select'length));
       wait until rising_edge(sl_clk);
+      wait until rising_edge(sl_clk);
+      textio.write(row, '"' & counter_name(i) & """: " & integer'image(to_integer(unsigned(slv_counter))));
+      if i /= 17 then
+        textio.write(row, string'(","));
+      end if;
+      textio.writeline(file_perf, row);
     end loop;
-    
+    textio.write(row, string'("}"));
+    textio.writeline(file_perf, row);
+
     report ("Done checking");
     data_check_done <= true;
     wait;
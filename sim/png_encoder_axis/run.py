@@ -0,0 +1,122 @@
+"""Test cases for the AXI4-Stream wrapper of the png_encoder module."""
+
+import dataclasses
+from functools import cached_property, partial
+import os
+from os.path import join, dirname
+from typing import List
+
+import png_model
+import stimuli
+
+
+def create_stimuli(root: str, case):
+    filename = join(root, "gen", f"input_{case.id_}.raw")
+    with open(filename, "wb") as infile:
+        infile.write(stimuli.to_bytes(case.stimulus))
+    return True
+
+
+def check_png(root: str, case):
+    with open(join(root, "gen", f"png_{case.id_}.raw"), "rb") as infile:
+        png_bytes = infile.read()
+
+    png_bytes_ref = png_model.png_encoder(case.data_in, case.generics)
+    frame_size = len(png_bytes_ref)
+    if case.idat_chunk_size == 0:
+        frame_size += 3  # padding of the header
+    if len(png_bytes) != frame_size * case.frames:
+        print(f"output has {len(png_bytes)} bytes, "
+              f"expected {frame_size * case.frames} bytes")
+        return False
+
+    for frame in range(case.frames):
+        frame_bytes = png_bytes[frame * frame_size:(frame + 1) * frame_size]
+        if case.idat_chunk_size == 0:
+            # The header is sent last. See also "png_encoder/run.py".
+            frame_bytes = frame_bytes[-44:-3] + frame_bytes[:-44]
+        if frame_bytes != png_bytes_ref:
+            print(f"frame {frame} differs from the reference model")
+            return False
+    return True
+
+
+@dataclasses.dataclass
+class Testcase:
+    width: int
+    height: int
+    color_type: int
+    block_type: int
+    row_filter: int
+    idat_chunk_size: int
+    input_bytes: int = 1
+    output_fifo_size: int = 1024
+    frame_buffer_size: int = 0
+    frames: int = 2
+    stall_percent: int = 30
+
+    @property
+    def stimulus(self) -> stimuli.Stimulus:
+        return stimuli.Stimulus("random", self.width, self.height,
+                                self.generics.depth, max_value=3)
+
+    @cached_property
+    def data_in(self) -> List[int]:
+        return list(stimuli.to_bytes(self.stimulus))
+
+    @property
+    def id_(self) -> str:
+        return (f"{self.width}x{self.height}_color_{self.color_type}_"
+                f"btype_{self.block_type}_row_filter_{self.row_filter}_"
+                f"chunk_{self.idat_chunk_size}_input_bytes_{self.input_bytes}_"
+                f"fifo_{self.output_fifo_size}_fb_{self.frame_buffer_size}_"
+                f"stall_{self.stall_percent}")
+
+    @property
+    def generics(self) -> png_model.Generics:
+        return png_model.Generics(
+            img_width=self.width, img_height=self.height,
+            color_type=self.color_type, input_bytes=self.input_bytes,
+            btype=self.block_type, row_filter_type=self.row_filter,
+            idat_chunk_size=self.idat_chunk_size)
+
+
+def create_test_suite(tb_lib):
+    root = dirname(__file__)
+    os.makedirs(join(root, "gen"), exist_ok=True)
+
+    tb_png_encoder_axis = tb_lib.entity("tb_png_encoder_axis")
+
+    testcases = [
+        Testcase(12, 12, 2, 1, 1, 64),
+        Testcase(12, 12, 2, 1, 1, 0),
+        Testcase(12, 12, 6, 2, 5, 100, input_bytes=4),
+        Testcase(12, 12, 0, 0, 0, 16, output_fifo_size=0, stall_percent=80),
+        Testcase(30, 20, 2, 1, 4, 256, input_bytes=3, stall_percent=0),
+        # The stall of the output propagates through zlib and deflate into the encoder stages.
+        Testcase(12, 12, 2, 2, 1, 0, output_fifo_size=0, stall_percent=80),
+        Testcase(12, 12, 2, 0, 1, 0, output_fifo_size=0, stall_percent=80),
+        Testcase(12, 12, 2, 1, 1, 0, frames=3, frame_buffer_size=64),
+        Testcase(12, 12, 0, 1, 5, 32, frames=3, frame_buffer_size=16,
+                 stall_percent=60),
+    ]
+
+    for case in testcases:
+        generics = {
+            "id": case.id_,
+            "C_IMG_WIDTH": case.width,
+            "C_IMG_HEIGHT": case.height,
+            "C_COLOR_TYPE": case.color_type,
+            "C_INPUT_BYTES": case.input_bytes,
+            "C_BTYPE": case.block_type,
+            "C_ROW_FILTER_TYPE": case.row_filter,
+            "C_IDAT_CHUNK_SIZE": case.idat_chunk_size,
+            "C_OUTPUT_FIFO_SIZE": case.output_fifo_size,
+            "C_FRAME_BUFFER_SIZE": case.frame_buffer_size,
+            "C_FRAMES": case.frames,
+            "C_STALL_PERCENT": case.stall_percent,
+        }
+        tb_png_encoder_axis.add_config(
+            name=case.id_, generics=generics,
+            pre_config=partial(create_stimuli, root, case),
+            post_check=partial(check_png, root, case))
@@ -0,0 +1,177 @@
+
+library ieee;
+use ieee.std_logic_1164.all;
+use ieee.numeric_std.all;
+use ieee.math_real.all;
+
+library png_lib;
+
+library util;
+use util.math_pkg.all;
+use util.png_pkg.all;
+
+library sim;
+use sim.vunit_common_pkg.all;
+
+library vunit_lib;
+context vunit_lib.vunit_context;
+
+entity tb_png_encoder_axis is
+  generic (
+    runner_cfg           : string;
+    id                   : string;
+
+    C_IMG_WIDTH          : integer;
+    C_IMG_HEIGHT         : integer;
+    C_COLOR_TYPE         : integer;
+    C_INPUT_BYTES        : integer;
+    C_BTYPE              : integer;
+    C_ROW_FILTER_TYPE    : integer;
+    C_IDAT_CHUNK_SIZE    : integer;
+    C_OUTPUT_FIFO_SIZE   : integer;
+    C_FRAME_BUFFER_SIZE  : integer;
+
+    -- The same image is sent multiple times.
+    C_FRAMES             : integer;
+    -- Probability of an input or output stall in percent.
+    C_STALL_PERCENT      : integer
+  );
+end entity;
+
+architecture tb of tb_png_encoder_axis is
+  signal sl_clk : std_logic := '0';
+  signal sl_s_tvalid : std_logic := '0';
+  signal sl_s_tready : std_logic := '0';
+  signal slv_s_tdata : std_logic_vector(C_INPUT_BYTES*8-1 downto 0) := (others => '0');
+  signal sl_s_tlast : std_logic := '0';
+  signal sl_m_tvalid : std_logic := '0';
+  signal sl_m_tready : std_logic := '0';
+  signal slv_m_tdata : std_logic_vector(7 downto 0) := (others => '0');
+  signal sl_m_tlast : std_logic := '0';
+
+  shared variable data_src : integer_array_t;
+  shared variable data_out : integer_array_t;
+
+  signal data_check_done, stimuli_done : boolean := false;
+
+  impure function stall(variable seed1, seed2 : inout positive) return boolean is
+    variable v_rand : real;
+  begin
+    uniform(seed1, seed2, v_rand);
+    return v_rand * 100.0 < real(C_STALL_PERCENT);
+  end function;
+
+begin
+  dut : entity png_lib.png_encoder_axis
+  generic map (
+    C_IMG_WIDTH => C_IMG_WIDTH,
+    C_IMG_HEIGHT => C_IMG_HEIGHT,
+    C_COLOR_TYPE => C_COLOR_TYPE,
+    C_INPUT_BYTES => C_INPUT_BYTES,
+    C_BTYPE => C_BTYPE,
+    C_ROW_FILTER_TYPE => C_ROW_FILTER_TYPE,
+    C_IDAT_CHUNK_SIZE => C_IDAT_CHUNK_SIZE,
+    C_FRAME_BUFFER_SIZE => C_FRAME_BUFFER_SIZE,
+    C_OUTPUT_FIFO_SIZE => C_OUTPUT_FIFO_SIZE
+  )
+  port map (
+    isl_clk => sl_clk,
+    isl_s_axis_tvalid => sl_s_tvalid,
+    osl_s_axis_tready => sl_s_tready,
+    islv_s_axis_tdata => slv_s_tdata,
+    isl_s_axis_tlast => sl_s_tlast,
+    osl_m_axis_tvalid => sl_m_tvalid,
+    isl_m_axis_tready => sl_m_tready,
+    oslv_m_axis_tdata => slv_m_tdata,
+    osl_m_axis_tlast => sl_m_tlast,
+    isl_palette_we => '0',
+    islv_palette_addr => (others => '0'),
+    islv_palette_data => (others => '0'),
+    islv_counter_select => (others => '0'),
+    oslv_counter => open
+  );
+
+  clk_gen(sl_clk, 10 ns);
+
+  main: process
+  begin
+    test_runner_setup(runner, runner_cfg);
+    data_src := load_raw(tb_path(runner_cfg) & "gen/input_" & id & ".raw", 8, false);
+
+    check_equal(width(data_src), C_IMG_WIDTH*C_IMG_HEIGHT*get_img_depth(C_COLOR_TYPE));
+
+    wait until (stimuli_done and
+                data_check_done and
+                rising_edge(sl_clk));
+    test_runner_cleanup(runner);
+    wait;
+  end process;
+
+  proc_stimuli: process
+    variable seed1, seed2 : positive := 1;
+    variable v_int_words : integer;
+  begin
+    wait until rising_edge(sl_clk);
+    v_int_words := width(data_src)/C_INPUT_BYTES;
+
+    for frame in 0 to C_FRAMES-1 loop
+      for i in 0 to v_int_words-1 loop
+        -- Random gaps at the input.
+        while stall(seed1, seed2) loop
+          sl_s_tvalid <= '0';
+          wait until rising_edge(sl_clk);
+        end loop;
+
+        -- The first byte of a word is in the most significant bits.
+        sl_s_tvalid <= '1';
+        for byte in 0 to C_INPUT_BYTES-1 loop
+          slv_s_tdata(slv_s_tdata'high-byte*8 downto slv_s_tdata'high-byte*8-7) <=
+            std_logic_vector(to_unsigned(get(data_src, i*C_INPUT_BYTES+byte, 0), 8));
+        end loop;
+        if i = v_int_words-1 then
+          sl_s_tlast <= '1';
+        else
+          sl_s_tlast <= '0';
+        end if;
+        wait until rising_edge(sl_clk) and sl_s_tready = '1';
+      end loop;
+      sl_s_tvalid <= '0';
+      sl_s_tlast <= '0';
+    end loop;
+
+    stimuli_done <= true;
+    wait;
+  end process;
+
+  -- All frames are written to the same file. They are separated by TLAST.
+  proc_data_check: process
+    variable seed1, seed2 : positive := 2;
+    variable v_int_frames : integer := 0;
+  begin
+    wait until rising_edge(sl_clk);
+    data_check_done <= false;
+    data_out := new_1d(bit_width => 8, is_signed => false);
+
+    while v_int_frames /= C_FRAMES loop
+      -- Random backpressure at the output.
+      if stall(seed1, seed2) then
+        sl_m_tready <= '0';
+      else
+        sl_m_tready <= '1';
+      end if;
+      wait until rising_edge(sl_clk);
+
+      if sl_m_tvalid = '1' and sl_m_tready = '1' then
+        append(data_out, to_integer(unsigned(slv_m_tdata)));
+        if sl_m_tlast = '1' then
+          v_int_frames := v_int_frames + 1;
+        end if;
+      end if;
+    end loop;
+    save_raw(data_out, tb_path(runner_cfg) & "gen/png_" & id & ".raw");
+
+    report ("Done checking");
+    data_check_done <= true;
+    wait;
+  end process;
+end;
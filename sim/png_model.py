@@ -0,0 +1,885 @@
+"""Bit-exact reference model of the png encoder.
+
+The model reproduces the output of the VHDL modules for a given set of
+generics: row_filter, lzss (registers as window), stored, huffman,
+huffman_block, zlib (including the lanes) and png_encoder. It can be imported
+by the run scripts to get golden references and to evaluate generics on whole
+datasets without simulation.
+
+lzss_hash (C_WINDOW_TYPE = 1) keeps its hash table from one stream to the
+next. The model starts with an empty table, i. e. it's exact for the first
+stream after configuration.
+
+The output bytes are exact. The cycles are not: estimate_cycles() is a rough
+estimation, based on the throughput of the slowest module. It isn't verified
+against the simulation. Use it to compare generics, not to predict the cycles
+of a design.
+"""
+
+from bisect import bisect_left
+import dataclasses
+from typing import Dict, List, Optional, Tuple, Union
+import zlib
+
+
+@dataclasses.dataclass
+class Match:
+    offset: int
+    length: int
+
+
+@dataclasses.dataclass
+class Literal:
+    value: int
+
+
+Token = Union[Literal, Match]
+
+
+@dataclasses.dataclass
+class Generics:
+    """Generics of the png_encoder. The defaults match png_encoder.vhd."""
+
+    img_width: int = 800
+    img_height: int = 480
+    color_type: int = 2
+    bit_depth: int = 8
+    palette_size: int = 256
+    input_bytes: int = 1
+    input_buffer_size: int = 12
+    search_buffer_size: int = 12
+    max_match_length_user: int = 7
+    match_mode: int = 0
+    window_type: int = 0
+    btype: int = 1
+    block_size: int = 1024
+    stored_fallback: int = 0
+    lanes: int = 1
+    row_filter_type: int = 0
+    idat_chunk_size: int = 0
+    frame_buffer_size: int = 0
+
+    @property
+    def depth(self) -> int:
+        return get_img_depth(self.color_type)
+
+    @property
+    def input_row_bytes(self) -> int:
+        """Samples of less than eight bit are sent one per byte."""
+        return self.img_width * self.depth * max(1, self.bit_depth // 8)
+
+    @property
+    def row_bytes(self) -> int:
+        """Bytes per row after packing, without the filter type."""
+        return -(-self.img_width * self.depth * self.bit_depth // 8)
+
+    @property
+    def bytes_per_pixel(self) -> int:
+        """Distance to the left neighbour of the row filter."""
+        return max(1, self.depth * self.bit_depth // 8)
+
+    @property
+    def max_match_length(self) -> int:
+        return min(self.input_buffer_size, self.max_match_length_user)
+
+    def to_vhdl(self) -> Dict[str, int]:
+        """Generics as expected by tb_png_encoder."""
+        return {
+            "C_IMG_WIDTH": self.img_width,
+            "C_IMG_HEIGHT": self.img_height,
+            "C_IMG_BIT_DEPTH": self.bit_depth,
+            "C_COLOR_TYPE": self.color_type,
+            "C_PALETTE_SIZE": self.palette_size,
+            "C_INPUT_BYTES": self.input_bytes,
+            "C_INPUT_BUFFER_SIZE": self.input_buffer_size,
+            "C_SEARCH_BUFFER_SIZE": self.search_buffer_size,
+            "C_MAX_MATCH_LENGTH_USER": self.max_match_length_user,
+            "C_BTYPE": self.btype,
+            "C_BLOCK_SIZE": self.block_size,
+            "C_STORED_FALLBACK": self.stored_fallback,
+            "C_LANES": self.lanes,
+            "C_ROW_FILTER_TYPE": self.row_filter_type,
+            "C_IDAT_CHUNK_SIZE": self.idat_chunk_size,
+            "C_FRAME_BUFFER_SIZE": self.frame_buffer_size,
+        }
+
+
+def get_img_depth(color_type: int) -> int:
+    """Channels per pixel. Indexed-color has a single channel, the index."""
+    depths = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+    if color_type not in depths:
+        raise ValueError(f"invalid color type {color_type}")
+    return depths[color_type]
+
+
+################################################################################
+# bit_packer and row_filter
+################################################################################
+
+
+def pack_samples(data: List[int], generics: Generics) -> List[int]:
+    """bit_packer.vhd: Pack samples of less than eight bit to bytes.
+
+    The leftmost sample is in the most significant bits. Each row starts at a
+    byte boundary.
+    """
+    if generics.bit_depth >= 8:
+        return list(data)
+    samples_per_byte = 8 // generics.bit_depth
+    row_samples = generics.input_row_bytes
+    packed = []
+    for row_start in range(0, len(data), row_samples):
+        row = data[row_start:row_start + row_samples]
+        for start in range(0, len(row), samples_per_byte):
+            byte = 0
+            for index in range(samples_per_byte):
+                sample = row[start + index] if start + index < len(row) else 0
+                byte = (byte << generics.bit_depth) | (
+                    sample & (2 ** generics.bit_depth - 1))
+            packed.append(byte)
+    return packed
+
+
+def paeth_predictor(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+def filter_row(row: List[int], prior: List[int], bpp: int,
+               filter_type: int) -> List[int]:
+    """Filter a single scanline. See also apply_row_filter() in png_pkg."""
+    filtered = []
+    for index, datum in enumerate(row):
+        left = row[index - bpp] if index >= bpp else 0
+        above = prior[index]
+        upper_left = prior[index - bpp] if index >= bpp else 0
+        if filter_type == 0:
+            predictor = 0
+        elif filter_type == 1:
+            predictor = left
+        elif filter_type == 2:
+            predictor = above
+        elif filter_type == 3:
+            predictor = (left + above) // 2
+        elif filter_type == 4:
+            predictor = paeth_predictor(left, above, upper_left)
+        else:
+            raise ValueError(f"invalid filter type {filter_type}")
+        filtered.append((datum - predictor) % 256)
+    return filtered
+
+
+def select_filter(row: List[int], prior: List[int], bpp: int) -> int:
+    """Minimum sum of absolute differences. The lower type wins on equal sums."""
+    def cost(filtered):
+        return sum(datum if datum < 128 else 256 - datum for datum in filtered)
+    sums = [cost(filter_row(row, prior, bpp, type_)) for type_ in range(5)]
+    return sums.index(min(sums))
+
+
+def row_filter(data: List[int], width: int, height: int, depth: int,
+               filter_type: int) -> List[int]:
+    """Filter all scanlines and prepend the filter type to each of them."""
+    row_bytes = width * depth
+    output: List[int] = []
+    prior = [0] * row_bytes
+    for row_index in range(height):
+        row = list(data[row_index * row_bytes:(row_index + 1) * row_bytes])
+        type_ = (select_filter(row, prior, depth) if filter_type == 5
+                 else filter_type)
+        output.append(type_)
+        output.extend(filter_row(row, prior, depth, type_))
+        prior = row
+    return output
+
+
+def filter_image(data: List[int], generics: Generics) -> List[int]:
+    """Pack and filter the input data, as it is sent to zlib."""
+    return row_filter(pack_samples(data, generics),
+                      generics.row_bytes // generics.bytes_per_pixel,
+                      generics.img_height, generics.bytes_per_pixel,
+                      generics.row_filter_type)
+
+
+################################################################################
+# lzss
+################################################################################
+
+
+def _find_matches(data: List[int], search_buffer_size: int,
+                  max_match_length: int, min_match_length: int,
+                  match_mode: int) -> List[Tuple[int, int]]:
+    """Offset and length of the match at each position. (0, 0) is no match."""
+    size = len(data)
+    positions: Dict[Tuple[int, ...], List[int]] = {}
+    matches = []
+    for index in range(size):
+        key = tuple(data[index:index + min_match_length])
+        candidates = positions.setdefault(key, [])
+        match = (0, 0)
+        if index + min_match_length <= size:
+            # The offset is limited by the datums seen so far.
+            oldest = bisect_left(candidates,
+                                 index - min(index, search_buffer_size))
+            if match_mode == 0:
+                # The first match is the one with the largest offset.
+                if oldest != len(candidates):
+                    offset = index - candidates[oldest]
+                    length = min_match_length
+                    while (length < max_match_length and
+                           index + length < size and
+                           data[index + length - offset] ==
+                           data[index + length]):
+                        length += 1
+                    match = (offset, length)
+            else:
+                # The longest match. The smallest offset wins on equal lengths.
+                for candidate in reversed(candidates[oldest:]):
+                    length = min_match_length
+                    while (length < max_match_length and
+                           index + length < size and
+                           data[candidate + length] == data[index + length]):
+                        length += 1
+                    if length > match[1]:
+                        match = (index - candidate, length)
+                    if length == max_match_length:
+                        break
+        candidates.append(index)
+        matches.append(match)
+    return matches
+
+
+def lzss(data: List[int], input_buffer_size: int, search_buffer_size: int,
+         max_match_length_user: int, match_mode: int = 0,
+         min_match_length: int = 3) -> List[Token]:
+    """LZSS tokens of lzss.vhd, i. e. with the registers as window."""
+    max_match_length = min(input_buffer_size, max_match_length_user)
+    matches = _find_matches(data, search_buffer_size, max_match_length,
+                            min_match_length, match_mode)
+
+    tokens: List[Token] = []
+    datums_to_skip = 0
+    for index, (offset, length) in enumerate(matches):
+        if datums_to_skip != 0:
+            datums_to_skip -= 1
+        elif (match_mode == 2 and offset != 0 and index + 1 < len(matches) and
+              matches[index + 1][1] > length):
+            # Lazy matching: The match at the next datum is longer.
+            tokens.append(Literal(data[index]))
+        elif offset != 0:
+            tokens.append(Match(offset, length))
+            datums_to_skip = length - 1
+        else:
+            tokens.append(Literal(data[index]))
+    return tokens
+
+
+def lzss_hash(data: List[int], input_buffer_size: int, search_buffer_size: int,
+              max_match_length_user: int, hash_bits: int = 10,
+              min_match_length: int = 3,
+              hash_table: Optional[List[int]] = None) -> List[Token]:
+    """LZSS tokens of lzss_hash.vhd, i. e. with the window in BRAM.
+
+    The hash table contains the last position of each hash of three datums.
+    Only this single candidate is checked. The positions are stored modulo
+    twice the window size. Thus outdated entries can yield a candidate, too.
+    A position is inserted, if at least three datums remain. hash_table gets
+    updated, if it's given.
+    """
+    max_match_length = min(input_buffer_size, max_match_length_user)
+    window_bits = (search_buffer_size - 1).bit_length()
+    position_mask = 2 ** (window_bits + 1) - 1
+    shift = (hash_bits + 2) // 3
+    if hash_table is None:
+        hash_table = [0] * 2 ** hash_bits
+
+    def insert(index: int) -> int:
+        """Insert the position and return the previous entry."""
+        hash_ = ((data[index] << 2 * shift) ^ (data[index + 1] << shift) ^
+                 data[index + 2]) & (2 ** hash_bits - 1)
+        previous = hash_table[hash_]
+        hash_table[hash_] = index & position_mask
+        return previous
+
+    tokens: List[Token] = []
+    index = 0
+    while index < len(data):
+        remaining = len(data) - index
+        length = 0
+        if remaining >= 3:
+            distance = (index - insert(index)) & position_mask
+            if 0 < distance <= min(index, search_buffer_size):
+                limit = min(max_match_length, remaining, input_buffer_size)
+                while (length < limit and
+                       data[index + length - distance] == data[index + length]):
+                    length += 1
+                if length < min_match_length and length != max_match_length:
+                    length = 0
+        if length == 0:
+            tokens.append(Literal(data[index]))
+            index += 1
+            continue
+        tokens.append(Match(distance, length))
+        # The datums, covered by the match, are inserted, too.
+        for skipped in range(index + 1, index + length):
+            if len(data) - skipped >= 3:
+                insert(skipped)
+        index += length
+    return tokens
+
+
+def lzss_bitwidths(input_buffer_size: int, search_buffer_size: int,
+                   max_match_length_user: int) -> Tuple[int, int]:
+    """Bits of match offset and length. See also calc_huffman_bitwidth()."""
+    def lb(size):
+        return (size - 1).bit_length()
+    length_bits = lb(min(input_buffer_size, max_match_length_user) + 1)
+    # At least 8 bit are needed to represent a literal.
+    offset_bits = max(lb(search_buffer_size + 1), 8 - length_bits)
+    return offset_bits, length_bits
+
+
+def token_to_int(token: Token, offset_bits: int, length_bits: int) -> int:
+    """Output word of the lzss module."""
+    width = offset_bits + length_bits
+    if isinstance(token, Literal):
+        # MSB: 0 (no match), literal data, rest is ignored
+        return token.value << (width - 8)
+    # MSB: 1 (match), match offset, match length
+    return (1 << width) + (token.offset << length_bits) + token.length
+
+
+################################################################################
+# huffman, huffman_block and stored
+################################################################################
+
+# RFC 1951, 3.2.5. Compressed blocks (length and distance codes)
+LENGTH_BASE = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35,
+               43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258]
+LENGTH_EXTRA = [0] * 8 + [1] * 4 + [2] * 4 + [3] * 4 + [4] * 4 + [5] * 4 + [0]
+DISTANCE_BASE = [1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193,
+                 257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145, 8193,
+                 12289, 16385, 24577]
+DISTANCE_EXTRA = [0, 0] + [bits // 2 for bits in range(28)]
+CODE_LENGTH_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14,
+                     1, 15]
+EOB = 256
+
+
+def length_symbol(length: int) -> int:
+    if length == 258:
+        return 28
+    return max(i for i, base in enumerate(LENGTH_BASE) if base <= length)
+
+
+def distance_symbol(distance: int) -> int:
+    return max(i for i, base in enumerate(DISTANCE_BASE) if base <= distance)
+
+
+def fixed_lengths() -> Tuple[List[int], List[int]]:
+    """RFC 1951, 3.2.6. Compression with fixed Huffman codes (BTYPE=01)"""
+    # The symbols 286 and 287 don't occur, but they are part of the code.
+    return [8] * 144 + [9] * 112 + [7] * 24 + [8] * 8, [5] * 30
+
+
+def canonical_codes(lengths: List[int]) -> List[int]:
+    """RFC 1951, 3.2.2. Use of Huffman coding in the "deflate" format"""
+    bl_count = [0] * 16
+    for length in lengths:
+        if length:
+            bl_count[length] += 1
+    next_code = [0] * 16
+    code = 0
+    for bits in range(1, 16):
+        code = (code + bl_count[bits - 1]) * 2
+        next_code[bits] = code
+    codes = []
+    for length in lengths:
+        codes.append(next_code[length] if length else 0)
+        if length:
+            next_code[length] += 1
+    return codes
+
+
+class BitWriter:
+    """Pack bits, starting with the least significant bit of each byte."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.value = 0
+        self.bits = 0
+
+    def lsb_first(self, value: int, bits: int):
+        self.value |= value << self.bits
+        self.bits += bits
+        while self.bits >= 8:
+            self.data.append(self.value & 0xFF)
+            self.value >>= 8
+            self.bits -= 8
+
+    def msb_first(self, value: int, bits: int):
+        """Huffman codes are packed starting with the most significant bit."""
+        self.lsb_first(int(f"{value:0{bits}b}"[::-1], 2) if bits else 0, bits)
+
+    def pad(self):
+        if self.bits % 8:
+            self.lsb_first(0, 8 - self.bits % 8)
+
+    def sync_flush(self):
+        """Empty, non-final stored block, which ends at a byte boundary."""
+        self.lsb_first(0, 3)
+        self.pad()
+        self.lsb_first(0xFFFF0000, 32)
+
+
+def _raw_length(token: Token) -> int:
+    return 1 if isinstance(token, Literal) else token.length
+
+
+def _write_tokens(writer: BitWriter, tokens: List[Token],
+                  literal_lengths: List[int], distance_lengths: List[int]):
+    literal_codes = canonical_codes(literal_lengths)
+    distance_codes = canonical_codes(distance_lengths)
+    for token in tokens:
+        if isinstance(token, Literal):
+            writer.msb_first(literal_codes[token.value],
+                             literal_lengths[token.value])
+            continue
+        symbol = length_symbol(token.length)
+        writer.msb_first(literal_codes[257 + symbol],
+                         literal_lengths[257 + symbol])
+        writer.lsb_first(token.length - LENGTH_BASE[symbol],
+                         LENGTH_EXTRA[symbol])
+        symbol = distance_symbol(token.offset)
+        writer.msb_first(distance_codes[symbol], distance_lengths[symbol])
+        writer.lsb_first(token.offset - DISTANCE_BASE[symbol],
+                         DISTANCE_EXTRA[symbol])
+    writer.msb_first(literal_codes[EOB], literal_lengths[EOB])
+
+
+def huffman_fixed(tokens: List[Token], final: bool = True) -> bytes:
+    """huffman.vhd: All tokens in a single block with fixed codes."""
+    writer = BitWriter()
+    writer.lsb_first(int(final) + 2, 3)
+    _write_tokens(writer, tokens, *fixed_lengths())
+    if not final:
+        writer.sync_flush()
+    writer.pad()
+    return bytes(writer.data)
+
+
+def code_lengths(frequencies: List[int], max_length: int,
+                 shift: int) -> Tuple[List[int], List[int], int]:
+    """Length limited Shannon code lengths of huffman_block.vhd.
+
+    Returns the code lengths, the frequencies including the dummy symbols
+    and the amount of passes to shorten the codes.
+    """
+    freq = list(frequencies)
+    used = sum(1 for datum in freq if datum)
+    # Decoders expect at least two codes per tree. Add dummy symbols if needed.
+    for dummy in (0, 1):
+        if used < 2 and freq[dummy] == 0:
+            freq[dummy] = 1
+            used += 1
+    total = sum(freq)
+    adjust = total // 2 ** shift + 1
+    total_adjusted = total + used * adjust
+
+    lengths = [0] * len(freq)
+    for symbol, datum in enumerate(freq):
+        if datum:
+            length = 0
+            while (datum + adjust) * 2 ** length < total_adjusted:
+                length += 1
+            lengths[symbol] = max(1, length)
+    kraft = sum(2 ** (max_length - length) for length in lengths if length)
+
+    # Shorten codes as long as the Kraft inequality allows it.
+    passes = 0
+    changed = True
+    while changed:
+        changed = False
+        passes += 1
+        for symbol, length in enumerate(lengths):
+            if (length > 1 and
+                    kraft + 2 ** (max_length - length) <= 2 ** max_length):
+                kraft += 2 ** (max_length - length)
+                lengths[symbol] -= 1
+                changed = True
+    return lengths, freq, passes
+
+
+def run_length_encode(lengths: List[int]) -> List[Tuple[int, int]]:
+    """Code length symbols and their extra value."""
+    encoded = []
+    index = 0
+    while index < len(lengths):
+        value = lengths[index]
+        run = 1
+        while index + run < len(lengths) and lengths[index + run] == value:
+            run += 1
+        index += run
+
+        first = True
+        while run:
+            if value == 0 and run >= 11:
+                count = min(run, 138)
+                encoded.append((18, count - 11))
+            elif value == 0 and run >= 3:
+                count = run
+                encoded.append((17, count - 3))
+            elif value != 0 and not first and run >= 3:
+                count = min(run, 6)
+                encoded.append((16, count - 3))
+            else:
+                count = 1
+                encoded.append((value, 0))
+            first = False
+            run -= count
+    return encoded
+
+
+@dataclasses.dataclass
+class BlockInfo:
+    """Statistics of a block, i. e. for the cycle estimation."""
+
+    btype: int
+    tokens: int
+    matches: int
+    raw_bytes: int
+    bits: int
+    tree_cycles: int = 0
+
+
+def _encode_block(writer: BitWriter, tokens: List[Token], raw: List[int],
+                  btype: int, stored_fallback: int, final: bool) -> BlockInfo:
+    literal_freq = [0] * 286
+    distance_freq = [0] * 30
+    extra_bits = 0
+    for token in tokens:
+        if isinstance(token, Literal):
+            literal_freq[token.value] += 1
+        else:
+            symbol = length_symbol(token.length)
+            literal_freq[257 + symbol] += 1
+            extra_bits += LENGTH_EXTRA[symbol]
+            symbol = distance_symbol(token.offset)
+            distance_freq[symbol] += 1
+            extra_bits += DISTANCE_EXTRA[symbol]
+    literal_freq[EOB] = 1
+    matches = sum(1 for token in tokens if isinstance(token, Match))
+
+    tree_cycles = 0
+    if btype == 1:
+        literal_lengths, distance_lengths = fixed_lengths()
+        size = 3 + extra_bits + sum(
+            freq * length for freq, length in
+            zip(literal_freq + distance_freq,
+                literal_lengths + distance_lengths))
+    else:
+        literal_lengths, literal_freq, passes_lit = code_lengths(
+            literal_freq, 15, 14)
+        distance_lengths, distance_freq, passes_dist = code_lengths(
+            distance_freq, 15, 14)
+        hlit = max(i for i, length in enumerate(literal_lengths) if length) + 1
+        hdist = max(
+            i for i, length in enumerate(distance_lengths) if length) + 1
+        sequence = run_length_encode(literal_lengths[:hlit] +
+                                     distance_lengths[:hdist])
+        cl_freq = [0] * 19
+        for symbol, _ in sequence:
+            cl_freq[symbol] += 1
+        cl_lengths, cl_freq, passes_cl = code_lengths(cl_freq, 7, 6)
+        hclen = max([4] + [i + 1 for i in range(4, 19)
+                           if cl_lengths[CODE_LENGTH_ORDER[i]]])
+        cl_extra = {16: 2, 17: 3, 18: 7}
+        tree_bits = sum(
+            freq * length for freq, length in
+            zip(literal_freq + distance_freq + cl_freq,
+                literal_lengths + distance_lengths + cl_lengths))
+        extra_bits += sum(cl_extra.get(symbol, 0) for symbol, _ in sequence)
+        size = 3 + 5 + 5 + 4 + 3 * hclen + tree_bits + extra_bits
+        # prepare, lengths, shorten passes, next code and assign per tree
+        tree_cycles = sum(
+            symbols * (2 + passes) + 2 for symbols, passes in
+            ((286, passes_lit), (30, passes_dist), (19, passes_cl)))
+        tree_cycles += hlit + hdist + 2 * len(sequence)
+
+    start = len(writer.data) * 8 + writer.bits
+    if stored_fallback and 3 + 7 + 32 + 8 * len(raw) < size:
+        writer.lsb_first(int(final), 3)
+        writer.pad()
+        writer.lsb_first(len(raw) + ((0xFFFF - len(raw)) << 16), 32)
+        for datum in raw:
+            writer.lsb_first(datum, 8)
+        btype = 0
+    else:
+        writer.lsb_first(int(final) + btype * 2, 3)
+        if btype == 2:
+            writer.lsb_first(hlit - 257, 5)
+            writer.lsb_first(hdist - 1, 5)
+            writer.lsb_first(hclen - 4, 4)
+            for index in range(hclen):
+                writer.lsb_first(cl_lengths[CODE_LENGTH_ORDER[index]], 3)
+            cl_codes = canonical_codes(cl_lengths)
+            for symbol, extra in sequence:
+                writer.msb_first(cl_codes[symbol], cl_lengths[symbol])
+                writer.lsb_first(extra, cl_extra.get(symbol, 0))
+        _write_tokens(writer, tokens, literal_lengths, distance_lengths)
+    return BlockInfo(btype, len(tokens), matches, len(raw),
+                     len(writer.data) * 8 + writer.bits - start, tree_cycles)
+
+
+def huffman_block(tokens: List[Token], data: List[int], btype: int,
+                  block_size: int, stored_fallback: int,
+                  max_match_length: int, final: bool = True,
+                  info: Optional[List[BlockInfo]] = None) -> bytes:
+    """huffman_block.vhd: Blocks of up to block_size tokens."""
+    raw_addr_width = min(16, max(11, (block_size - 1).bit_length() + 3))
+    max_raw_block = min(2 ** 16 - 1, 2 ** raw_addr_width - 1024)
+
+    # Split the tokens into blocks.
+    blocks: List[Tuple[List[Token], List[int]]] = []
+    block: List[Token] = []
+    position = 0
+    raw_start = 0
+    for token in tokens:
+        block.append(token)
+        position += _raw_length(token)
+        # For the stored fallback, the next match has to fit into the block.
+        if (len(block) == block_size or
+                (stored_fallback and
+                 position - raw_start + max_match_length > max_raw_block)):
+            blocks.append((block, data[raw_start:position]))
+            block = []
+            raw_start = position
+    # The last block is sent at the flush. It can be empty.
+    blocks.append((block, data[raw_start:position]))
+
+    writer = BitWriter()
+    for index, (block, raw) in enumerate(blocks):
+        last = index == len(blocks) - 1
+        block_info = _encode_block(writer, block, raw, btype,
+                                   stored_fallback, final and last)
+        if info is not None:
+            info.append(block_info)
+    if not final:
+        writer.sync_flush()
+    writer.pad()
+    return bytes(writer.data)
+
+
+def stored(data: List[int], block_size: int, final: bool = True) -> bytes:
+    """stored.vhd: Blocks of block_size bytes and the remaining bytes."""
+    output = bytearray()
+    starts = range(0, len(data), block_size) if data else [0]
+    for start in starts:
+        block = data[start:start + block_size]
+        last = start + block_size >= len(data)
+        output.append(int(final and last))
+        output.extend(len(block).to_bytes(2, "little"))
+        output.extend((0xFFFF - len(block)).to_bytes(2, "little"))
+        output.extend(block)
+    return bytes(output)
+
+
+def deflate(data: List[int], generics: Generics, final: bool = True,
+            info: Optional[List[BlockInfo]] = None) -> bytes:
+    """deflate.vhd: Select the implementation based on the generics."""
+    if generics.btype == 0:
+        return stored(data, generics.block_size, final)
+    if generics.window_type == 0:
+        tokens = lzss(data, generics.input_buffer_size,
+                      generics.search_buffer_size,
+                      generics.max_match_length_user, generics.match_mode)
+    else:
+        tokens = lzss_hash(data, generics.input_buffer_size,
+                           generics.search_buffer_size,
+                           generics.max_match_length_user)
+    if generics.btype == 1 and not generics.stored_fallback:
+        encoded = huffman_fixed(tokens, final)
+        if info is not None:
+            matches = sum(1 for token in tokens if isinstance(token, Match))
+            info.append(BlockInfo(1, len(tokens), matches, len(data),
+                                  8 * len(encoded)))
+        return encoded
+    # The match length is limited by the bitwidth of the lzss output.
+    max_match_length = 2 ** lzss_bitwidths(
+        generics.input_buffer_size, generics.search_buffer_size,
+        generics.max_match_length_user)[1] - 1
+    return huffman_block(tokens, data, generics.btype, generics.block_size,
+                         generics.stored_fallback, max_match_length, final,
+                         info)
+
+
+################################################################################
+# zlib and png_encoder
+################################################################################
+
+
+def lane_sizes(generics: Generics) -> List[int]:
+    """Bytes per lane. The last lane gets the remaining rows."""
+    size = generics.img_height * (generics.row_bytes + 1)
+    lane_size = (generics.img_height // generics.lanes *
+                 (generics.row_bytes + 1))
+    sizes = [lane_size] * (generics.lanes - 1)
+    return sizes + [size - sum(sizes)]
+
+
+def zlib_stream(data: List[int], generics: Generics,
+                info: Optional[List[List[BlockInfo]]] = None) -> bytes:
+    """zlib.vhd: Header, deflate stream of each lane and adler32."""
+    output = bytearray(b"\x78\x01")
+    start = 0
+    for lane, size in enumerate(lane_sizes(generics)):
+        lane_info: List[BlockInfo] = []
+        output.extend(deflate(data[start:start + size], generics,
+                              final=lane == generics.lanes - 1,
+                              info=lane_info))
+        if info is not None:
+            info.append(lane_info)
+        start += size
+    output.extend(zlib.adler32(bytes(data)).to_bytes(4, "big"))
+    return bytes(output)
+
+
+def chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (len(data).to_bytes(4, "big") + chunk_type + data +
+            zlib.crc32(chunk_type + data).to_bytes(4, "big"))
+
+
+def png_header(generics: Generics) -> bytes:
+    """PNG signature and IHDR chunk."""
+    ihdr = (generics.img_width.to_bytes(4, "big") +
+            generics.img_height.to_bytes(4, "big") +
+            bytes([generics.bit_depth, generics.color_type, 0, 0, 0]))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr)
+
+
+def png_encoder(data: List[int], generics: Generics,
+                palette: Optional[bytes] = None) -> bytes:
+    """The png file, i. e. with the header at the start.
+
+    palette contains the red, green and blue value of each palette entry.
+    It's only used for indexed-color.
+    """
+    plte = b""
+    if generics.color_type == 3:
+        if palette is None or len(palette) != 3 * generics.palette_size:
+            raise ValueError(f"{generics.palette_size} palette entries needed")
+        plte = chunk(b"PLTE", palette)
+    filtered = filter_image(data, generics)
+    idat = zlib_stream(filtered, generics)
+    if generics.idat_chunk_size == 0:
+        chunks = [idat]
+    else:
+        chunks = [idat[start:start + generics.idat_chunk_size]
+                  for start in range(0, len(idat), generics.idat_chunk_size)]
+    return (png_header(generics) + plte +
+            b"".join(chunk(b"IDAT", datum) for datum in chunks) +
+            chunk(b"IEND", b""))
+
+
+def estimate_cycles(data: List[int], generics: Generics) -> int:
+    """Roughly estimate the clock cycles from the first input to the last output.
+
+    This isn't cycle-accurate. Stalls between the modules and the latencies
+    are approximated. The estimation considers:
+    - bit_packer: one sample per cycle
+    - row_filter: one byte per cycle,
+      twice as long for the adaptive row filter
+    - huffman: one token and one output byte per cycle
+    - huffman_block: collect the tokens of a block, then encode it
+    - stored, zlib and png_encoder: one output byte per cycle
+    """
+    filtered = filter_image(data, generics)
+    info: List[List[BlockInfo]] = []
+    idat_length = len(zlib_stream(filtered, generics, info))
+    input_rate = 2 if generics.row_filter_type == 5 else 1
+    if generics.bit_depth < 8:
+        input_rate = max(input_rate, 8 // generics.bit_depth)
+
+    end = 0
+    start = 0
+    for lane_info, size in zip(info, lane_sizes(generics)):
+        # The lanes get their input one after the other.
+        start += input_rate * size
+        if generics.btype == 0:
+            cycles = size + 5 * max(1, -(-size // generics.block_size))
+        elif generics.btype == 1 and not generics.stored_fallback:
+            block = lane_info[0]
+            cycles = max(block.tokens, block.bits // 8)
+        else:
+            # Collecting is limited by the input, encoding isn't overlapped.
+            cycles = sum(
+                block.tree_cycles +
+                max(block.bits // 8,
+                    2 * block.tokens + 3 * block.matches + block.raw_bytes *
+                    (block.btype == 0)) + 8
+                for block in lane_info)
+        # lzss pipeline and flush
+        cycles += generics.input_buffer_size + 8
+        end = max(end, start + cycles)
+
+    # zlib: header and adler32, the lanes get merged
+    end += 6 + 20 * (generics.lanes - 1)
+    if generics.color_type == 3:
+        end += 12 + 3 * generics.palette_size
+    if generics.idat_chunk_size == 0:
+        # The headers are sent after the data.
+        end = max(end, idat_length) + 44 + 16
+    else:
+        chunks = max(1, -(-idat_length // generics.idat_chunk_size))
+        end = max(end, 33 + idat_length + 12 * chunks) + 12
+    return end
+
+
+if __name__ == "__main__":
+    import random
+
+    # self check: the output is valid and can be decoded by zlib
+    random.seed(42)
+    for trial in range(100):
+        color_type = random.choice((0, 2, 3, 4, 6))
+        bit_depth = random.choice({0: (1, 2, 4, 8, 16), 3: (1, 2, 4, 8)}.get(
+            color_type, (8, 16)))
+        generics = Generics(
+            img_width=random.randint(1, 20), img_height=random.randint(1, 12),
+            color_type=color_type, bit_depth=bit_depth,
+            palette_size=random.randint(1, 2 ** min(bit_depth, 8)),
+            input_buffer_size=random.choice((3, 12, 40)),
+            search_buffer_size=random.choice((2, 12, 300)),
+            max_match_length_user=random.choice((3, 7, 258)),
+            match_mode=random.randint(0, 2), window_type=random.randint(0, 1),
+            btype=random.randint(0, 2),
+            block_size=random.choice((2, 16, 1024)),
+            stored_fallback=random.randint(0, 1),
+            lanes=random.randint(1, 3),
+            row_filter_type=random.randint(0, 5),
+            idat_chunk_size=random.choice((0, 16, 8192)))
+        generics.lanes = min(generics.lanes, generics.img_height)
+        max_value = 255 if bit_depth >= 8 else 2 ** bit_depth - 1
+        if color_type == 3:
+            max_value = min(max_value, generics.palette_size - 1)
+        image = [random.choice((0, 1, random.randint(0, max_value)))
+                 for _ in range(generics.img_height * generics.input_row_bytes)]
+        palette = bytes(random.randint(0, 255)
+                        for _ in range(3 * generics.palette_size))
+        png = png_encoder(image, generics, palette)
+        filtered = filter_image(image, generics)
+        assert len(filtered) == generics.img_height * (generics.row_bytes + 1)
+        idat = zlib_stream(filtered, generics)
+        assert zlib.decompress(idat) == bytes(filtered), generics
+        assert estimate_cycles(image, generics) > 0
+
+    # A full 32 KiB window can be referenced by lzss_hash.
+    sequence = list(range(0x41, 0x51))
+    data = sequence + [0] * (32768 - len(sequence)) + sequence
+    assert Match(32768, 8) in lzss_hash(data, 12, 32768, 8)
+    print("ok")
@@ -1,42 +1,249 @@
 #!/usr/bin/env python3
 
-"""Run all unit tests, contained by the subfolders."""
+"""Run all unit tests, contained by the subfolders.
 
+The tests are started longest first, based on the wall times of earlier runs
+(recorded in "gen/test_times.json"). Thus the long simulations don't start
+last and keep a single worker busy, while the others are idle already.
+
+VUnit runs the tests in the order, in which the testbenches and their
+configurations were added. Thus the configurations of the "run.py" scripts
+are collected first. Only the configurations of the selected shard are added
+to VUnit, in the scheduled order.
+
+With the gcc and llvm backends of GHDL, each testbench is elaborated only once.
+All configurations run the same executable, since their generics are set at
+runtime and the stimuli are loaded from files.
+
+Examples:
+    ./run_all.py -p4  # all tests ("full" tier)
+    ./run_all.py -p4 --tier quick  # skip the long simulations
+    ./run_all.py -p4 --shard 2/3  # the second of three equally long shards
+"""
+
+import dataclasses
 from glob import glob
 import importlib.util
+import json
 import os
+from os.path import join, dirname, isfile
 import resource
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import random
-from vunit import VUnit
+from vunit import VUnit, VUnitCLI
+from vunit.ostools import Process
+from vunit.sim_if.ghdl import GHDLInterface
+
+
+TIMES_FILE = join(dirname(__file__), "gen", "test_times.json")
+
+# Attribute of the tests, which are only run in the full tier.
+FULL_TIER_ATTRIBUTE = ".full"
+
 
+def add_libraries(prj, testbenches: Optional[Sequence[str]] = None):
+    """Add the sources and testbenches. Return the testbench library.
 
-def create_test_suites(prj):
-    """Collect the test and run them."""
+    The testbenches are given by their entity names and added in this order.
+    By default, all testbenches are added.
+    """
     root = os.path.dirname(__file__)
 
-    testbenches = glob(os.path.join(root, "*", "tb_*.vhd"))
+    if testbenches is None:
+        testbenches = sorted(os.path.basename(filename)[:-len(".vhd")]
+                             for filename in glob(join(root, "*", "tb_*.vhd")))
     sim_lib = prj.add_library("sim")
     sim_lib.add_source_files("vunit_common_pkg.vhd")
-    sim_lib.add_source_files(testbenches)
+    for testbench in testbenches:
+        sim_lib.add_source_files(join(root, "*", f"{testbench}.vhd"))
 
     util_lib = prj.add_library("util")
     util_lib.add_source_files("../src/util/*.vhd")
     png_lib = prj.add_library("png_lib")
     png_lib.add_source_files("../src/*.vhd")
 
+    # avoid error "type of a shared variable must be a protected type"
+    prj.set_compile_option("ghdl.a_flags", ["-frelaxed"])
+    prj.set_sim_option("ghdl.elab_flags", ["-frelaxed"])
+
+    # The simulator interface is created, when the tests are run.
+    # pylint: disable=protected-access
+    if prj._simulator_class is GHDLInterface:
+        prj._simulator_class = ReusingGHDLInterface
+    return sim_lib
+
+
+class ReusingGHDLInterface(GHDLInterface):
+    """GHDL, which elaborates each testbench only once.
+
+    VUnit elaborates the testbench for each test. With the gcc and llvm
+    backends, this means linking an executable, which often takes longer
+    than the simulation. The top-level generics can be set at runtime. Thus
+    the executable of the first test is reused by all tests of the testbench.
+    The mcode backend has no executable and is run by VUnit as usual.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._executables: Dict[Tuple, str] = {}
+        self._elaboration_locks: Dict[Tuple, threading.Lock] = {}
+
+    def simulate(self, output_path, test_suite_name, config, elaborate_only):
+        if (not self._has_output_flag() or elaborate_only or self._gui or
+                self._gtkwave_fmt is not None or
+                config.sim_options.get("enable_coverage", False)):
+            return super().simulate(output_path, test_suite_name, config, elaborate_only)
+
+        key = (config.library_name, config.entity_name, config.architecture_name,
+               tuple(config.sim_options.get("ghdl.elab_flags", [])))
+        with self._lock:
+            elaboration_lock = self._elaboration_locks.setdefault(key, threading.Lock())
+
+        # Get the elaboration command and the runtime arguments of this test.
+        script_path = join(output_path, self.name)
+        elaborate = self._get_command(config, script_path, elaborate_only=True,
+                                      ghdl_e=True, wave_file=None)
+        with open(join(script_path, "args.json")) as infile:
+            args = json.load(infile)
+
+        try:
+            with elaboration_lock:
+                if key not in self._executables:
+                    Process(elaborate).consume_output()
+                    self._executables[key] = args["bin"]
+            Process([self._executables[key]] + args["sim"]).consume_output()
+        except Process.NonZeroExitCode:
+            return False
+        return True
+
+
+@dataclasses.dataclass
+class Config:
+    """Arguments of a call to add_config()."""
+
+    testbench: str
+    kwargs: Dict
+
+    @property
+    def test_name(self) -> str:
+        # The testbenches have no explicit test cases. Thus VUnit names the
+        # test like the configuration.
+        return f"sim.{self.testbench}.{self.kwargs['name']}"
+
+    @property
+    def full_tier(self) -> bool:
+        return FULL_TIER_ATTRIBUTE in (self.kwargs.get("attributes") or {})
+
+
+class RecordedTestBench:
+    """Testbench, which only records its configurations."""
+
+    def __init__(self, name: str, configs: List[Config]):
+        self.name = name
+        self._configs = configs
+
+    def add_config(self, **kwargs):
+        self._configs.append(Config(self.name, kwargs))
+
+
+class ConfigRecorder:
+    """Collects the configurations of the "run.py" scripts.
+
+    It provides the part of the VUnit library interface, which is used by the
+    scripts. The configurations can be added to VUnit later, in any order.
+    """
+
+    def __init__(self):
+        self.configs: List[Config] = []
+
+    def entity(self, name: str) -> RecordedTestBench:
+        return RecordedTestBench(name, self.configs)
+
+
+def collect_configs() -> List[Config]:
+    """Run the "run.py" scripts and return their configurations."""
+    root = os.path.dirname(__file__)
+    recorder = ConfigRecorder()
+
     # TODO: add code coverage
 
-    run_scripts = glob(os.path.join(root, "*", "run.py"))
+    run_scripts = sorted(glob(os.path.join(root, "*", "run.py")))
     for run_script in run_scripts:
         spec = importlib.util.spec_from_file_location("run", run_script)
         mod = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(mod)
-        mod.create_test_suite(sim_lib)
+        mod.create_test_suite(recorder)
+    return recorder.configs
+
+
+def add_configs(prj, configs: List[Config]):
+    """Add the configurations to VUnit, in the given order.
+
+    VUnit runs the tests grouped by testbench. Thus the testbenches are added
+    in the order of their first configuration.
+    """
+    testbenches = list(dict.fromkeys(config.testbench for config in configs))
+    sim_lib = add_libraries(prj, testbenches)
+    for config in configs:
+        sim_lib.entity(config.testbench).add_config(**config.kwargs)
 
-    # avoid error "type of a shared variable must be a protected type"
-    prj.set_compile_option("ghdl.a_flags", ["-frelaxed"])
-    prj.set_sim_option("ghdl.elab_flags", ["-frelaxed"])
+
+def load_times() -> Dict[str, float]:
+    if not isfile(TIMES_FILE):
+        return {}
+    with open(TIMES_FILE) as infile:
+        return json.load(infile)
+
+
+def record_times(results):
+    """Update the wall times of the tests, which were run."""
+    times = load_times()
+    for name, test in results.get_report().tests.items():
+        if test.status != "skipped":
+            times[name] = round(test.time, 3)
+
+    os.makedirs(dirname(TIMES_FILE), exist_ok=True)
+    # Write to a temporary file first, since shards may run in parallel.
+    filename_tmp = f"{TIMES_FILE}.{os.getpid()}"
+    with open(filename_tmp, "w") as outfile:
+        json.dump(times, outfile, indent=2, sort_keys=True)
+    os.replace(filename_tmp, TIMES_FILE)
+
+
+def schedule(configs: List[Config], times: Dict[str, float],
+             shard: Tuple[int, int]) -> List[Config]:
+    """Sort the configurations longest first and select the ones of a shard.
+
+    Tests without recorded time are assumed to be as long as the longest
+    known test. The shards are filled greedily, i. e. each configuration is
+    assigned to the shard with the least total time so far.
+    """
+    default_time = max(times.values(), default=1.0)
+
+    def duration(config: Config) -> float:
+        return times.get(config.test_name, default_time)
+
+    ordered = sorted(configs, key=lambda config: (-duration(config), config.test_name))
+
+    index, count = shard
+    loads = [0.0] * count
+    selected = []
+    for config in ordered:
+        shortest = loads.index(min(loads))
+        loads[shortest] += duration(config)
+        if shortest == index - 1:
+            selected.append(config)
+    return selected
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    index, count = (int(number) for number in value.split("/"))
+    if not 1 <= index <= count:
+        raise ValueError(f"invalid shard {value}")
+    return index, count
 
 
 if __name__ == "__main__":
@@ -49,7 +256,19 @@ if __name__ == "__main__":
     resource.setrlimit(resource.RLIMIT_STACK, (resource.RLIM_INFINITY,
                                                resource.RLIM_INFINITY))
 
-    PRJ = VUnit.from_argv()
+    CLI = VUnitCLI()
+    CLI.parser.add_argument(
+        "--tier", choices=("quick", "full"), default="full",
+        help=f"quick: skip the tests with the attribute {FULL_TIER_ATTRIBUTE}")
+    CLI.parser.add_argument(
+        "--shard", type=parse_shard, default=(1, 1),
+        help="run only the i-th of n shards of about the same duration, e. g. 2/3")
+    ARGS = CLI.parse_args()
+
+    CONFIGS = [config for config in collect_configs()
+               if ARGS.tier == "full" or not config.full_tier]
+
+    PRJ = VUnit.from_args(args=ARGS, compile_builtins=False)
     PRJ.add_vhdl_builtins()
-    create_test_suites(PRJ)
-    PRJ.main()
+    add_configs(PRJ, schedule(CONFIGS, load_times(), ARGS.shard))
+    PRJ.main(post_run=record_times)
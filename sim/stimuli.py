@@ -0,0 +1,153 @@
+"""Deterministic image stimuli for the testbenches and the benchmark.
+
+The images are generated by numpy array operations. Each image is defined by
+its pattern, size, sample range and seed. It is cached as raw file in
+"sim/gen/stimuli", keyed by a hash of these parameters. Thus large images are
+generated only once and shared between configurations and runs.
+
+Patterns:
+    increment: Incrementing samples, wrapped at the maximum value.
+    ones: All samples are one (or zero, if the maximum value is zero).
+    random: Uniformly distributed samples.
+    gradient: Smooth horizontal and vertical ramps, shifted per channel.
+    tiles: A random tile, repeated over the image.
+    noise: Uniformly distributed samples of a given entropy in bit per sample.
+    sensor: A smooth scene with vignetting, column fixed-pattern noise and
+        shot noise, similar to the raw output of an image sensor.
+"""
+
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+from os.path import join, dirname
+from typing import Optional
+
+import numpy as np
+
+
+CACHE_DIR = join(dirname(__file__), "gen", "stimuli")
+
+PATTERNS = ("increment", "ones", "random", "gradient", "tiles", "noise",
+            "sensor")
+
+
+@dataclasses.dataclass(frozen=True)
+class Stimulus:
+    """Parameters of an image. The samples are in the range [0, max_value]."""
+
+    pattern: str
+    width: int
+    height: int
+    depth: int = 1  # samples per pixel
+    bit_depth: int = 8
+    max_value: Optional[int] = None  # default: maximum of the bit depth
+    seed: int = 0
+    entropy: float = 8.0  # only "noise", bit per sample
+    tile_size: int = 8  # only "tiles"
+
+    def __post_init__(self):
+        if self.pattern not in PATTERNS:
+            raise ValueError(f"invalid pattern {self.pattern}")
+
+    @property
+    def maximum(self) -> int:
+        if self.max_value is None:
+            return 2 ** self.bit_depth - 1
+        return self.max_value
+
+    @property
+    def dtype(self) -> np.dtype:
+        # Samples of 16 bit are stored MSB first, as they are sent to the
+        # png encoder.
+        return np.dtype(">u2") if self.bit_depth == 16 else np.dtype(np.uint8)
+
+    @property
+    def key(self) -> str:
+        parameters = json.dumps(dataclasses.asdict(self), sort_keys=True)
+        return hashlib.sha256(parameters.encode()).hexdigest()[:16]
+
+    @property
+    def filename(self) -> str:
+        return join(CACHE_DIR, f"{self.pattern}_{self.width}x{self.height}_"
+                               f"{self.key}.raw")
+
+    def generate(self) -> np.ndarray:
+        """Generate the image of the shape (height, width, depth)."""
+        shape = (self.height, self.width, self.depth)
+        rng = np.random.default_rng(self.seed)
+        maximum = self.maximum
+        if self.pattern == "increment":
+            data = np.arange(np.prod(shape)) % (maximum + 1)
+        elif self.pattern == "ones":
+            data = np.full(shape, min(1, maximum))
+        elif self.pattern == "random":
+            data = rng.integers(0, maximum, size=shape, endpoint=True)
+        elif self.pattern == "gradient":
+            y, x, channel = np.indices(shape)
+            phase = (x / max(1, self.width - 1) + y / max(1, self.height - 1) +
+                     channel / self.depth) / 2
+            data = np.rint(np.abs(phase % 1 * 2 - 1) * maximum)
+        elif self.pattern == "tiles":
+            tile = rng.integers(0, maximum, endpoint=True, size=(
+                self.tile_size, self.tile_size, self.depth))
+            repeats = (-(-self.height // self.tile_size),
+                       -(-self.width // self.tile_size), 1)
+            data = np.tile(tile, repeats)[:self.height, :self.width]
+        elif self.pattern == "noise":
+            # A uniform distribution of 2 ** entropy symbols, spread over the
+            # whole sample range.
+            symbols = int(min(maximum + 1, max(1, round(2 ** self.entropy))))
+            data = rng.integers(0, symbols, size=shape)
+            data = data * maximum // max(1, symbols - 1)
+        else:
+            data = self._sensor(rng)
+        return data.reshape(shape).astype(self.dtype)
+
+    def _sensor(self, rng: np.random.Generator) -> np.ndarray:
+        scale = max(1, self.width - 1, self.height - 1)
+        y, x = np.mgrid[0:self.height, 0:self.width] / scale
+        scene = 0.3 + 0.4 * x + 0.2 * np.sin(6 * y)
+        for _ in range(3):
+            center_x, center_y, radius = rng.uniform(0.1, 0.9, size=3)
+            scene += 0.3 * np.exp(-((x - center_x) ** 2 + (y - center_y) ** 2) /
+                                  (0.1 * radius) ** 2)
+        center_x = (self.width - 1) / 2 / scale
+        center_y = (self.height - 1) / 2 / scale
+        vignetting = 1 - 0.5 * ((x - center_x) ** 2 + (y - center_y) ** 2)
+        signal = (scene * vignetting)[..., np.newaxis] * rng.uniform(
+            0.7, 1.0, size=self.depth)
+
+        column_offset = rng.normal(0, 0.005, size=(1, self.width, 1))
+        data = rng.poisson(np.clip(signal, 0, 1) * 1000) / 1000 + column_offset
+        return np.rint(np.clip(data, 0, 1) * self.maximum)
+
+
+@functools.lru_cache(maxsize=16)
+def load(stimulus: Stimulus) -> np.ndarray:
+    """Load the image from the cache. Generate it, if it isn't cached yet.
+
+    The returned array is shared between the callers. Thus it is read-only.
+    """
+    shape = (stimulus.height, stimulus.width, stimulus.depth)
+    data = None
+    if os.path.isfile(stimulus.filename):
+        data = np.fromfile(stimulus.filename, dtype=stimulus.dtype)
+        data = data.reshape(shape) if data.size == np.prod(shape) else None
+
+    if data is None:
+        data = stimulus.generate()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first, since the tests may run in parallel.
+        filename_tmp = f"{stimulus.filename}.{os.getpid()}"
+        data.tofile(filename_tmp)
+        os.replace(filename_tmp, stimulus.filename)
+    data.flags.writeable = False
+    return data
+
+
+def to_bytes(stimulus: Stimulus) -> bytes:
+    """The image as it is sent to the png encoder: row by row, pixel by pixel.
+    Samples of 16 bit are sent MSB first."""
+    return load(stimulus).tobytes()
@@ -5,9 +5,12 @@ library ieee;
 library util;
   use util.png_pkg.all;
 
+-- A word of C_INPUT_BITWIDTH bits is processed in each cycle.
+-- The first byte of a word is in the most significant bits.
+
 entity adler32 is
   generic (
-    C_INPUT_BITWIDTH : integer range 8 to 8 := 8
+    C_INPUT_BITWIDTH : integer range 8 to 64 := 8
   );
   port (
     isl_clk   : in    std_logic;
@@ -20,24 +23,27 @@ end entity adler32;
 
 architecture behavioral of adler32 is
 
-  signal isl_valid_d1 : std_logic;
-  signal islv_data_d1 : std_logic_vector(islv_data'range);
-
-  type t_states is (CALC_S1, CALC_S2);
+  constant C_ADLER_BASE : integer := 65521;
+  constant C_BYTES      : integer := C_INPUT_BITWIDTH / 8;
 
-  signal state : t_states := CALC_S1;
+  -- s1 is always reduced. s2 is only reduced partially by folding:
+  -- 2 ** 16 mod 65521 = 15, thus x = 2 ** 16 * high + low is congruent to 15 * high + low.
+  -- The final reduction is done at the output.
+  signal int_s1 : integer range 0 to C_ADLER_BASE - 1 := 1;
+  signal int_s2 : integer range 0 to 2 ** 17 - 1      := 0;
 
-  signal int_s1                     : integer range 0 to 2 ** 16 - 1;
-  signal slv_current_adler_checksum : std_logic_vector(oslv_data'range) := (others => '0');
+  signal int_s2_reduced : integer range 0 to C_ADLER_BASE - 1;
 
 begin
 
   proc_adler32 : process (isl_clk) is
 
-    variable v_data_in : std_logic_vector(islv_data'range);
-    variable v_int_s2  : integer range 0 to 2 ** 16 - 1;
-    variable v_sum1    : integer range 0 to 2 ** 17 - 1;
-    variable v_sum2    : integer range 0 to 2 ** 17 - 1;
+    -- s1 = s1 + b_1 + ... + b_n
+    -- s2 = s2 + n * s1 + n * b_1 + (n - 1) * b_2 + ... + b_n
+    variable v_int_sum          : integer range 0 to C_BYTES * 255;
+    variable v_int_weighted_sum : integer range 0 to C_BYTES * (C_BYTES + 1) / 2 * 255;
+    variable v_int_s1           : integer range 0 to C_ADLER_BASE + C_BYTES * 255;
+    variable v_uns_s2           : unsigned(19 downto 0);
 
   begin
 
@@ -48,58 +54,38 @@ begin
       -- TODO: Check this formally via PSL.
       assert not (isl_valid = '1' and isl_start = '1');
       if (isl_start = '1') then
-        slv_current_adler_checksum <= x"00000001";
-      end if;
-
-      -- Incoming data can be processed every second cycle.
-      assert not (isl_valid = '1' and isl_valid_d1 = '1');
-      isl_valid_d1 <= isl_valid;
-      islv_data_d1 <= islv_data;
-
-      case state is
-
-        when CALC_S1 =>
+        int_s1 <= 1;
+        int_s2 <= 0;
+      elsif (isl_valid = '1') then
+        v_int_sum          := 0;
+        v_int_weighted_sum := 0;
 
-          if (isl_valid = '1') then
-            v_data_in := islv_data;
-            state     <= CALC_S2;
-          elsif (isl_valid_d1 = '1') then
-            v_data_in := islv_data_d1;
-            state     <= CALC_S2;
-          end if;
+        for byte in 1 to C_BYTES loop
 
-          v_sum1 := to_integer(unsigned(slv_current_adler_checksum(15 downto 0))) +
-                    to_integer(unsigned(get_byte(v_data_in, 1)));
+          v_int_sum          := v_int_sum + to_integer(unsigned(get_byte(islv_data, byte)));
+          v_int_weighted_sum := v_int_weighted_sum + byte * to_integer(unsigned(get_byte(islv_data, byte)));
 
-          -- Calculate the modulo manually, since it uses less resources and yields better timing.
-          if (v_sum1 < 65521) then
-            int_s1 <= v_sum1;
-          else
-            int_s1 <= v_sum1 - 65521;
-          end if;
+        end loop;
 
-        when CALC_S2 =>
-
-          v_sum2 := int_s1 + to_integer(unsigned(slv_current_adler_checksum(31 downto 16)));
-
-          if (v_sum2 < 65521) then
-            v_int_s2 := v_sum2;
-          elsif (v_sum2 < 65521 * 2) then
-            v_int_s2 := v_sum2 - 65521;
-          else
-            v_int_s2 := v_sum2 - 65521 * 2;
-          end if;
-
-          slv_current_adler_checksum <= std_logic_vector(to_unsigned(v_int_s2, 16)) &
-                                        std_logic_vector(to_unsigned(int_s1, 16));
-          state                      <= CALC_S1;
-
-      end case;
+        v_int_s1 := int_s1 + v_int_sum;
+        if (v_int_s1 < C_ADLER_BASE) then
+          int_s1 <= v_int_s1;
+        else
+          int_s1 <= v_int_s1 - C_ADLER_BASE;
+        end if;
 
+        v_uns_s2 := to_unsigned(int_s2, 20) + to_unsigned(C_BYTES * int_s1, 20) + to_unsigned(v_int_weighted_sum, 20);
+        int_s2   <= to_integer(v_uns_s2(15 downto 0)) + 15 * to_integer(v_uns_s2(19 downto 16));
+      end if;
     end if;
 
   end process proc_adler32;
 
-  oslv_data <= slv_current_adler_checksum;
+  -- s2 is less than 2 ** 16 + 15 * 15 after folding. Thus a single subtraction is sufficient.
+  int_s2_reduced <= int_s2 - C_ADLER_BASE when int_s2 >= C_ADLER_BASE else
+                    int_s2;
+
+  oslv_data <= std_logic_vector(to_unsigned(int_s2_reduced, 16)) &
+               std_logic_vector(to_unsigned(int_s1, 16));
 
 end architecture behavioral;
@@ -0,0 +1,95 @@
+library ieee;
+  use ieee.std_logic_1164.all;
+  use ieee.numeric_std.all;
+
+-- Pack samples of less than eight bit to bytes.
+-- The input is one sample per byte, in the least significant bits.
+-- The leftmost sample is in the most significant bits of the output byte.
+-- Each row starts at a byte boundary. The unused bits of the last byte of a row are zero.
+
+entity bit_packer is
+  generic (
+    C_IMG_WIDTH : integer              := 10;
+    C_BIT_DEPTH : integer range 1 to 4 := 1
+  );
+  port (
+    isl_clk   : in    std_logic;
+    isl_start : in    std_logic;
+    isl_get   : in    std_logic;
+    isl_valid : in    std_logic;
+    islv_data : in    std_logic_vector(7 downto 0);
+    oslv_data : out   std_logic_vector(7 downto 0);
+    osl_valid : out   std_logic;
+    osl_rdy   : out   std_logic
+  );
+end entity bit_packer;
+
+architecture behavioral of bit_packer is
+
+  constant C_SAMPLES_PER_BYTE : integer := 8 / C_BIT_DEPTH;
+
+  signal slv_shift      : std_logic_vector(7 downto 0)              := (others => '0');
+  signal int_sample_cnt : integer range 0 to C_SAMPLES_PER_BYTE - 1 := 0;
+  signal int_column_cnt : integer range 0 to C_IMG_WIDTH - 1        := 0;
+
+  -- A packed byte is held until the next stage is ready.
+  signal sl_full  : std_logic                    := '0';
+  signal slv_byte : std_logic_vector(7 downto 0) := (others => '0');
+
+begin
+
+  proc_bit_packer : process (isl_clk) is
+
+    variable v_slv_shift : std_logic_vector(7 downto 0);
+
+  begin
+
+    if (rising_edge(isl_clk)) then
+      -- The packed byte has to be forwarded before the next one is complete.
+      -- synthesis translate_off
+      assert C_BIT_DEPTH = 1 or C_BIT_DEPTH = 2 or C_BIT_DEPTH = 4;
+      assert not (isl_valid = '1' and sl_full = '1' and isl_get = '0')
+        report "bit_packer overflow"
+        severity error;
+      -- synthesis translate_on
+
+      if (isl_start = '1') then
+        int_sample_cnt <= 0;
+        int_column_cnt <= 0;
+        sl_full        <= '0';
+      else
+        if (isl_get = '1') then
+          sl_full <= '0';
+        end if;
+
+        if (isl_valid = '1') then
+          v_slv_shift := slv_shift(7 - C_BIT_DEPTH downto 0) & islv_data(C_BIT_DEPTH - 1 downto 0);
+          slv_shift   <= v_slv_shift;
+
+          if (int_sample_cnt = C_SAMPLES_PER_BYTE - 1 or int_column_cnt = C_IMG_WIDTH - 1) then
+            -- Align the samples of an incomplete byte at the end of a row.
+            slv_byte       <= std_logic_vector(shift_left(unsigned(v_slv_shift),
+                                                          (C_SAMPLES_PER_BYTE - 1 - int_sample_cnt) * C_BIT_DEPTH));
+            sl_full        <= '1';
+            int_sample_cnt <= 0;
+          else
+            int_sample_cnt <= int_sample_cnt + 1;
+          end if;
+
+          if (int_column_cnt = C_IMG_WIDTH - 1) then
+            int_column_cnt <= 0;
+          else
+            int_column_cnt <= int_column_cnt + 1;
+          end if;
+        end if;
+      end if;
+    end if;
+
+  end process proc_bit_packer;
+
+  oslv_data <= slv_byte;
+  osl_valid <= sl_full and isl_get;
+  -- A new sample can be accepted, if the packed byte gets forwarded in this cycle.
+  osl_rdy <= not sl_full or isl_get;
+
+end architecture behavioral;
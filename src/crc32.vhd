@@ -5,12 +5,16 @@ library ieee;
 library util;
   use util.png_pkg.all;
 
+-- A word of C_INPUT_BITWIDTH bits is processed in each cycle.
+-- The first byte of a word is in the most significant bits.
+
 entity crc32 is
   generic (
-    C_INPUT_BITWIDTH : integer := 8
+    C_INPUT_BITWIDTH : integer range 8 to 64 := 8
   );
   port (
     isl_clk   : in    std_logic;
+    isl_start : in    std_logic;
     isl_valid : in    std_logic;
     islv_data : in    std_logic_vector(C_INPUT_BITWIDTH - 1 downto 0);
     oslv_data : out   std_logic_vector(31 downto 0)
@@ -19,22 +23,109 @@ end entity crc32;
 
 architecture behavioral of crc32 is
 
-  signal slv_current_crc : std_logic_vector(oslv_data'range) := (others => '0');
+  -- The CRC register and the input word are concatenated to a single vector.
+  -- Each bit of the next CRC register is the xor of a subset of this vector.
+  -- The subsets are stored as masks in a matrix.
+  constant C_VECTOR_WIDTH : integer := 32 + C_INPUT_BITWIDTH;
+
+  type t_crc_matrix is array (0 to 31) of std_logic_vector(C_VECTOR_WIDTH - 1 downto 0);
+
+  -- Bitwise CRC calculation. The bits of a byte are processed LSB first.
+  -- Only used to obtain the matrix.
+
+  function update_crc32_bitwise (
+    crc  : std_logic_vector(31 downto 0);
+    data : std_logic_vector(C_INPUT_BITWIDTH - 1 downto 0)
+  ) return std_logic_vector is
+
+    variable v_crc : std_logic_vector(31 downto 0);
+
+  begin
+
+    v_crc := crc;
+
+    for byte in C_INPUT_BITWIDTH / 8 downto 1 loop
+
+      for bit in 0 to 7 loop
+
+        if ((v_crc(0) xor data((byte - 1) * 8 + bit)) = '1') then
+          v_crc := ('0' & v_crc(31 downto 1)) xor x"EDB88320";
+        else
+          v_crc := '0' & v_crc(31 downto 1);
+        end if;
+
+      end loop;
+
+    end loop;
+
+    return v_crc;
+
+  end function update_crc32_bitwise;
+
+  -- The CRC is linear. Thus the columns of the matrix are obtained by
+  -- processing each unit vector.
+
+  function get_crc_matrix return t_crc_matrix is
+
+    variable v_a_matrix : t_crc_matrix;
+    variable v_vector   : std_logic_vector(C_VECTOR_WIDTH - 1 downto 0);
+    variable v_crc      : std_logic_vector(31 downto 0);
+
+  begin
+
+    for column in 0 to C_VECTOR_WIDTH - 1 loop
+
+      v_vector         := (others => '0');
+      v_vector(column) := '1';
+      v_crc            := update_crc32_bitwise(v_vector(C_VECTOR_WIDTH - 1 downto C_INPUT_BITWIDTH),
+                                               v_vector(C_INPUT_BITWIDTH - 1 downto 0));
+
+      for row in 0 to 31 loop
+
+        v_a_matrix(row)(column) := v_crc(row);
+
+      end loop;
+
+    end loop;
+
+    return v_a_matrix;
+
+  end function get_crc_matrix;
+
+  constant C_CRC_MATRIX : t_crc_matrix := get_crc_matrix;
+
+  -- The register contains the inverted CRC.
+  signal slv_current_crc : std_logic_vector(oslv_data'range) := (others => '1');
 
 begin
 
   proc_crc32 : process (isl_clk) is
+
+    variable v_vector : std_logic_vector(C_VECTOR_WIDTH - 1 downto 0);
+
   begin
 
     if (rising_edge(isl_clk)) then
-      if (isl_valid = '1') then
-        slv_current_crc <= calculate_crc32(islv_data, slv_current_crc, '0');
+      assert C_INPUT_BITWIDTH mod 8 = 0;
+
+      -- The CRC needs to be initialized for each chunk.
+      assert not (isl_valid = '1' and isl_start = '1');
+      if (isl_start = '1') then
+        slv_current_crc <= (others => '1');
+      elsif (isl_valid = '1') then
+        v_vector := slv_current_crc & islv_data;
+
+        for row in 0 to 31 loop
+
+          slv_current_crc(row) <= xor (v_vector and C_CRC_MATRIX(row));
+
+        end loop;
+
       end if;
     end if;
 
   end process proc_crc32;
 
-  oslv_data <= slv_current_crc(7 downto 0) & slv_current_crc(15 downto 8) &
-               slv_current_crc(23 downto 16) & slv_current_crc(31 downto 24);
+  oslv_data <= not slv_current_crc;
 
 end architecture behavioral;
@@ -13,58 +13,200 @@ entity deflate is
     C_INPUT_BUFFER_SIZE     : integer range 3 to 258   := 12;
     C_SEARCH_BUFFER_SIZE    : integer range 1 to 32768 := 12;
     C_BTYPE                 : integer range 0 to 3     := 1;
-    C_MAX_MATCH_LENGTH_USER : integer                  := 8
+    C_MAX_MATCH_LENGTH_USER : integer                  := 8;
+    C_MATCH_MODE            : integer range 0 to 2     := 0;
+    C_WINDOW_TYPE           : integer range 0 to 1     := 0;
+    C_BLOCK_SIZE            : integer range 2 to 16384 := 1024;
+    C_STORED_FALLBACK       : integer range 0 to 1     := 0;
+    -- 0: The last block isn't marked as final and the stream ends at a byte boundary.
+    --    Another deflate stream can be appended then.
+    C_FINAL_BLOCK : integer range 0 to 1 := 1
   );
   port (
-    isl_clk    : in    std_logic;
-    isl_flush  : in    std_logic;
+    isl_clk   : in    std_logic;
+    isl_flush : in    std_logic;
+    -- The next stage is ready for output. If it's inactive, no output is sent in the next cycle.
+    isl_get    : in    std_logic;
     isl_valid  : in    std_logic;
     islv_data  : in    std_logic_vector(7 downto 0);
     oslv_data  : out   std_logic_vector(7 downto 0);
     osl_valid  : out   std_logic;
-    osl_finish : out   std_logic
+    osl_rdy    : out   std_logic;
+    osl_finish : out   std_logic;
+    -- statistics for the performance counters, can be left open
+    orec_stats : out   t_deflate_stats
   );
 end entity deflate;
 
 architecture behavioral of deflate is
 
+  constant C_MATCH_LENGTH_BITS : integer := calc_match_bits(C_INPUT_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER);
+
   signal sl_valid_out_lzss : std_logic                                                                                                                         := '0';
   signal slv_data_out_lzss : std_logic_vector(calc_huffman_bitwidth(C_BTYPE, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER) - 1 downto 0) := (others => '0');
   signal sl_finish_lzss    : std_logic                                                                                                                         := '0';
+  signal sl_rdy_lzss       : std_logic                                                                                                                         := '0';
+  signal sl_rdy_huffman    : std_logic                                                                                                                         := '0';
   signal sl_valid_out      : std_logic                                                                                                                         := '0';
 
 begin
 
-  i_lzss : entity png_lib.lzss
-    generic map (
-      C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
-      C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
-      C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER
-    )
-    port map (
-      isl_clk    => isl_clk,
-      isl_flush  => isl_flush,
-      isl_valid  => isl_valid,
-      islv_data  => islv_data,
-      oslv_data  => slv_data_out_lzss,
-      osl_valid  => sl_valid_out_lzss,
-      osl_finish => sl_finish_lzss
-    );
-
-  i_huffman : entity png_lib.huffman
-    generic map (
-      C_BTYPE             => C_BTYPE,
-      C_INPUT_BITWIDTH    => calc_huffman_bitwidth(C_BTYPE, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER),
-      C_MATCH_LENGTH_BITS => calc_match_bits(C_INPUT_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER)
-    )
-    port map (
-      isl_clk    => isl_clk,
-      isl_flush  => sl_finish_lzss,
-      isl_valid  => sl_valid_out_lzss,
-      islv_data  => slv_data_out_lzss,
-      oslv_data  => oslv_data,
-      osl_valid  => osl_valid,
-      osl_finish => osl_finish
-    );
+  -- Uncompressed data doesn't need LZSS.
+
+  gen_stored : if C_BTYPE = 0 generate
+
+    i_stored : entity png_lib.stored(behavioral)
+      generic map (
+        C_BLOCK_SIZE  => C_BLOCK_SIZE,
+        C_FINAL_BLOCK => C_FINAL_BLOCK
+      )
+      port map (
+        isl_clk    => isl_clk,
+        isl_flush  => isl_flush,
+        isl_get    => isl_get,
+        isl_valid  => isl_valid,
+        islv_data  => islv_data,
+        oslv_data  => oslv_data,
+        osl_valid  => osl_valid,
+        osl_rdy    => osl_rdy,
+        osl_finish => osl_finish
+      );
+
+  end generate gen_stored;
+
+  -- Window with registers and parallel comparators.
+
+  gen_lzss_registers : if C_BTYPE /= 0 and C_WINDOW_TYPE = 0 generate
+
+    i_lzss : entity png_lib.lzss(behavioral)
+      generic map (
+        C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
+        C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
+        C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+        C_MATCH_MODE            => C_MATCH_MODE
+      )
+      port map (
+        isl_clk    => isl_clk,
+        isl_flush  => isl_flush,
+        isl_get    => sl_rdy_huffman,
+        isl_valid  => isl_valid,
+        islv_data  => islv_data,
+        oslv_data  => slv_data_out_lzss,
+        osl_valid  => sl_valid_out_lzss,
+        osl_rdy    => sl_rdy_lzss,
+        osl_finish => sl_finish_lzss
+      );
+
+  end generate gen_lzss_registers;
+
+  -- Window in BRAM and match candidates from a hash table.
+
+  gen_lzss_hash : if C_BTYPE /= 0 and C_WINDOW_TYPE = 1 generate
+
+    i_lzss : entity png_lib.lzss_hash(behavioral)
+      generic map (
+        C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
+        C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
+        C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER
+      )
+      port map (
+        isl_clk    => isl_clk,
+        isl_flush  => isl_flush,
+        isl_get    => sl_rdy_huffman,
+        isl_valid  => isl_valid,
+        islv_data  => islv_data,
+        oslv_data  => slv_data_out_lzss,
+        osl_valid  => sl_valid_out_lzss,
+        osl_rdy    => sl_rdy_lzss,
+        osl_finish => sl_finish_lzss
+      );
+
+  end generate gen_lzss_hash;
+
+  -- Fixed huffman codes can be streamed. All other modes need to buffer a block.
+
+  gen_huffman_fixed : if C_BTYPE = 1 and C_STORED_FALLBACK = 0 generate
+
+    i_huffman : entity png_lib.huffman(behavioral)
+      generic map (
+        C_BTYPE             => C_BTYPE,
+        C_INPUT_BITWIDTH    => calc_huffman_bitwidth(C_BTYPE, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER),
+        C_MATCH_LENGTH_BITS => calc_match_bits(C_INPUT_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER),
+        C_FINAL_BLOCK       => C_FINAL_BLOCK
+      )
+      port map (
+        isl_clk    => isl_clk,
+        isl_flush  => sl_finish_lzss,
+        isl_get    => isl_get,
+        isl_valid  => sl_valid_out_lzss,
+        islv_data  => slv_data_out_lzss,
+        oslv_data  => oslv_data,
+        osl_valid  => sl_valid_out,
+        osl_rdy    => sl_rdy_huffman,
+        osl_finish => osl_finish
+      );
+
+  end generate gen_huffman_fixed;
+
+  gen_huffman_block : if C_BTYPE = 2 or (C_BTYPE = 1 and C_STORED_FALLBACK = 1) generate
+
+    i_huffman : entity png_lib.huffman_block(behavioral)
+      generic map (
+        C_BTYPE             => C_BTYPE,
+        C_INPUT_BITWIDTH    => calc_huffman_bitwidth(C_BTYPE, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER),
+        C_MATCH_LENGTH_BITS => calc_match_bits(C_INPUT_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER),
+        C_BLOCK_SIZE        => C_BLOCK_SIZE,
+        C_STORED_FALLBACK   => C_STORED_FALLBACK,
+        C_FINAL_BLOCK       => C_FINAL_BLOCK
+      )
+      port map (
+        isl_clk       => isl_clk,
+        isl_flush     => sl_finish_lzss,
+        isl_get       => isl_get,
+        isl_valid     => sl_valid_out_lzss,
+        islv_data     => slv_data_out_lzss,
+        isl_raw_valid => isl_valid,
+        islv_raw_data => islv_data,
+        oslv_data     => oslv_data,
+        osl_valid     => sl_valid_out,
+        osl_rdy       => sl_rdy_huffman,
+        osl_finish    => osl_finish
+      );
+
+  end generate gen_huffman_block;
+
+  gen_stats_stored : if C_BTYPE = 0 generate
+    orec_stats <= C_DEFLATE_STATS_NONE;
+  end generate gen_stats_stored;
+
+  -- Decode the LZSS tokens. See also calc_huffman_bitwidth().
+  -- LZSS and huffman are busy, when they get a datum or token, and stalled, when they aren't ready.
+
+  gen_stats : if C_BTYPE /= 0 generate
+    osl_rdy   <= sl_rdy_lzss;
+    osl_valid <= sl_valid_out;
+
+    orec_stats.int_literals      <= 1 when sl_valid_out_lzss = '1' and slv_data_out_lzss(slv_data_out_lzss'high) = '0' else
+                                    0;
+    orec_stats.int_matches       <= 1 when sl_valid_out_lzss = '1' and slv_data_out_lzss(slv_data_out_lzss'high) = '1' else
+                                    0;
+    orec_stats.int_match_length  <= to_integer(unsigned(slv_data_out_lzss(C_MATCH_LENGTH_BITS - 1 downto 0)))
+                                    when sl_valid_out_lzss = '1' and slv_data_out_lzss(slv_data_out_lzss'high) = '1' else
+                                    0;
+    orec_stats.int_match_offset  <= to_integer(unsigned(slv_data_out_lzss(slv_data_out_lzss'high - 1 downto C_MATCH_LENGTH_BITS)))
+                                    when sl_valid_out_lzss = '1' and slv_data_out_lzss(slv_data_out_lzss'high) = '1' else
+                                    0;
+    orec_stats.int_lzss_busy     <= 1 when isl_valid = '1' else
+                                    0;
+    orec_stats.int_lzss_stall    <= 1 when sl_rdy_lzss = '0' else
+                                    0;
+    orec_stats.int_huffman_busy  <= 1 when sl_valid_out_lzss = '1' else
+                                    0;
+    orec_stats.int_huffman_stall <= 1 when sl_rdy_huffman = '0' else
+                                    0;
+    orec_stats.int_huffman_bytes <= 1 when sl_valid_out = '1' else
+                                    0;
+    orec_stats.int_adler32_busy  <= 0;
+  end generate gen_stats;
 
 end architecture behavioral;
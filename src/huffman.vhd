@@ -11,54 +11,58 @@ entity huffman is
   generic (
     C_BTYPE             : integer range 0 to 3 := 1;
     C_INPUT_BITWIDTH    : integer              := 17;
-    C_MATCH_LENGTH_BITS : integer
+    C_MATCH_LENGTH_BITS : integer;
+    -- 0: The block isn't marked as final. The stream gets aligned to a byte boundary
+    --    by an empty stored block (sync flush), so another deflate stream can be appended.
+    C_FINAL_BLOCK : integer range 0 to 1 := 1
   );
   port (
-    isl_clk    : in    std_logic;
-    isl_flush  : in    std_logic;
+    isl_clk   : in    std_logic;
+    isl_flush : in    std_logic;
+    -- The next stage is ready for output. If it's inactive, no output is sent in the next cycle.
+    isl_get    : in    std_logic;
     isl_valid  : in    std_logic;
     islv_data  : in    std_logic_vector(C_INPUT_BITWIDTH - 1 downto 0);
     oslv_data  : out   std_logic_vector(7 downto 0);
     osl_valid  : out   std_logic;
+    osl_rdy    : out   std_logic;
     osl_finish : out   std_logic
   );
 end entity huffman;
 
 architecture behavioral of huffman is
 
-  signal isl_valid_d1 : std_logic                         := '0';
-  signal islv_data_d1 : std_logic_vector(islv_data'range) := (others => '0');
   signal sl_valid_out : std_logic                         := '0';
   signal slv_data_out : std_logic_vector(oslv_data'range) := (others => '0');
 
-  signal sl_finish               : std_logic := '0';
-  signal sl_flush                : std_logic := '0';
-  signal sl_aggregation_finished : std_logic := '0';
+  signal sl_finish : std_logic := '0';
+  signal sl_flush  : std_logic := '0';
 
-  signal slv_current_value : std_logic_vector(islv_data'range) := (others => '0');
+  -- EOB is 7 bit zeros. For the sync flush, it's followed by the header
+  -- of the empty stored block, i. e. 3 bit zeros (BFINAL = 0, BTYPE = 00).
+  constant C_EOB_BITS : integer := 7 + 3 * (1 - C_FINAL_BLOCK);
 
-  type t_states is (IDLE, WAIT_FOR_INPUT, LITERAL_CODE, LENGTH_CODE, EXTRA_LENGTH_CODE, DISTANCE_CODE, EXTRA_DISTANCE_CODE, EOB, PAD, SEND_BYTES_FINAL);
+  -- The codes of the incoming tokens are looked up at once and buffered.
+  -- A token can arrive one cycle after osl_rdy was sampled. Thus the FIFO needs some margin.
+  constant C_FIFO_DEPTH : integer := 4;
 
-  signal state : t_states := IDLE;
+  type t_token_fifo is array (0 to C_FIFO_DEPTH - 1) of t_token_code;
 
-  type t_aggregator is record
-    sl_valid_in   : std_logic;
-    slv_data_in   : std_logic_vector(12 downto 0);
-    int_bits      : integer range 1 to 13;
-    sl_descending : std_logic;
-  end record t_aggregator;
+  signal a_token_fifo   : t_token_fifo                        := (others => (0, (others => '0')));
+  signal int_fifo_wr    : integer range 0 to C_FIFO_DEPTH - 1 := 0;
+  signal int_fifo_rd    : integer range 0 to C_FIFO_DEPTH - 1 := 0;
+  signal int_fifo_count : integer range 0 to C_FIFO_DEPTH     := 0;
 
-  signal aggregator : t_aggregator := ('0', (others => '0'), 1, '0');
+  -- The bits to be sent are aligned at the most significant bit. The first bit is sent first.
+  -- A byte is sent every cycle, while a whole token is appended every cycle.
+  constant C_ACCUMULATOR_BITS : integer := 64;
 
-  -- Maximum buffer size should be max. distance_bits + max. distance_extra_bits = 5 + 13.
-  -- However, synthesis only works properly with power-of-two sizes.
+  signal u_accumulator : unsigned(C_ACCUMULATOR_BITS - 1 downto 0) := (others => '0');
+  signal int_fill      : integer range 0 to C_ACCUMULATOR_BITS     := 0;
 
-  type t_buffer32 is record
-    int_current_index : integer range 0 to 31;
-    slv_data          : std_logic_vector(31 downto 0);
-  end record t_buffer32;
+  type t_states is (IDLE, STREAM, EOB, PAD, SYNC_LEN, SYNC_NLEN, FINISH);
 
-  signal buffer32 : t_buffer32 := (0, (others => '0'));
+  signal state : t_states := IDLE;
 
 begin
 
@@ -70,265 +74,147 @@ begin
   -- RFC 1951, 3.2.6. Compression with fixed Huffman codes (BTYPE=01)
   proc_fixed_huffman : process (isl_clk) is
 
-    variable v_huffman_code : t_huffman_code;
+    variable v_int_match_length   : integer;
+    variable v_int_match_distance : integer;
 
-    variable v_int_match_length,
-            v_int_match_distance : integer;
+    variable v_rec_token      : t_token_code;
+    variable v_rec_item       : t_token_code;
+    variable v_next_state     : t_states;
+    variable v_sl_pop         : boolean;
+    variable v_int_fifo_count : integer range 0 to C_FIFO_DEPTH;
 
-    variable v_int_buffer_index_tmp : integer range 0 to 7;
+    variable v_u_accumulator : unsigned(u_accumulator'range);
+    variable v_int_fill      : integer range 0 to C_ACCUMULATOR_BITS;
 
   begin
 
     if (rising_edge(isl_clk)) then
       -- defaults
-      sl_finish                <= '0';
-      aggregator.sl_valid_in   <= '0';
-      aggregator.sl_descending <= '1';
-
-      -- assert not (state /= WAIT_FOR_INPUT and isl_valid = '1') report "Data can't be received in state " & to_string(state);
-      isl_valid_d1 <= isl_valid;
-      islv_data_d1 <= islv_data;
+      sl_finish    <= '0';
+      sl_valid_out <= '0';
 
       -- Preserve the flush impulse, since it might be not processed directly.
       if (isl_flush = '1') then
         sl_flush <= '1';
       end if;
 
-      case state is
-
-        when IDLE =>
-
-          -- send everything in one block
-          -- TODO: revisit all the reverting
-          aggregator.sl_valid_in <= '1';
-          aggregator.slv_data_in <= revert_vector(std_logic_vector(to_unsigned(C_BTYPE, 2)) & '1') & "0000000000";
-          aggregator.int_bits    <= 3;
-          -- 0 if revert_vector() is used
-          aggregator.sl_descending <= '0';
-
-          state <= WAIT_FOR_INPUT;
-
-        when WAIT_FOR_INPUT =>
-
-          if (isl_valid = '1') then
-            if (islv_data(islv_data'high) = '0') then
-              -- no match = literal/raw data
-              state                   <= LITERAL_CODE;
-              v_huffman_code.sl_match := '0';
-            else
-              -- match, following states:
-              -- LENGTH_CODE -> EXTRA_LENGTH_CODE -> DISTANCE_CODE -> EXTRA_DISTANCE_CODE
-              state                   <= LENGTH_CODE;
-              v_huffman_code.sl_match := '1';
-            end if;
-            slv_current_value <= islv_data;
-          elsif (isl_valid_d1 = '1') then
-            if (islv_data_d1(islv_data_d1'high) = '0') then
-              -- no match = literal/raw data
-              state                   <= LITERAL_CODE;
-              v_huffman_code.sl_match := '0';
-            else
-              -- match, following states:
-              -- LENGTH_CODE -> EXTRA_LENGTH_CODE -> DISTANCE_CODE -> EXTRA_DISTANCE_CODE
-              state                   <= LENGTH_CODE;
-              v_huffman_code.sl_match := '1';
-            end if;
-            slv_current_value <= islv_data_d1;
-          elsif (sl_flush = '1') then
-            sl_flush <= '0';
-            state    <= EOB;
-          end if;
-
-        when LITERAL_CODE =>
-
-          v_huffman_code.lit := get_literal_code(to_integer(unsigned(slv_current_value(islv_data'high - 1 downto islv_data'high - 8))));
-
-          report "input_value, buffer index, literal, literal huffman, huffman bits";
-          report "LITERAL_CODE " &
-                 to_string(slv_current_value) & " " &
-                 to_string(buffer32.int_current_index) & " " &
-                 to_string(to_integer(unsigned(slv_current_value(islv_data'high - 1 downto islv_data'high - 8)))) & " " &
-                 to_string(v_huffman_code.lit.value) & " " &
-                 to_string(v_huffman_code.lit.bits);
-
-          aggregator.sl_valid_in <= '1';
-          aggregator.slv_data_in <= std_logic_vector(to_unsigned(v_huffman_code.lit.value, 13));
-          aggregator.int_bits    <= v_huffman_code.lit.bits;
-
-          state <= WAIT_FOR_INPUT;
-
-        when LENGTH_CODE =>
-
-          v_int_match_length    := to_integer(unsigned(slv_current_value(C_MATCH_LENGTH_BITS - 1 downto 0)));
-          v_huffman_code.length := get_length_code(v_int_match_length);
-
-          report "input_value, buffer index, match length, match length huffman, huffman bits";
-          report "LENGTH_CODE " &
-                 to_string(slv_current_value) & " " &
-                 to_string(buffer32.int_current_index) & " " &
-                 to_string(v_int_match_length) & " " &
-                 to_string(v_huffman_code.length.value) & " " &
-                 to_string(v_huffman_code.length.bits);
-
-          aggregator.sl_valid_in <= '1';
-          aggregator.slv_data_in <= std_logic_vector(to_unsigned(v_huffman_code.length.value, 13));
-          aggregator.int_bits    <= v_huffman_code.length.bits;
-
-          state <= EXTRA_LENGTH_CODE;
-
-        when EXTRA_LENGTH_CODE =>
-
-          v_huffman_code.length_extra := get_length_extra_code(v_int_match_length);
-
-          report "input_value, buffer index, match length, match length extra huffman, huffman bits";
-          report "EXTRA_LENGTH_CODE " &
-                 to_string(slv_current_value) & " " &
-                 to_string(buffer32.int_current_index) & " " &
-                 to_string(v_int_match_length) & " " &
-                 to_string(v_huffman_code.length_extra.value) & " " &
-                 to_string(v_huffman_code.length_extra.bits);
-
-          if (v_huffman_code.length_extra.bits /= 0) then
-            aggregator.sl_valid_in   <= '1';
-            aggregator.slv_data_in   <= revert_vector(std_logic_vector(to_unsigned(v_huffman_code.length_extra.value, 13)));
-            aggregator.int_bits      <= v_huffman_code.length_extra.bits;
-            aggregator.sl_descending <= '0';
-          end if;
-
-          state <= DISTANCE_CODE;
-
-        when DISTANCE_CODE =>
-
-          v_int_match_distance    := to_integer(unsigned(slv_current_value(islv_data'high - 1 downto C_MATCH_LENGTH_BITS)));
-          v_huffman_code.distance := get_distance_code(v_int_match_distance);
+      v_int_fifo_count := int_fifo_count;
+
+      -- Look up all code parts of the incoming token.
+      if (isl_valid = '1') then
+        if (islv_data(islv_data'high) = '0') then
+          -- no match = literal/raw data
+          v_rec_token := get_fixed_literal_token(to_integer(unsigned(islv_data(islv_data'high - 1 downto islv_data'high - 8))));
+        else
+          v_int_match_length   := to_integer(unsigned(islv_data(C_MATCH_LENGTH_BITS - 1 downto 0)));
+          v_int_match_distance := to_integer(unsigned(islv_data(islv_data'high - 1 downto C_MATCH_LENGTH_BITS)));
+          v_rec_token          := get_fixed_match_token(v_int_match_length, v_int_match_distance);
+        end if;
+
+        a_token_fifo(int_fifo_wr) <= v_rec_token;
+        int_fifo_wr               <= (int_fifo_wr + 1) mod C_FIFO_DEPTH;
+        v_int_fifo_count          := v_int_fifo_count + 1;
+      end if;
 
-          report "input_value, buffer index, match distance, match distance huffman, huffman bits";
-          report "DISTANCE_CODE " &
-                 to_string(slv_current_value) & " " &
-                 to_string(buffer32.int_current_index) & " " &
-                 to_string(v_int_match_distance) & " " &
-                 to_string(v_huffman_code.distance.value) & " " &
-                 to_string(v_huffman_code.distance.bits);
+      -- Send the oldest byte of the accumulator.
+      v_u_accumulator := u_accumulator;
+      v_int_fill      := int_fill;
+      if (v_int_fill >= 8 and isl_get = '1') then
+        sl_valid_out    <= '1';
+        slv_data_out    <= revert_vector(std_logic_vector(v_u_accumulator(v_u_accumulator'high downto v_u_accumulator'high - 7)));
+        v_u_accumulator := shift_left(v_u_accumulator, 8);
+        v_int_fill      := v_int_fill - 8;
+      end if;
 
-          aggregator.sl_valid_in <= '1';
-          aggregator.slv_data_in <= std_logic_vector(to_unsigned(v_huffman_code.distance.value, 13));
-          aggregator.int_bits    <= v_huffman_code.distance.bits;
+      -- Select the next item to append.
+      v_rec_item   := (0, (others => '0'));
+      v_next_state := state;
+      v_sl_pop     := false;
 
-          state <= EXTRA_DISTANCE_CODE;
+      case state is
 
-        when EXTRA_DISTANCE_CODE =>
+        when IDLE =>
 
-          v_huffman_code.distance_extra := get_distance_extra_code(v_int_match_distance);
+          -- send everything in one block
+          v_rec_item   := (3, to_unsigned(revert_bits(C_BTYPE * 2 + C_FINAL_BLOCK, 3), C_MAX_TOKEN_BITS));
+          v_next_state := STREAM;
 
-          report "input_value, buffer index, match distance, match distance extra huffman, huffman bits";
-          report "EXTRA_DISTANCE_CODE " &
-                 to_string(buffer32.int_current_index) & " " &
-                 to_string(v_int_match_distance) & " " &
-                 to_string(v_huffman_code.distance_extra.value) & " " &
-                 to_string(v_huffman_code.distance_extra.bits);
+        when STREAM =>
 
-          if (v_huffman_code.distance_extra.bits /= 0) then
-            aggregator.sl_valid_in   <= '1';
-            aggregator.slv_data_in   <= revert_vector(std_logic_vector(to_unsigned(v_huffman_code.distance_extra.value, 13)));
-            aggregator.int_bits      <= v_huffman_code.distance_extra.bits;
-            aggregator.sl_descending <= '0';
+          if (int_fifo_count /= 0) then
+            v_rec_item := a_token_fifo(int_fifo_rd);
+            v_sl_pop   := true;
+          elsif (sl_flush = '1' and isl_valid = '0') then
+            sl_flush     <= '0';
+            v_next_state := EOB;
           end if;
 
-          state <= WAIT_FOR_INPUT;
-
         when EOB =>
 
-          -- append end of block -> eob is 7 bit zeros (256) -> zeros get appended anyway
-          aggregator.sl_valid_in <= '1';
-          aggregator.slv_data_in <= std_logic_vector(to_unsigned(0, 13));
-          aggregator.int_bits    <= 7;
-
-          state <= PAD;
+          -- append end of block -> eob is 7 bit zeros (256)
+          v_rec_item   := (C_EOB_BITS, (others => '0'));
+          v_next_state := PAD;
 
         when PAD =>
 
-          -- Current index of the buffer needs to be updated manually, since it
-          -- gets the desired value only at the next cycle.
-          v_int_buffer_index_tmp := (buffer32.int_current_index + 7) mod 8;
-          if (v_int_buffer_index_tmp /= 0) then
-            -- pad zeros (for full byte) at the end
-            aggregator.sl_valid_in <= '1';
-            aggregator.slv_data_in <= std_logic_vector(to_unsigned(0, 13));
-            aggregator.int_bits    <= 8 - v_int_buffer_index_tmp;
-          end if;
-
-          state <= SEND_BYTES_FINAL;
-
-        when SEND_BYTES_FINAL =>
-
-          if (sl_aggregation_finished = '1') then
-            sl_finish <= '1';
-            state     <= IDLE;
+          -- pad zeros (for full byte) at the end
+          v_rec_item := ((8 - v_int_fill mod 8) mod 8, (others => '0'));
+          if (C_FINAL_BLOCK = 0) then
+            v_next_state := SYNC_LEN;
+          else
+            v_next_state := FINISH;
           end if;
 
-      end case;
+        -- All bits of a byte are equal. Thus the bit order doesn't matter.
+        when SYNC_LEN =>
 
-    end if;
+          v_rec_item   := (16, to_unsigned(16#0000#, C_MAX_TOKEN_BITS));
+          v_next_state := SYNC_NLEN;
 
-  end process proc_fixed_huffman;
+        when SYNC_NLEN =>
 
-  proc_aggregator : process (isl_clk) is
+          v_rec_item   := (16, to_unsigned(16#FFFF#, C_MAX_TOKEN_BITS));
+          v_next_state := FINISH;
 
-    -- only used to suppress a ghdl synthesis error
-    -- TODO: extract a MWE and report the bug
-    variable v_slv_data_out : std_logic_vector(oslv_data'range);
-
-    variable v_int_current_index : integer range 0 to buffer32.slv_data'length - 1;
-
-  begin
+        when FINISH =>
 
-    if (rising_edge(isl_clk)) then
-      sl_valid_out            <= '0';
-      sl_aggregation_finished <= '0';
-
-      -- Output of aggregator.
-      v_int_current_index := buffer32.int_current_index;
-      if (v_int_current_index >= 8) then
-        sl_valid_out        <= '1';
-        v_slv_data_out      := buffer32.slv_data(v_int_current_index - 1 downto v_int_current_index - 8);
-        slv_data_out        <= revert_vector(v_slv_data_out);
-        v_int_current_index := v_int_current_index - 8;
-      elsif (state = SEND_BYTES_FINAL) then
-        sl_aggregation_finished <= '1';
-      end if;
-
-      -- Input to aggregator.
-      if (aggregator.sl_valid_in = '1') then
-        v_int_current_index := v_int_current_index + aggregator.int_bits;
-
-        -- shift the whole buffer
-        for pos in buffer32.slv_data'range loop
-
-          buffer32.slv_data(pos) <= buffer32.slv_data((pos - aggregator.int_bits) mod buffer32.slv_data'length);
-
-        end loop;
-
-        -- insert new values, maximum 13 (aggregator.int_bits)
-        for pos in 0 to 12 loop
-
-          exit when pos = aggregator.int_bits;
-
-          if (aggregator.sl_descending = '1') then
-            buffer32.slv_data(pos) <= aggregator.slv_data_in(pos);
-          else
-            -- After reverting the bits, the important bits are at the other end of the slv.
-            -- I. e. starting at aggregator.slv_data_in'high, not 0.
-            buffer32.slv_data(pos) <= aggregator.slv_data_in(aggregator.slv_data_in'high - aggregator.int_bits + pos + 1);
+          -- Finish after the last byte was sent.
+          if (int_fill = 0) then
+            sl_finish    <= '1';
+            v_next_state := IDLE;
           end if;
 
-        end loop;
+      end case;
 
+      -- Append the item by a barrel shifter, if there is enough space left.
+      if (v_int_fill + v_rec_item.bits <= C_ACCUMULATOR_BITS) then
+        v_u_accumulator := v_u_accumulator or
+                           shift_left(resize(v_rec_item.value, C_ACCUMULATOR_BITS), C_ACCUMULATOR_BITS - v_int_fill - v_rec_item.bits);
+        v_int_fill      := v_int_fill + v_rec_item.bits;
+        state           <= v_next_state;
+        if (v_sl_pop) then
+          int_fifo_rd      <= (int_fifo_rd + 1) mod C_FIFO_DEPTH;
+          v_int_fifo_count := v_int_fifo_count - 1;
+        end if;
       end if;
 
-      buffer32.int_current_index <= v_int_current_index;
+      -- synthesis translate_off
+      assert not (isl_valid = '1' and int_fifo_count = C_FIFO_DEPTH)
+        report "token FIFO overflow";
+      -- synthesis translate_on
+
+      u_accumulator  <= v_u_accumulator;
+      int_fill       <= v_int_fill;
+      int_fifo_count <= v_int_fifo_count;
     end if;
 
-  end process proc_aggregator;
+  end process proc_fixed_huffman;
+
+  -- Signal that a token in the next cycle can be processed.
+  -- The token, which is currently received, occupies a FIFO slot already.
+  osl_rdy <= '1' when int_fifo_count < C_FIFO_DEPTH - 1 or
+                      (int_fifo_count = C_FIFO_DEPTH - 1 and isl_valid = '0') else
+             '0';
 
   oslv_data  <= slv_data_out;
   osl_valid  <= sl_valid_out;
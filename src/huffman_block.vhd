@@ -0,0 +1,1032 @@
+-- Block based huffman encoding.
+-- The LZSS tokens of a block are buffered and the symbol frequencies are counted.
+-- Afterwards, the block gets encoded by:
+-- C_BTYPE = 1: RFC 1951, 3.2.6. Compression with fixed Huffman codes (BTYPE=01)
+-- C_BTYPE = 2: RFC 1951, 3.2.7. Compression with dynamic Huffman codes (BTYPE=10)
+--              Length limited canonical codes are built, the code lengths are sent
+--              as header and the buffered tokens are encoded.
+-- If C_STORED_FALLBACK = 1, the size of the encoded block is estimated. The block gets sent
+-- uncompressed (BTYPE=00), if this is smaller. The uncompressed data is buffered, too.
+-- If C_FINAL_BLOCK = 0, the last block isn't marked as final. Instead, an empty stored
+-- block aligns the stream to a byte boundary (sync flush).
+--
+-- The code lengths are obtained by Shannon coding, i. e. the length of a symbol
+-- is ceil(log2(total / frequency)). A small offset is added to all frequencies,
+-- which limits the code lengths to the maximum allowed length. Finally, remaining
+-- space of the Kraft inequality is used to shorten codes.
+-- This is not optimal like a Huffman tree, but it can be calculated symbol by symbol
+-- without sorting.
+
+library ieee;
+  use ieee.std_logic_1164.all;
+  use ieee.numeric_std.all;
+
+library png_lib;
+
+library util;
+  use util.huffman_pkg.all;
+  use util.math_pkg.all;
+  use util.png_pkg.all;
+
+entity huffman_block is
+  generic (
+    C_BTYPE             : integer range 1 to 2     := 2;
+    C_INPUT_BITWIDTH    : integer                  := 17;
+    C_MATCH_LENGTH_BITS : integer;
+    C_BLOCK_SIZE        : integer range 2 to 16384 := 1024;
+    C_STORED_FALLBACK   : integer range 0 to 1     := 0;
+    C_FINAL_BLOCK       : integer range 0 to 1     := 1
+  );
+  port (
+    isl_clk   : in    std_logic;
+    isl_flush : in    std_logic;
+    -- The next stage is ready for output. If it's inactive, no output is sent in the next cycle.
+    isl_get   : in    std_logic;
+    isl_valid : in    std_logic;
+    islv_data : in    std_logic_vector(C_INPUT_BITWIDTH - 1 downto 0);
+    -- Uncompressed data. Only used for C_STORED_FALLBACK = 1.
+    isl_raw_valid : in    std_logic;
+    islv_raw_data : in    std_logic_vector(7 downto 0);
+    oslv_data     : out   std_logic_vector(7 downto 0);
+    osl_valid     : out   std_logic;
+    osl_rdy       : out   std_logic;
+    osl_finish    : out   std_logic
+  );
+end entity huffman_block;
+
+architecture behavioral of huffman_block is
+
+  -- All three trees share the arrays:
+  -- 0 to 285: literal/length, 286 to 315: distance, 316 to 334: code length
+  constant C_LIT_BASE  : integer := 0;
+  constant C_DIST_BASE : integer := 286;
+  constant C_CL_BASE   : integer := 316;
+  constant C_SYMBOLS   : integer := 335;
+  constant C_EOB       : integer := 256;
+
+  -- Parameters of the literal/length, distance and code length tree.
+  -- The shift limits the code lengths, since 2 ** shift + symbols <= 2 ** max. length.
+  constant C_TREE_BASE       : t_int_array(0 to 2) := (C_LIT_BASE, C_DIST_BASE, C_CL_BASE);
+  constant C_TREE_SYMBOLS    : t_int_array(0 to 2) := (286, 30, 19);
+  constant C_TREE_MAX_LENGTH : t_int_array(0 to 2) := (15, 15, 7);
+  constant C_TREE_SHIFT      : t_int_array(0 to 2) := (14, 14, 6);
+
+  constant C_MAX_FREQ : integer := max_int(C_BLOCK_SIZE + 1, C_DIST_BASE + 30);
+
+  type t_freq_array is array (0 to C_SYMBOLS - 1) of integer range 0 to C_MAX_FREQ;
+
+  type t_length_array is array (0 to C_SYMBOLS - 1) of integer range 0 to 15;
+
+  type t_code_array is array (0 to C_SYMBOLS - 1) of integer range 0 to 2 ** 15 - 1;
+
+  type t_tree_array is array (0 to 2) of integer range 0 to C_MAX_FREQ;
+
+  type t_bl_array is array (0 to 15) of integer range 0 to 2 ** 16;
+
+  -- RFC 1951, 3.2.6. Compression with fixed Huffman codes (BTYPE=01)
+  -- The literal/length symbols 286 and 287 don't occur. They are considered only for the codes.
+
+  function get_fixed_lengths return t_length_array is
+
+    variable v_a_length : t_length_array;
+
+  begin
+
+    v_a_length := (others => 0);
+
+    for symbol in 0 to 285 loop
+
+      if (symbol <= 143) then
+        v_a_length(C_LIT_BASE + symbol) := 8;
+      elsif (symbol <= 255) then
+        v_a_length(C_LIT_BASE + symbol) := 9;
+      elsif (symbol <= 279) then
+        v_a_length(C_LIT_BASE + symbol) := 7;
+      else
+        v_a_length(C_LIT_BASE + symbol) := 8;
+      end if;
+
+    end loop;
+
+    for symbol in 0 to 29 loop
+
+      v_a_length(C_DIST_BASE + symbol) := 5;
+
+    end loop;
+
+    return v_a_length;
+
+  end function get_fixed_lengths;
+
+  function get_fixed_codes return t_code_array is
+
+    variable v_a_code : t_code_array;
+
+  begin
+
+    v_a_code := (others => 0);
+
+    for symbol in 0 to 285 loop
+
+      if (symbol <= 143) then
+        v_a_code(C_LIT_BASE + symbol) := 48 + symbol;
+      elsif (symbol <= 255) then
+        v_a_code(C_LIT_BASE + symbol) := 400 + symbol - 144;
+      elsif (symbol <= 279) then
+        v_a_code(C_LIT_BASE + symbol) := symbol - 256;
+      else
+        v_a_code(C_LIT_BASE + symbol) := 192 + symbol - 280;
+      end if;
+
+    end loop;
+
+    for symbol in 0 to 29 loop
+
+      v_a_code(C_DIST_BASE + symbol) := symbol;
+
+    end loop;
+
+    return v_a_code;
+
+  end function get_fixed_codes;
+
+  constant C_FIXED_LENGTH : t_length_array := get_fixed_lengths;
+  constant C_FIXED_CODE   : t_code_array   := get_fixed_codes;
+
+  -- Amount of extra bits of the code length symbols.
+
+  function get_cl_extra_bits (
+    symbol : integer
+  ) return integer is
+  begin
+
+    case symbol is
+
+      when 16 =>
+
+        return 2;
+
+      when 17 =>
+
+        return 3;
+
+      when 18 =>
+
+        return 7;
+
+      when others =>
+
+        return 0;
+
+    end case;
+
+  end function get_cl_extra_bits;
+
+  signal a_freq   : t_freq_array   := (others => 0);
+  signal a_length : t_length_array := (others => 0);
+  signal a_code   : t_code_array   := (others => 0);
+
+  -- Amount of used symbols and sum of the frequencies per tree.
+  signal a_used  : t_tree_array := (others => 0);
+  signal a_total : t_tree_array := (others => 0);
+
+  signal int_tree           : integer range 0 to 2              := 0;
+  signal int_index          : integer range 0 to C_SYMBOLS      := 0;
+  signal int_adjust         : integer range 0 to C_MAX_FREQ     := 0;
+  signal int_total_adjusted : integer range 0 to 4 * C_MAX_FREQ := 0;
+  signal int_kraft          : integer range 0 to 2 ** 16        := 0;
+  signal sl_changed         : std_logic                         := '0';
+  signal a_bl_count         : t_bl_array                        := (others => 0);
+  signal a_next_code        : t_bl_array                        := (others => 0);
+  signal int_max_symbol     : integer range 0 to C_SYMBOLS      := 0;
+  signal int_hlit           : integer range 257 to 286          := 257;
+  signal int_hdist          : integer range 1 to 30             := 1;
+  signal int_hclen          : integer range 4 to 19             := 4;
+
+  -- Run length encoding of the code lengths.
+
+  type t_cl_token is record
+    int_symbol : integer range 0 to 18;
+    int_extra  : integer range 0 to 127;
+  end record t_cl_token;
+
+  type t_cl_buffer is array (0 to 286 + 30 - 1) of t_cl_token;
+
+  signal a_cl_buffer    : t_cl_buffer                 := (others => (0, 0));
+  signal int_cl_count   : integer range 0 to 286 + 30 := 0;
+  signal int_seq_index  : integer range 0 to 286 + 30 := 0;
+  signal int_seq_length : integer range 0 to 286 + 30 := 0;
+  signal int_run_value  : integer range 0 to 15       := 0;
+  signal int_run_length : integer range 0 to 286 + 30 := 0;
+  signal sl_run_first   : std_logic                   := '0';
+
+  -- Size estimation of the encoded block in bits.
+  constant C_MAX_BITS : integer := 48 * C_BLOCK_SIZE + 4096;
+
+  signal int_fixed_bits : integer range 0 to C_MAX_BITS := 0;
+  signal int_extra_bits : integer range 0 to C_MAX_BITS := 0;
+  signal int_tree_bits  : integer range 0 to C_MAX_BITS := 0;
+
+  -- Buffer for the uncompressed data. It contains the datums of the current block and
+  -- the datums, that are still processed by the LZSS.
+  constant C_MAX_MATCH_LENGTH : integer := 2 ** C_MATCH_LENGTH_BITS - 1;
+  constant C_RAW_ADDR_WIDTH   : integer := min_int(16, max_int(11, log2(C_BLOCK_SIZE) + 3));
+  constant C_MAX_RAW_BLOCK    : integer := min_int(2 ** 16 - 1, 2 ** C_RAW_ADDR_WIDTH - 1024);
+
+  signal slv_raw_waddr      : std_logic_vector(C_RAW_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_raw_raddr      : std_logic_vector(C_RAW_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_raw_raddr_next : std_logic_vector(C_RAW_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_raw_data_out   : std_logic_vector(7 downto 0)                    := (others => '0');
+  signal sl_raw_pop         : std_logic                                       := '0';
+  signal sl_raw_skip        : std_logic                                       := '0';
+  signal sl_raw_space       : std_logic                                       := '0';
+  signal int_raw_count      : integer range 0 to C_MAX_RAW_BLOCK              := 0;
+
+  -- Token buffer.
+  constant C_TOKEN_ADDR_WIDTH : integer := max_int(1, log2(C_BLOCK_SIZE));
+
+  signal slv_token_waddr    : std_logic_vector(C_TOKEN_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_token_raddr    : std_logic_vector(C_TOKEN_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_token          : std_logic_vector(islv_data'range);
+  signal int_token_count    : integer range 0 to C_BLOCK_SIZE                   := 0;
+  signal int_token_index    : integer range 0 to C_BLOCK_SIZE                   := 0;
+  signal int_match_length   : integer range 0 to 258                            := 0;
+  signal int_match_distance : integer range 0 to 32768                          := 0;
+
+  type t_states is (
+    IDLE, COLLECT, TREE_PREPARE, TREE_LENGTHS, TREE_SHORTEN, TREE_NEXT_CODE, TREE_ASSIGN,
+    RLE_SCAN, RLE_EMIT, SELECT_BTYPE, HEADER, HEADER_CL_LENGTHS, HEADER_CL_SYMBOLS,
+    STORED_HEADER, STORED_PAD, STORED_LENGTH, STORED_NLENGTH, STORED_DATA,
+    TOKEN_FETCH, TOKEN_LITERAL_LENGTH, TOKEN_LENGTH_EXTRA, TOKEN_DISTANCE, TOKEN_DISTANCE_EXTRA,
+    EOB, PAD, SEND_BYTES_FINAL
+  );
+
+  signal state : t_states := IDLE;
+
+  signal sl_final                : std_logic                         := '0';
+  signal sl_sync_flush           : std_logic                         := '0';
+  signal sl_flush                : std_logic                         := '0';
+  signal sl_finish               : std_logic                         := '0';
+  signal sl_aggregation_finished : std_logic                         := '0';
+  signal sl_aggregator_rdy       : std_logic                         := '0';
+  signal int_next_index          : integer range 0 to 31             := 0;
+  signal sl_valid_out            : std_logic                         := '0';
+  signal slv_data_out            : std_logic_vector(oslv_data'range) := (others => '0');
+
+  -- The codes are stored with the most significant bit first.
+  -- Values, that are transmitted least significant bit first, are reverted before.
+
+  type t_aggregator is record
+    sl_valid_in : std_logic;
+    slv_data_in : std_logic_vector(15 downto 0);
+    int_bits    : integer range 1 to 16;
+  end record t_aggregator;
+
+  signal aggregator : t_aggregator := ('0', (others => '0'), 1);
+
+  type t_buffer32 is record
+    int_current_index : integer range 0 to 31;
+    slv_data          : std_logic_vector(31 downto 0);
+  end record t_buffer32;
+
+  signal buffer32 : t_buffer32 := (0, (others => '0'));
+
+begin
+
+  i_token_buffer : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_TOKEN_ADDR_WIDTH,
+      C_DATA_WIDTH => C_INPUT_BITWIDTH
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => isl_valid,
+      islv_waddr => slv_token_waddr,
+      islv_data  => islv_data,
+
+      islv_raddr => slv_token_raddr,
+      oslv_data  => slv_token
+    );
+
+  gen_raw_buffer : if C_STORED_FALLBACK = 1 generate
+
+    i_raw_buffer : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => C_RAW_ADDR_WIDTH,
+        C_DATA_WIDTH => 8
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => isl_raw_valid,
+        islv_waddr => slv_raw_waddr,
+        islv_data  => islv_raw_data,
+
+        islv_raddr => slv_raw_raddr_next,
+        oslv_data  => slv_raw_data_out
+      );
+
+    proc_raw_buffer : process (isl_clk) is
+    begin
+
+      if (rising_edge(isl_clk)) then
+        if (isl_raw_valid = '1') then
+          slv_raw_waddr <= std_logic_vector(unsigned(slv_raw_waddr) + 1);
+        end if;
+        slv_raw_raddr <= slv_raw_raddr_next;
+      end if;
+
+    end process proc_raw_buffer;
+
+    -- The uncompressed data of a block is either sent or skipped.
+    sl_raw_pop         <= '1' when state = STORED_DATA and sl_aggregator_rdy = '1' and int_raw_count /= 0 else
+                          '0';
+    slv_raw_raddr_next <= std_logic_vector(unsigned(slv_raw_raddr) + 1) when sl_raw_pop = '1' else
+                          std_logic_vector(unsigned(slv_raw_raddr) + int_raw_count) when sl_raw_skip = '1' else
+                          slv_raw_raddr;
+
+  end generate gen_raw_buffer;
+
+  slv_token_waddr <= std_logic_vector(to_unsigned(int_token_count mod 2 ** C_TOKEN_ADDR_WIDTH, C_TOKEN_ADDR_WIDTH));
+  slv_token_raddr <= std_logic_vector(to_unsigned(int_token_index, C_TOKEN_ADDR_WIDTH));
+
+  proc_dynamic_huffman : process (isl_clk) is
+
+    variable v_int_symbol   : integer range 0 to C_SYMBOLS;
+    variable v_int_length   : integer range 0 to 258;
+    variable v_int_distance : integer range 0 to 32768;
+    variable v_int_count    : integer range 0 to C_BLOCK_SIZE;
+    variable v_a_used       : t_tree_array;
+    variable v_a_total      : t_tree_array;
+    variable v_int_adjust   : integer range 0 to C_MAX_FREQ;
+    variable v_int_max_len  : integer range 0 to 15;
+    variable v_int_code_len : integer range 0 to 15;
+    variable v_sl_changed   : std_logic;
+    variable v_int_code     : integer range 0 to 2 ** 16;
+    variable v_int_hclen    : integer range 4 to 19;
+    variable v_cl_token     : t_cl_token;
+    variable v_int_run      : integer range 0 to 286 + 30;
+    variable v_int_bits     : integer range 0 to 7;
+    variable v_code         : t_code;
+    variable v_int_final    : integer range 0 to 1;
+    variable v_int_raw      : integer range 0 to C_MAX_RAW_BLOCK;
+    variable v_int_fixed    : integer range 0 to C_MAX_BITS;
+    variable v_int_extra    : integer range 0 to C_MAX_BITS;
+    variable v_int_huffman  : integer range 0 to C_MAX_BITS;
+
+    procedure send (
+      value : integer;
+      bits  : integer
+    ) is
+    begin
+
+      aggregator.sl_valid_in <= '1';
+      aggregator.slv_data_in <= std_logic_vector(to_unsigned(value, aggregator.slv_data_in'length));
+      aggregator.int_bits    <= bits;
+
+    end procedure send;
+
+    procedure start_tokens is
+    begin
+
+      int_token_index <= 0;
+
+      if (int_token_count = 0) then
+        state <= EOB;
+      else
+        state <= TOKEN_FETCH;
+      end if;
+
+    end procedure start_tokens;
+
+    procedure end_block is
+    begin
+
+      if (sl_final = '1' and C_FINAL_BLOCK = 0 and sl_sync_flush = '0') then
+        -- Append an empty, non-final stored block.
+        sl_sync_flush <= '1';
+        int_raw_count <= 0;
+        state         <= STORED_HEADER;
+      elsif (sl_final = '1') then
+        sl_sync_flush <= '0';
+        state         <= PAD;
+      else
+        -- The next block follows directly.
+        state <= IDLE;
+      end if;
+
+    end procedure end_block;
+
+    procedure next_token is
+    begin
+
+      if (int_token_index = int_token_count - 1) then
+        state <= EOB;
+      else
+        int_token_index <= int_token_index + 1;
+        state           <= TOKEN_FETCH;
+      end if;
+
+    end procedure next_token;
+
+  begin
+
+    if (rising_edge(isl_clk)) then
+      -- defaults
+      sl_finish              <= '0';
+      aggregator.sl_valid_in <= '0';
+
+      -- Preserve the flush impulse, since it might be not processed directly.
+      if (isl_flush = '1') then
+        sl_flush <= '1';
+      end if;
+
+      v_int_max_len := C_TREE_MAX_LENGTH(int_tree);
+      sl_raw_skip   <= '0';
+
+      if (sl_final = '1' and C_FINAL_BLOCK = 1) then
+        v_int_final := 1;
+      else
+        v_int_final := 0;
+      end if;
+
+      case state is
+
+        when IDLE =>
+
+          -- Prepare a new block.
+          a_freq          <= (others => 0);
+          a_used          <= (others => 0);
+          a_total         <= (others => 0);
+          int_token_count <= 0;
+          int_raw_count   <= 0;
+          int_fixed_bits  <= 0;
+          int_extra_bits  <= 0;
+          int_tree_bits   <= 0;
+          state           <= COLLECT;
+
+        when COLLECT =>
+
+          -- Buffer the tokens and count the symbol frequencies.
+          v_int_count := int_token_count;
+          v_a_used    := a_used;
+          v_a_total   := a_total;
+          v_int_raw   := int_raw_count;
+          v_int_fixed := int_fixed_bits;
+          v_int_extra := int_extra_bits;
+
+          if (isl_valid = '1') then
+            v_int_count := v_int_count + 1;
+
+            if (islv_data(islv_data'high) = '0') then
+              v_int_symbol := C_LIT_BASE + to_integer(unsigned(islv_data(islv_data'high - 1 downto islv_data'high - 8)));
+              if (a_freq(v_int_symbol) = 0) then
+                v_a_used(0) := v_a_used(0) + 1;
+              end if;
+              a_freq(v_int_symbol) <= a_freq(v_int_symbol) + 1;
+              v_a_total(0)         := v_a_total(0) + 1;
+
+              v_int_fixed := v_int_fixed + C_FIXED_LENGTH(v_int_symbol);
+              if (C_STORED_FALLBACK = 1) then
+                v_int_raw := v_int_raw + 1;
+              end if;
+            else
+              v_int_length   := to_integer(unsigned(islv_data(C_MATCH_LENGTH_BITS - 1 downto 0)));
+              v_int_distance := to_integer(unsigned(islv_data(islv_data'high - 1 downto C_MATCH_LENGTH_BITS)));
+
+              v_int_symbol := C_LIT_BASE + get_length_code(v_int_length).value;
+              if (a_freq(v_int_symbol) = 0) then
+                v_a_used(0) := v_a_used(0) + 1;
+              end if;
+              a_freq(v_int_symbol) <= a_freq(v_int_symbol) + 1;
+              v_a_total(0)         := v_a_total(0) + 1;
+              v_int_fixed          := v_int_fixed + C_FIXED_LENGTH(v_int_symbol);
+
+              v_int_symbol := C_DIST_BASE + get_distance_code(v_int_distance).value;
+              if (a_freq(v_int_symbol) = 0) then
+                v_a_used(1) := v_a_used(1) + 1;
+              end if;
+              a_freq(v_int_symbol) <= a_freq(v_int_symbol) + 1;
+              v_a_total(1)         := v_a_total(1) + 1;
+              v_int_fixed          := v_int_fixed + C_FIXED_LENGTH(v_int_symbol);
+
+              v_int_extra := v_int_extra + get_length_extra_code(v_int_length).bits +
+                             get_distance_extra_code(v_int_distance).bits;
+              if (C_STORED_FALLBACK = 1) then
+                v_int_raw := v_int_raw + v_int_length;
+              end if;
+            end if;
+          end if;
+
+          -- The block ends, when the token buffer is full or when there is no more input.
+          -- For the stored fallback, the next match has to fit into the stored block, too.
+          if (v_int_count = C_BLOCK_SIZE or
+              (isl_valid = '0' and sl_flush = '1') or
+              (C_STORED_FALLBACK = 1 and isl_valid = '0' and v_int_raw + C_MAX_MATCH_LENGTH > C_MAX_RAW_BLOCK)) then
+            if (isl_valid = '0' and sl_flush = '1') then
+              sl_flush <= '0';
+              sl_final <= '1';
+            end if;
+
+            -- Each block is terminated by an end of block symbol.
+            a_freq(C_EOB) <= 1;
+            v_a_used(0)   := v_a_used(0) + 1;
+            v_a_total(0)  := v_a_total(0) + 1;
+            v_int_fixed   := v_int_fixed + C_FIXED_LENGTH(C_EOB);
+
+            if (C_BTYPE = 1) then
+              a_length <= C_FIXED_LENGTH;
+              a_code   <= C_FIXED_CODE;
+              state    <= SELECT_BTYPE;
+            else
+              int_tree <= 0;
+              state    <= TREE_PREPARE;
+            end if;
+          end if;
+
+          int_token_count <= v_int_count;
+          a_used          <= v_a_used;
+          a_total         <= v_a_total;
+          int_raw_count   <= v_int_raw;
+          int_fixed_bits  <= v_int_fixed;
+          int_extra_bits  <= v_int_extra;
+
+        when TREE_PREPARE =>
+
+          v_a_used  := a_used;
+          v_a_total := a_total;
+
+          -- Decoders expect at least two codes per tree. Add dummy symbols if needed.
+          for dummy in 0 to 1 loop
+
+            if (v_a_used(int_tree) < 2 and a_freq(C_TREE_BASE(int_tree) + dummy) = 0) then
+              a_freq(C_TREE_BASE(int_tree) + dummy) <= 1;
+              v_a_used(int_tree)                    := v_a_used(int_tree) + 1;
+              v_a_total(int_tree)                   := v_a_total(int_tree) + 1;
+            end if;
+
+          end loop;
+
+          -- The offset assures that no code gets longer than the maximum length.
+          v_int_adjust       := v_a_total(int_tree) / 2 ** C_TREE_SHIFT(int_tree) + 1;
+          int_adjust         <= v_int_adjust;
+          int_total_adjusted <= v_a_total(int_tree) + v_a_used(int_tree) * v_int_adjust;
+
+          int_index      <= 0;
+          int_kraft      <= 0;
+          int_max_symbol <= 0;
+          a_bl_count     <= (others => 0);
+          state          <= TREE_LENGTHS;
+
+        when TREE_LENGTHS =>
+
+          v_int_symbol := C_TREE_BASE(int_tree) + int_index;
+          if (a_freq(v_int_symbol) /= 0) then
+            v_int_code_len := max_int(1, get_code_length(a_freq(v_int_symbol) + int_adjust, int_total_adjusted));
+
+            a_length(v_int_symbol)     <= v_int_code_len;
+            a_bl_count(v_int_code_len) <= a_bl_count(v_int_code_len) + 1;
+            int_kraft                  <= int_kraft + 2 ** (v_int_max_len - v_int_code_len);
+            int_max_symbol             <= int_index;
+          else
+            a_length(v_int_symbol) <= 0;
+          end if;
+
+          if (int_index = C_TREE_SYMBOLS(int_tree) - 1) then
+            int_index  <= 0;
+            sl_changed <= '0';
+            state      <= TREE_SHORTEN;
+          else
+            int_index <= int_index + 1;
+          end if;
+
+        when TREE_SHORTEN =>
+
+          -- Shorten codes as long as the Kraft inequality allows it.
+          v_int_symbol   := C_TREE_BASE(int_tree) + int_index;
+          v_int_code_len := a_length(v_int_symbol);
+          v_sl_changed   := sl_changed;
+          if (v_int_code_len > 1 and
+              int_kraft + 2 ** (v_int_max_len - v_int_code_len) <= 2 ** v_int_max_len) then
+            a_length(v_int_symbol)         <= v_int_code_len - 1;
+            a_bl_count(v_int_code_len)     <= a_bl_count(v_int_code_len) - 1;
+            a_bl_count(v_int_code_len - 1) <= a_bl_count(v_int_code_len - 1) + 1;
+            int_kraft                      <= int_kraft + 2 ** (v_int_max_len - v_int_code_len);
+            v_sl_changed                   := '1';
+          end if;
+
+          if (int_index = C_TREE_SYMBOLS(int_tree) - 1) then
+            int_index  <= 0;
+            sl_changed <= '0';
+            -- Repeat until nothing changes anymore.
+            if (v_sl_changed = '0') then
+              state <= TREE_NEXT_CODE;
+            end if;
+          else
+            int_index  <= int_index + 1;
+            sl_changed <= v_sl_changed;
+          end if;
+
+        when TREE_NEXT_CODE =>
+
+          -- RFC 1951, 3.2.2. Use of Huffman coding in the "deflate" format
+          v_int_code := 0;
+
+          for bits in 1 to 15 loop
+
+            v_int_code        := (v_int_code + a_bl_count(bits - 1)) * 2;
+            a_next_code(bits) <= v_int_code;
+
+          end loop;
+
+          state <= TREE_ASSIGN;
+
+        when TREE_ASSIGN =>
+
+          v_int_symbol   := C_TREE_BASE(int_tree) + int_index;
+          v_int_code_len := a_length(v_int_symbol);
+          if (v_int_code_len /= 0) then
+            a_code(v_int_symbol)        <= a_next_code(v_int_code_len);
+            a_next_code(v_int_code_len) <= a_next_code(v_int_code_len) + 1;
+          end if;
+          int_tree_bits <= int_tree_bits + a_freq(v_int_symbol) * v_int_code_len;
+
+          if (int_index /= C_TREE_SYMBOLS(int_tree) - 1) then
+            int_index <= int_index + 1;
+          else
+            int_index <= 0;
+
+            case int_tree is
+
+              when 0 =>
+
+                int_hlit <= int_max_symbol + 1;
+                int_tree <= 1;
+                state    <= TREE_PREPARE;
+
+              when 1 =>
+
+                int_hdist      <= int_max_symbol + 1;
+                int_seq_index  <= 0;
+                int_seq_length <= int_hlit + int_max_symbol + 1;
+                int_run_length <= 0;
+                int_cl_count   <= 0;
+                state          <= RLE_SCAN;
+
+              when 2 =>
+
+                v_int_hclen := 4;
+
+                for i in 4 to 18 loop
+
+                  if (a_length(C_CL_BASE + C_CODE_LENGTH_ORDER(i)) /= 0) then
+                    v_int_hclen := i + 1;
+                  end if;
+
+                end loop;
+
+                int_hclen <= v_int_hclen;
+                state     <= SELECT_BTYPE;
+
+            end case;
+
+          end if;
+
+        when RLE_SCAN =>
+
+          -- Find runs of the same code length in the literal/length and distance code lengths.
+          if (int_seq_index < int_hlit) then
+            v_int_code_len := a_length(C_LIT_BASE + int_seq_index);
+          else
+            v_int_code_len := a_length(C_DIST_BASE + int_seq_index - int_hlit);
+          end if;
+
+          if (int_seq_index = int_seq_length) then
+            if (int_run_length /= 0) then
+              state <= RLE_EMIT;
+            else
+              int_tree <= 2;
+              state    <= TREE_PREPARE;
+            end if;
+          elsif (int_run_length = 0) then
+            int_run_value  <= v_int_code_len;
+            int_run_length <= 1;
+            sl_run_first   <= '1';
+            int_seq_index  <= int_seq_index + 1;
+          elsif (v_int_code_len = int_run_value) then
+            int_run_length <= int_run_length + 1;
+            int_seq_index  <= int_seq_index + 1;
+          else
+            state <= RLE_EMIT;
+          end if;
+
+        when RLE_EMIT =>
+
+          -- 0 - 15: code length, 16: repeat previous 3 - 6 times,
+          -- 17: repeat zero 3 - 10 times, 18: repeat zero 11 - 138 times
+          if (int_run_value = 0) then
+            if (int_run_length >= 11) then
+              v_int_run  := min_int(int_run_length, 138);
+              v_cl_token := (18, v_int_run - 11);
+            elsif (int_run_length >= 3) then
+              v_int_run  := int_run_length;
+              v_cl_token := (17, v_int_run - 3);
+            else
+              v_int_run  := 1;
+              v_cl_token := (0, 0);
+            end if;
+          elsif (sl_run_first = '0' and int_run_length >= 3) then
+            v_int_run  := min_int(int_run_length, 6);
+            v_cl_token := (16, v_int_run - 3);
+          else
+            v_int_run  := 1;
+            v_cl_token := (int_run_value, 0);
+          end if;
+
+          a_cl_buffer(int_cl_count) <= v_cl_token;
+          int_cl_count              <= int_cl_count + 1;
+
+          v_int_symbol := C_CL_BASE + v_cl_token.int_symbol;
+          if (a_freq(v_int_symbol) = 0) then
+            a_used(2) <= a_used(2) + 1;
+          end if;
+          a_freq(v_int_symbol) <= a_freq(v_int_symbol) + 1;
+          a_total(2)           <= a_total(2) + 1;
+          int_extra_bits       <= int_extra_bits + get_cl_extra_bits(v_cl_token.int_symbol);
+
+          sl_run_first   <= '0';
+          int_run_length <= int_run_length - v_int_run;
+          if (int_run_length = v_int_run) then
+            state <= RLE_SCAN;
+          end if;
+
+        when SELECT_BTYPE =>
+
+          -- Estimate the size of the encoded block. The stored block contains
+          -- the block header, padding, LEN, NLEN and the uncompressed data.
+          if (C_BTYPE = 1) then
+            v_int_huffman := 3 + int_fixed_bits + int_extra_bits;
+          else
+            v_int_huffman := 3 + 5 + 5 + 4 + 3 * int_hclen + int_tree_bits + int_extra_bits;
+          end if;
+
+          if (C_STORED_FALLBACK = 1 and 3 + 7 + 32 + 8 * int_raw_count < v_int_huffman) then
+            state <= STORED_HEADER;
+          else
+            sl_raw_skip <= '1';
+            int_index   <= 0;
+            state       <= HEADER;
+          end if;
+
+        when HEADER =>
+
+          if (sl_aggregator_rdy = '1') then
+            if (C_BTYPE = 1) then
+              -- BFINAL, BTYPE
+              send(revert_bits(v_int_final + C_BTYPE * 2, 3), 3);
+              start_tokens;
+            elsif (int_index = 0) then
+              -- BFINAL, BTYPE, HLIT
+              send(revert_bits(v_int_final + C_BTYPE * 2 + (int_hlit - 257) * 8, 8), 8);
+              int_index <= 1;
+            else
+              -- HDIST, HCLEN
+              send(revert_bits((int_hdist - 1) + (int_hclen - 4) * 32, 9), 9);
+              int_index <= 0;
+              state     <= HEADER_CL_LENGTHS;
+            end if;
+          end if;
+
+        when HEADER_CL_LENGTHS =>
+
+          if (sl_aggregator_rdy = '1') then
+            send(revert_bits(a_length(C_CL_BASE + C_CODE_LENGTH_ORDER(int_index)), 3), 3);
+            if (int_index = int_hclen - 1) then
+              int_index <= 0;
+              state     <= HEADER_CL_SYMBOLS;
+            else
+              int_index <= int_index + 1;
+            end if;
+          end if;
+
+        when HEADER_CL_SYMBOLS =>
+
+          if (sl_aggregator_rdy = '1') then
+            v_cl_token     := a_cl_buffer(int_index);
+            v_int_symbol   := C_CL_BASE + v_cl_token.int_symbol;
+            v_int_code_len := a_length(v_int_symbol);
+            v_int_bits     := get_cl_extra_bits(v_cl_token.int_symbol);
+
+            -- The code is followed by the extra bits.
+            send(a_code(v_int_symbol) * 2 ** v_int_bits + revert_bits(v_cl_token.int_extra, v_int_bits),
+                 v_int_code_len + v_int_bits);
+
+            if (int_index = int_cl_count - 1) then
+              start_tokens;
+            else
+              int_index <= int_index + 1;
+            end if;
+          end if;
+
+        when TOKEN_FETCH =>
+
+          -- One cycle read delay of the token buffer.
+          state <= TOKEN_LITERAL_LENGTH;
+
+        when TOKEN_LITERAL_LENGTH =>
+
+          if (sl_aggregator_rdy = '1') then
+            if (slv_token(slv_token'high) = '0') then
+              v_int_symbol := C_LIT_BASE + to_integer(unsigned(slv_token(slv_token'high - 1 downto slv_token'high - 8)));
+              send(a_code(v_int_symbol), a_length(v_int_symbol));
+              next_token;
+            else
+              v_int_length   := to_integer(unsigned(slv_token(C_MATCH_LENGTH_BITS - 1 downto 0)));
+              v_int_distance := to_integer(unsigned(slv_token(slv_token'high - 1 downto C_MATCH_LENGTH_BITS)));
+              v_int_symbol   := C_LIT_BASE + get_length_code(v_int_length).value;
+              send(a_code(v_int_symbol), a_length(v_int_symbol));
+
+              int_match_length   <= v_int_length;
+              int_match_distance <= v_int_distance;
+              state              <= TOKEN_LENGTH_EXTRA;
+            end if;
+          end if;
+
+        when TOKEN_LENGTH_EXTRA =>
+
+          if (sl_aggregator_rdy = '1') then
+            v_code := get_length_extra_code(int_match_length);
+            if (v_code.bits /= 0) then
+              send(revert_bits(v_code.value, v_code.bits), v_code.bits);
+            end if;
+            state <= TOKEN_DISTANCE;
+          end if;
+
+        when TOKEN_DISTANCE =>
+
+          if (sl_aggregator_rdy = '1') then
+            v_int_symbol := C_DIST_BASE + get_distance_code(int_match_distance).value;
+            send(a_code(v_int_symbol), a_length(v_int_symbol));
+            state        <= TOKEN_DISTANCE_EXTRA;
+          end if;
+
+        when TOKEN_DISTANCE_EXTRA =>
+
+          if (sl_aggregator_rdy = '1') then
+            v_code := get_distance_extra_code(int_match_distance);
+            if (v_code.bits /= 0) then
+              send(revert_bits(v_code.value, v_code.bits), v_code.bits);
+            end if;
+            next_token;
+          end if;
+
+        when EOB =>
+
+          if (sl_aggregator_rdy = '1') then
+            send(a_code(C_EOB), a_length(C_EOB));
+            end_block;
+          end if;
+
+        -- RFC 1951, 3.2.4. Non-compressed blocks (BTYPE=00)
+        when STORED_HEADER =>
+
+          if (sl_aggregator_rdy = '1') then
+            -- BFINAL, BTYPE
+            send(revert_bits(v_int_final, 3), 3);
+            state <= STORED_PAD;
+          end if;
+
+        when STORED_PAD =>
+
+          -- LEN starts at the next byte boundary.
+          if (aggregator.sl_valid_in = '0' and sl_aggregator_rdy = '1') then
+            if (buffer32.int_current_index mod 8 /= 0) then
+              send(0, 8 - buffer32.int_current_index mod 8);
+            end if;
+            state <= STORED_LENGTH;
+          end if;
+
+        when STORED_LENGTH =>
+
+          if (sl_aggregator_rdy = '1') then
+            send(revert_bits(int_raw_count, 16), 16);
+            state <= STORED_NLENGTH;
+          end if;
+
+        when STORED_NLENGTH =>
+
+          if (sl_aggregator_rdy = '1') then
+            send(revert_bits(2 ** 16 - 1 - int_raw_count, 16), 16);
+            state <= STORED_DATA;
+          end if;
+
+        when STORED_DATA =>
+
+          -- One datum per cycle is read from the buffer.
+          if (int_raw_count = 0) then
+            end_block;
+          elsif (sl_aggregator_rdy = '1') then
+            send(to_integer(unsigned(revert_vector(slv_raw_data_out))), 8);
+            int_raw_count <= int_raw_count - 1;
+          end if;
+
+        when PAD =>
+
+          -- Wait until all bits arrived at the aggregator and there is space for the padding.
+          if (aggregator.sl_valid_in = '0' and sl_aggregator_rdy = '1') then
+            if (buffer32.int_current_index mod 8 /= 0) then
+              -- pad zeros (for full byte) at the end
+              send(0, 8 - buffer32.int_current_index mod 8);
+            end if;
+            state <= SEND_BYTES_FINAL;
+          end if;
+
+        when SEND_BYTES_FINAL =>
+
+          if (sl_aggregation_finished = '1') then
+            sl_finish <= '1';
+            sl_final  <= '0';
+            state     <= IDLE;
+          end if;
+
+      end case;
+
+    end if;
+
+  end process proc_dynamic_huffman;
+
+  proc_aggregator : process (isl_clk) is
+
+    variable v_slv_data_out      : std_logic_vector(oslv_data'range);
+    variable v_int_current_index : integer range 0 to buffer32.slv_data'length - 1;
+
+  begin
+
+    if (rising_edge(isl_clk)) then
+      sl_valid_out            <= '0';
+      sl_aggregation_finished <= '0';
+
+      -- Output of aggregator.
+      v_int_current_index := buffer32.int_current_index;
+      if (v_int_current_index >= 8) then
+        if (isl_get = '1') then
+          sl_valid_out        <= '1';
+          v_slv_data_out      := buffer32.slv_data(v_int_current_index - 1 downto v_int_current_index - 8);
+          slv_data_out        <= revert_vector(v_slv_data_out);
+          v_int_current_index := v_int_current_index - 8;
+        end if;
+      elsif (state = SEND_BYTES_FINAL and aggregator.sl_valid_in = '0') then
+        sl_aggregation_finished <= '1';
+      end if;
+
+      -- Input to aggregator.
+      if (aggregator.sl_valid_in = '1') then
+        v_int_current_index := v_int_current_index + aggregator.int_bits;
+
+        -- shift the whole buffer
+        for pos in buffer32.slv_data'range loop
+
+          buffer32.slv_data(pos) <= buffer32.slv_data((pos - aggregator.int_bits) mod buffer32.slv_data'length);
+
+        end loop;
+
+        -- insert new values, maximum 16 (aggregator.int_bits)
+        for pos in 0 to aggregator.slv_data_in'high loop
+
+          exit when pos = aggregator.int_bits;
+          buffer32.slv_data(pos) <= aggregator.slv_data_in(pos);
+
+        end loop;
+
+      end if;
+
+      buffer32.int_current_index <= v_int_current_index;
+    end if;
+
+  end process proc_aggregator;
+
+  -- The aggregator can take a new value, if there are at least 16 free bits in the next cycle.
+  -- A byte is only sent, if the next stage is ready.
+  int_next_index    <= buffer32.int_current_index - 8 when buffer32.int_current_index >= 8 and isl_get = '1' else
+                       buffer32.int_current_index;
+  sl_aggregator_rdy <= '1' when (aggregator.sl_valid_in = '0' and int_next_index <= 15) or
+                                (aggregator.sl_valid_in = '1' and int_next_index + aggregator.int_bits <= 15) else
+                       '0';
+
+  -- Tokens are accepted only while collecting and there is space in the token buffer.
+  -- The token of the current cycle has to be considered, too.
+  -- For the stored fallback, a match of the current and the next token have to fit into the block.
+  sl_raw_space <= '1' when C_STORED_FALLBACK = 0 or
+                           (isl_valid = '0' and int_raw_count + C_MAX_MATCH_LENGTH <= C_MAX_RAW_BLOCK) or
+                           int_raw_count + 2 * C_MAX_MATCH_LENGTH <= C_MAX_RAW_BLOCK else
+                  '0';
+  osl_rdy      <= '1' when state = COLLECT and sl_raw_space = '1' and
+                           (int_token_count < C_BLOCK_SIZE - 1 or (int_token_count = C_BLOCK_SIZE - 1 and isl_valid = '0')) else
+                  '0';
+
+  oslv_data  <= slv_data_out;
+  osl_valid  <= sl_valid_out;
+  osl_finish <= sl_finish;
+
+end architecture behavioral;
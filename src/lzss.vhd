@@ -13,15 +13,22 @@ entity lzss is
     C_INPUT_BUFFER_SIZE     : integer range 3 to 258   := 10;
     C_SEARCH_BUFFER_SIZE    : integer range 1 to 32768 := 12;
     C_MIN_MATCH_LENGTH      : integer range 3 to 16    := 3;
-    C_MAX_MATCH_LENGTH_USER : integer                  := 8
+    C_MAX_MATCH_LENGTH_USER : integer                  := 8;
+
+    -- 0: first match (the match with the largest offset gets extended)
+    -- 1: longest match (the match length of all offsets is compared)
+    -- 2: longest match with lazy matching
+    C_MATCH_MODE : integer range 0 to 2 := 0
   );
   port (
     isl_clk    : in    std_logic;
     isl_flush  : in    std_logic;
+    isl_get    : in    std_logic;
     isl_valid  : in    std_logic;
     islv_data  : in    std_logic_vector(7 downto 0);
     oslv_data  : out   std_logic_vector(calc_huffman_bitwidth(1, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER) - 1 downto 0);
     osl_valid  : out   std_logic;
+    osl_rdy    : out   std_logic;
     osl_finish : out   std_logic
   );
 end entity lzss;
@@ -36,47 +43,76 @@ architecture behavioral of lzss is
 
   type t_slv_buffer is array(C_SEARCH_BUFFER_SIZE downto -(C_INPUT_BUFFER_SIZE - 1)) of std_logic_vector(7 downto 0);
 
-  signal a_buffer : t_slv_buffer := (others => (others => 'U'));
+  signal a_buffer : t_slv_buffer := (others => (others => '0'));
+
+  -- Marks the valid datums of the input buffer. The input buffer gets padded
+  -- with invalid datums at the end, to push the last datums through the pipeline.
+
+  type t_sl_buffer is array(0 downto -(C_INPUT_BUFFER_SIZE - 1)) of std_logic;
+
+  signal a_valid : t_sl_buffer := (others => '0');
+
+  -- Amount of valid datums in the search buffer. Prevents matches with
+  -- the initial content or with the content of a previous stream.
+  signal int_history : integer range 0 to C_SEARCH_BUFFER_SIZE := 0;
 
   type t_match is record
     -- Maximum is 15 bit distance/offset and 8 bit length.
-    int_offset     : integer range 0 to C_SEARCH_BUFFER_SIZE;
-    int_length     : integer range 0 to C_MAX_MATCH_LENGTH;
-    slv_next_datum : std_logic_vector(7 downto 0);
+    -- Offset = 0 means no match found, i. e. a literal.
+    sl_valid   : std_logic;
+    int_offset : integer range 0 to C_SEARCH_BUFFER_SIZE;
+    int_length : integer range 0 to C_MAX_MATCH_LENGTH;
+    slv_datum  : std_logic_vector(7 downto 0);
   end record t_match;
 
-  signal rec_best_match : t_match := (0, 0, (others => '0'));
+  -- Pipeline stages:
+  -- 1. Shift the window and find the match offset of the current datum.
+  --    For the longest match: Find the match length of all offsets.
+  -- 2. Find the match length of the offset, found in stage 1.
+  --    For the longest match: Select the offset with the longest match.
+  -- 3. Emit a literal or match and skip the datums, covered by a match.
+  -- All stages advance together. One datum is processed per cycle.
+  signal rec_stage_offset : t_match := ('0', 0, 0, (others => '0'));
+  signal rec_stage_length : t_match := ('0', 0, 0, (others => '0'));
+  signal rec_best_match   : t_match := ('0', 0, 0, (others => '0'));
+
+  -- Match lengths of all offsets. Only used for the longest match.
 
-  type t_states is (IDLE, FILL, FAST_FILL, FIND_MATCH_OFFSET, FIND_MATCH_LENGTH);
+  type t_match_lengths is array(1 to C_SEARCH_BUFFER_SIZE) of integer range 0 to C_MAX_MATCH_LENGTH;
 
-  signal state : t_states := IDLE;
+  signal a_match_lengths : t_match_lengths := (others => 0);
 
-  signal int_datums_to_fill : integer range 0 to C_INPUT_BUFFER_SIZE := 0;
-  signal sl_valid_out       : std_logic                              := '0';
+  -- Amount of datums that are covered by the last emitted match.
+  signal int_datums_to_skip : integer range 0 to C_MAX_MATCH_LENGTH := 0;
 
-  signal int_datums_to_flush : integer range 0 to C_INPUT_BUFFER_SIZE := 0;
-  signal sl_last_input       : std_logic                              := '0';
-  signal sl_flush            : std_logic                              := '0';
-  signal sl_finish           : std_logic                              := '0';
+  signal sl_valid_out : std_logic := '0';
 
-  signal int_match_offset : integer range 0 to C_SEARCH_BUFFER_SIZE;
+  -- Invalid datums to shift in at the end. The last datum has to pass the input buffer
+  -- and the two following pipeline stages.
+  signal int_datums_to_flush : integer range 0 to C_INPUT_BUFFER_SIZE + 2 := 0;
+  signal sl_last_input       : std_logic                                  := '0';
+  signal sl_flush            : std_logic                                  := '0';
+  signal sl_finish           : std_logic                                  := '0';
+  signal sl_advance          : std_logic                                  := '0';
 
   -- Helper signals to visualize the output better.
   signal slv_literal_data : std_logic_vector(oslv_data'high - 1 downto oslv_data'low);
-  signal slv_match_offset : std_logic_vector(max_int(log2(C_SEARCH_BUFFER_SIZE), 8 - log2(C_MAX_MATCH_LENGTH + 1)) - 1 downto 0);
+  signal slv_match_offset : std_logic_vector(max_int(log2(C_SEARCH_BUFFER_SIZE + 1), 8 - log2(C_MAX_MATCH_LENGTH + 1)) - 1 downto 0);
   signal slv_match_length : std_logic_vector(log2(C_MAX_MATCH_LENGTH + 1) - 1 downto 0);
 
-  -- Input buffer BRAM.
-  constant C_ADDR_WIDTH      : integer                                     := 9;
-  signal   slv_bram_raddr    : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
-  signal   slv_bram_raddr_d1 : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
-  signal   slv_bram_waddr    : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
-  signal   slv_bram_waddr_d1 : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
-  signal   slv_bram_data_out : std_logic_vector(islv_data'range);
+  -- Input buffer BRAM. It decouples the input from the pipeline,
+  -- which can be stalled by the next stage.
+  constant C_ADDR_WIDTH        : integer                                     := 9;
+  constant C_FIFO_MARGIN       : integer                                     := 16;
+  signal   slv_bram_raddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_raddr_next : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_waddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_data_out   : std_logic_vector(islv_data'range);
+  signal   sl_bram_data_valid  : std_logic                                   := '0';
 
 begin
 
-  i_input_buffer : entity png_lib.bram
+  i_input_buffer : entity png_lib.bram(rtl)
     generic map (
       C_ADDR_WIDTH => C_ADDR_WIDTH,
       C_DATA_WIDTH => 8
@@ -88,15 +124,33 @@ begin
       islv_waddr => slv_bram_waddr,
       islv_data  => islv_data,
 
-      islv_raddr => slv_bram_raddr,
+      islv_raddr => slv_bram_raddr_next,
       oslv_data  => slv_bram_data_out
     );
 
+  -- The pipeline advances, if there is a new datum (or padding at the end) and
+  -- the output isn't blocked. Datums that are covered by a match can always be skipped.
+  sl_advance <= '1' when (sl_bram_data_valid = '1' or int_datums_to_flush /= 0) and
+                         (isl_get = '1' or rec_stage_length.sl_valid = '0' or int_datums_to_skip /= 0) else
+                '0';
+
+  -- Read the next datum already, when the current one gets consumed.
+  -- This allows to read one datum per cycle.
+  slv_bram_raddr_next <= std_logic_vector(unsigned(slv_bram_raddr) + 1) when sl_advance = '1' and sl_bram_data_valid = '1' else
+                         slv_bram_raddr;
+
+  -- Leave some margin for the datums that are already on the way.
+  osl_rdy <= '1' when unsigned(slv_bram_waddr) - unsigned(slv_bram_raddr) < 2 ** C_ADDR_WIDTH - C_FIFO_MARGIN else
+             '0';
+
   proc_lzss : process (isl_clk) is
 
     variable v_int_match_length : integer range C_MIN_MATCH_LENGTH to C_MAX_MATCH_LENGTH;
     -- Search index = 0 means no match found.
     variable v_int_match_offset : integer range 0 to C_SEARCH_BUFFER_SIZE;
+    variable v_sl_lookahead_ok  : boolean;
+    variable v_int_length       : integer range 0 to C_MAX_MATCH_LENGTH;
+    variable v_rec_next_match   : t_match;
 
   begin
 
@@ -109,165 +163,184 @@ begin
         slv_bram_waddr <= std_logic_vector(unsigned(slv_bram_waddr) + 1);
       end if;
 
-      -- One cycle write and read delay.
-      slv_bram_waddr_d1 <= slv_bram_waddr;
-      slv_bram_raddr_d1 <= slv_bram_raddr;
+      -- One cycle read delay. The datum is valid, if it was written before.
+      slv_bram_raddr <= slv_bram_raddr_next;
+      if (slv_bram_raddr_next /= slv_bram_waddr) then
+        sl_bram_data_valid <= '1';
+      else
+        sl_bram_data_valid <= '0';
+      end if;
 
       if (isl_flush = '1') then
         sl_flush <= '1';
       end if;
 
-      case state is
-
-        when IDLE =>
-
-          int_datums_to_fill <= C_INPUT_BUFFER_SIZE;
-          state              <= FILL;
-
-        when FILL =>
-
-          -- TODO: Simplify this state.
-
-          -- Fill the buffer at three occasions:
-          -- 1. Initially.
-          -- 2. After a match or literal.
-          -- 3. For flushing at the end.
-          if (slv_bram_waddr_d1 /= slv_bram_raddr) then
-            -- First cycle: Assign new BRAM address.
-            -- Second cycle: Assign BRAM output.
-            if (slv_bram_raddr = slv_bram_raddr_d1) then
-              slv_bram_raddr <= std_logic_vector(unsigned(slv_bram_raddr) + 1);
-
-              int_datums_to_fill <= int_datums_to_fill - 1;
-              a_buffer           <= a_buffer(a_buffer'left - 1 downto a_buffer'right) & slv_bram_data_out;
+      -- Start flushing, when all datums were read from the input buffer.
+      if (sl_flush = '1' and sl_bram_data_valid = '0' and isl_valid = '0' and
+          slv_bram_raddr = slv_bram_waddr and int_datums_to_flush = 0) then
+        sl_flush            <= '0';
+        int_datums_to_flush <= C_INPUT_BUFFER_SIZE + 2;
+      end if;
 
-              if (int_datums_to_fill - 1 = 0) then
-                state          <= FIND_MATCH_OFFSET;
-                rec_best_match <= (0, 0, a_buffer(-1));
-              end if;
-            end if;
-          elsif (sl_flush = '1') then
-            sl_flush            <= '0';
-            int_datums_to_flush <= C_INPUT_BUFFER_SIZE - 1;
-          elsif (int_datums_to_flush /= 0) then
-            int_datums_to_fill  <= int_datums_to_fill - 1;
-            a_buffer            <= a_buffer(a_buffer'left - 1 downto a_buffer'right) & "UUUUUUUU";
-            int_datums_to_flush <= int_datums_to_flush - 1;
-            if (int_datums_to_flush = 1) then
-              sl_last_input <= '1';
-            end if;
+      if (sl_last_input = '1') then
+        sl_last_input <= '0';
+        sl_finish     <= '1';
+        int_history   <= 0;
+      end if;
 
-            if (int_datums_to_fill - 1 = 0) then
-              state          <= FIND_MATCH_OFFSET;
-              rec_best_match <= (0, 0, a_buffer(-1));
-            end if;
-          elsif (sl_last_input = '1') then
-            sl_last_input <= '0';
-            state         <= IDLE;
-            sl_finish     <= '1';
+      if (sl_advance = '1') then
+        ------------------------------------------------------------------------
+        -- stage 1: shift the window and find the match offset
+        ------------------------------------------------------------------------
+
+        if (sl_bram_data_valid = '1') then
+          a_buffer <= a_buffer(a_buffer'left - 1 downto a_buffer'right) & slv_bram_data_out;
+          a_valid  <= a_valid(a_valid'left - 1 downto a_valid'right) & '1';
+        else
+          a_buffer <= a_buffer(a_buffer'left - 1 downto a_buffer'right) & x"00";
+          a_valid  <= a_valid(a_valid'left - 1 downto a_valid'right) & '0';
+
+          int_datums_to_flush <= int_datums_to_flush - 1;
+          if (int_datums_to_flush = 1) then
+            sl_last_input <= '1';
           end if;
+        end if;
 
-        when FAST_FILL =>
+        -- Try to find the first C_MIN_MATCH_LENGTH elements of the input buffer
+        -- in the search buffer.
+        v_sl_lookahead_ok := true;
 
-          int_datums_to_fill <= int_datums_to_fill - 1;
-          a_buffer           <= a_buffer(a_buffer'left - 1 downto a_buffer'right) & slv_bram_data_out;
+        for current_index in 0 to C_MIN_MATCH_LENGTH - 1 loop
 
-          if (int_datums_to_fill - 1 = 0) then
-            state          <= FIND_MATCH_OFFSET;
-            rec_best_match <= (0, 0, a_buffer(-1));
-          else
-            slv_bram_raddr <= std_logic_vector(unsigned(slv_bram_raddr) + 1);
+          if (a_valid(-current_index) = '0') then
+            v_sl_lookahead_ok := false;
           end if;
 
-        when FIND_MATCH_OFFSET =>
+        end loop;
 
-          -- Try to find the first C_MIN_MATCH_LENGTH elements of the input buffer
-          -- in the search buffer.
-          v_int_match_offset := 0;
+        v_int_match_offset := 0;
+        if (C_MATCH_MODE = 0) then
 
           for current_index in 1 to C_SEARCH_BUFFER_SIZE loop
 
             -- TODO: We look in the input buffer for searching.
-            if (a_buffer(current_index downto current_index - C_MIN_MATCH_LENGTH + 1) =
+            if (v_sl_lookahead_ok and current_index <= int_history and
+                a_buffer(current_index downto current_index - C_MIN_MATCH_LENGTH + 1) =
                 a_buffer(0 downto - C_MIN_MATCH_LENGTH + 1)) then
               v_int_match_offset := current_index;
             end if;
 
           end loop;
 
-          if (v_int_match_offset = 0) then
-            -- literal
-            int_datums_to_fill <= 1;
-
-            -- output
-            sl_valid_out <= '1';
-            if (sl_last_input = '0') then
-              state <= FILL;
-            else
-              sl_last_input <= '0';
-              state         <= IDLE;
-              sl_finish     <= '1';
-            end if;
-          else
-            -- match
-            state            <= FIND_MATCH_LENGTH;
-            int_match_offset <= v_int_match_offset;
-          end if;
+        else
+          -- Compare the input buffer with all offsets in parallel.
+          for current_index in 1 to C_SEARCH_BUFFER_SIZE loop
+
+            v_int_length := 0;
+            if (current_index <= int_history) then
 
-        when FIND_MATCH_LENGTH =>
+              for match_length in 0 to C_MAX_MATCH_LENGTH - 1 loop
 
-          -- Get the length of the match if a matching element was found.
-          -- I. e. try to match the next elements of search and input buffer.
+                exit when a_valid(-match_length) = '0' or
+                          a_buffer(current_index - match_length) /= a_buffer(-match_length);
+                v_int_length := match_length + 1;
 
-          -- Note: v_int_match_length is one-based, match_length and input buffer are zero-based.
-          v_int_match_length := C_MAX_MATCH_LENGTH;
+              end loop;
 
-          for match_length in C_MIN_MATCH_LENGTH to C_MAX_MATCH_LENGTH - 1 loop
+            end if;
 
-            if (a_buffer(int_match_offset - match_length) /= a_buffer(-match_length)) then
-              -- Don't look for further matches, since we got a mismatch.
-              -- Assign the match length of the last loop, since it was the last match.
-              v_int_match_length := match_length;
-              exit;
+            if (v_int_length < C_MIN_MATCH_LENGTH) then
+              v_int_length := 0;
             end if;
+            a_match_lengths(current_index) <= v_int_length;
 
           end loop;
 
-          rec_best_match <= (int_match_offset, v_int_match_length, a_buffer(-v_int_match_length + 1));
+        end if;
 
-          int_datums_to_fill <= v_int_match_length;
+        rec_stage_offset <= (a_valid(0), v_int_match_offset, 0, a_buffer(0));
 
-          -- output
-          sl_valid_out <= '1';
-          if (sl_last_input = '0') then
-            -- Use fast fill to avoid BRAM overflow.
-            -- Add C_MAX_MATCH_LENGTH instead of v_int_match_length to relax timing.
-            if (sl_flush = '0' and unsigned(slv_bram_raddr) + C_MAX_MATCH_LENGTH < unsigned(slv_bram_waddr)) then
-              state          <= FAST_FILL;
-              slv_bram_raddr <= std_logic_vector(unsigned(slv_bram_raddr) + 1);
-            else
-              state <= FILL;
-            end if;
-          else
-            sl_last_input <= '0';
-            state         <= IDLE;
-            sl_finish     <= '1';
+        if (a_valid(0) = '1' and int_history /= C_SEARCH_BUFFER_SIZE) then
+          int_history <= int_history + 1;
+        end if;
+
+        ------------------------------------------------------------------------
+        -- stage 2: find the match length
+        ------------------------------------------------------------------------
+
+        -- Get the length of the match if a matching element was found.
+        -- I. e. try to match the next elements of search and input buffer.
+        -- The window was shifted by one datum since stage 1. Hence all indices are increased by one.
+
+        -- Note: v_int_match_length is one-based, match_length and input buffer are zero-based.
+        v_int_match_length := C_MAX_MATCH_LENGTH;
+
+        for match_length in C_MIN_MATCH_LENGTH to C_MAX_MATCH_LENGTH - 1 loop
+
+          if (a_valid(-match_length + 1) = '0' or
+              a_buffer(rec_stage_offset.int_offset - match_length + 1) /= a_buffer(-match_length + 1)) then
+            -- Don't look for further matches, since we got a mismatch.
+            -- Assign the match length of the last loop, since it was the last match.
+            v_int_match_length := match_length;
+            exit;
+          end if;
+
+        end loop;
+
+        v_rec_next_match := rec_stage_offset;
+        if (C_MATCH_MODE = 0) then
+          if (rec_stage_offset.int_offset /= 0) then
+            v_rec_next_match.int_length := v_int_match_length;
           end if;
+        else
+          -- Select the longest match. The smallest offset wins in case of equal lengths,
+          -- because it can be encoded with less bits.
+          for current_index in 1 to C_SEARCH_BUFFER_SIZE loop
+
+            if (a_match_lengths(current_index) > v_rec_next_match.int_length) then
+              v_rec_next_match.int_offset := current_index;
+              v_rec_next_match.int_length := a_match_lengths(current_index);
+            end if;
+
+          end loop;
+
+        end if;
+        rec_stage_length <= v_rec_next_match;
 
-      end case;
+        ------------------------------------------------------------------------
+        -- stage 3: emit literal or match
+        ------------------------------------------------------------------------
 
+        if (rec_stage_length.sl_valid = '1') then
+          if (int_datums_to_skip /= 0) then
+            int_datums_to_skip <= int_datums_to_skip - 1;
+          else
+            sl_valid_out   <= '1';
+            rec_best_match <= rec_stage_length;
+            if (C_MATCH_MODE = 2 and rec_stage_length.int_offset /= 0 and
+                v_rec_next_match.sl_valid = '1' and v_rec_next_match.int_length > rec_stage_length.int_length) then
+              -- Lazy matching: The match at the next datum is longer.
+              -- Emit a literal and take the next match instead.
+              rec_best_match.int_offset <= 0;
+              rec_best_match.int_length <= 0;
+            elsif (rec_stage_length.int_offset /= 0) then
+              int_datums_to_skip <= rec_stage_length.int_length - 1;
+            end if;
+          end if;
+        end if;
+      end if;
     end if;
 
   end process proc_lzss;
 
   -- In case of a literal (no match found), fill the output data with zeros.
-  slv_literal_data <= a_buffer(0) & (slv_literal_data'high - a_buffer(0)'length downto 0 => '0');
+  slv_literal_data <= rec_best_match.slv_datum & (slv_literal_data'high - rec_best_match.slv_datum'length downto 0 => '0');
   -- In case of a match, assure that the output bitwidth is at least 8.
   -- 8 bits are needed to represent a literal.
-  slv_match_offset <= std_logic_vector(to_unsigned(rec_best_match.int_offset, max_int(log2(C_SEARCH_BUFFER_SIZE), 8 - log2(C_MAX_MATCH_LENGTH + 1))));
+  slv_match_offset <= std_logic_vector(to_unsigned(rec_best_match.int_offset, max_int(log2(C_SEARCH_BUFFER_SIZE + 1), 8 - log2(C_MAX_MATCH_LENGTH + 1))));
   slv_match_length <= std_logic_vector(to_unsigned(rec_best_match.int_length, log2(C_MAX_MATCH_LENGTH + 1)));
 
-  oslv_data  <= '0' & slv_literal_data when int_datums_to_fill = 1 else
+  oslv_data  <= '0' & slv_literal_data when rec_best_match.int_offset = 0 else
                 '1' & slv_match_offset & slv_match_length;
   osl_valid  <= sl_valid_out;
   osl_finish <= sl_finish;
@@ -0,0 +1,381 @@
+-- LZSS with the search buffer in BRAM.
+-- Match candidates are obtained from a hash table of recent 3 byte prefixes (head of a hash chain).
+-- Resource usage grows with the BRAM size, not with the amount of comparators.
+
+library ieee;
+  use ieee.std_logic_1164.all;
+  use ieee.numeric_std.all;
+
+library png_lib;
+
+library util;
+  use util.math_pkg.all;
+  use util.png_pkg.all;
+
+entity lzss_hash is
+  generic (
+    C_INPUT_BUFFER_SIZE     : integer range 3 to 258   := 10;
+    C_SEARCH_BUFFER_SIZE    : integer range 2 to 32768 := 32768;
+    C_MIN_MATCH_LENGTH      : integer range 3 to 16    := 3;
+    C_MAX_MATCH_LENGTH_USER : integer                  := 8;
+    C_HASH_BITS             : integer range 3 to 16    := 10
+  );
+  port (
+    isl_clk    : in    std_logic;
+    isl_flush  : in    std_logic;
+    isl_get    : in    std_logic;
+    isl_valid  : in    std_logic;
+    islv_data  : in    std_logic_vector(7 downto 0);
+    oslv_data  : out   std_logic_vector(calc_huffman_bitwidth(1, C_INPUT_BUFFER_SIZE, C_SEARCH_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER) - 1 downto 0);
+    osl_valid  : out   std_logic;
+    osl_rdy    : out   std_logic;
+    osl_finish : out   std_logic
+  );
+end entity lzss_hash;
+
+architecture behavioral of lzss_hash is
+
+  constant C_MAX_MATCH_LENGTH : integer := min_int(C_INPUT_BUFFER_SIZE, C_MAX_MATCH_LENGTH_USER);
+
+  -- The hash is calculated of the first three datums of the input buffer.
+  constant C_HASH_LENGTH : integer := 3;
+  constant C_HASH_SHIFT  : integer := (C_HASH_BITS + C_HASH_LENGTH - 1) / C_HASH_LENGTH;
+
+  -- The search buffer contains only the datums before the current position.
+  -- The position needs one more bit to represent the maximum distance.
+  constant C_WINDOW_ADDR_WIDTH : integer := log2(C_SEARCH_BUFFER_SIZE);
+  constant C_POSITION_BITS     : integer := C_WINDOW_ADDR_WIDTH + 1;
+  -- The full window can be referenced, i. e. the offset field has log2(C_SEARCH_BUFFER_SIZE + 1) bits.
+  -- A distance of 2 ** C_WINDOW_ADDR_WIDTH reads the oldest datum, which isn't overwritten until the match ends.
+  constant C_MAX_DISTANCE : integer := C_SEARCH_BUFFER_SIZE;
+
+  -- Input buffer: 0 to C_INPUT_BUFFER_SIZE - 1
+
+  type t_slv_buffer is array(0 to C_INPUT_BUFFER_SIZE - 1) of std_logic_vector(7 downto 0);
+
+  signal a_input_buffer : t_slv_buffer := (others => (others => '0'));
+
+  -- Amount of valid datums in the input buffer.
+  signal int_fill : integer range 0 to C_INPUT_BUFFER_SIZE := 0;
+
+  -- Absolute position of the first datum of the input buffer (modulo 2 ** C_POSITION_BITS).
+  signal u_position : unsigned(C_POSITION_BITS - 1 downto 0) := (others => '0');
+  -- Amount of valid datums in the search buffer.
+  signal int_history : integer range 0 to C_SEARCH_BUFFER_SIZE := 0;
+
+  type t_match is record
+    int_offset : integer range 0 to C_SEARCH_BUFFER_SIZE;
+    int_length : integer range 0 to C_MAX_MATCH_LENGTH;
+  end record t_match;
+
+  signal rec_best_match : t_match                      := (0, 0);
+  signal slv_literal    : std_logic_vector(7 downto 0) := (others => '0');
+
+  type t_states is (FILL, HEAD, COMPARE, EMIT, SKIP);
+
+  signal state : t_states := FILL;
+
+  signal int_datums_to_skip : integer range 0 to C_MAX_MATCH_LENGTH := 0;
+
+  signal sl_valid_out  : std_logic := '0';
+  signal sl_flush      : std_logic := '0';
+  signal sl_input_done : std_logic := '0';
+  signal sl_finish     : std_logic := '0';
+
+  -- Helper signals to visualize the output better.
+  signal slv_literal_data : std_logic_vector(oslv_data'high - 1 downto oslv_data'low);
+  signal slv_match_offset : std_logic_vector(max_int(log2(C_SEARCH_BUFFER_SIZE + 1), 8 - log2(C_MAX_MATCH_LENGTH + 1)) - 1 downto 0);
+  signal slv_match_length : std_logic_vector(log2(C_MAX_MATCH_LENGTH + 1) - 1 downto 0);
+
+  -- Input FIFO BRAM.
+  constant C_ADDR_WIDTH        : integer                                     := 9;
+  constant C_FIFO_MARGIN       : integer                                     := 16;
+  signal   slv_bram_raddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_raddr_next : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_waddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal   slv_bram_data_out   : std_logic_vector(islv_data'range);
+  signal   sl_bram_data_valid  : std_logic                                   := '0';
+  signal   sl_bram_pop         : std_logic                                   := '0';
+
+  -- Search buffer BRAM.
+  signal sl_window_we        : std_logic                                          := '0';
+  signal slv_window_waddr    : std_logic_vector(C_WINDOW_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_window_data_in  : std_logic_vector(7 downto 0)                       := (others => '0');
+  signal slv_window_raddr    : std_logic_vector(C_WINDOW_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_window_data_out : std_logic_vector(7 downto 0);
+  signal u_candidate         : unsigned(C_POSITION_BITS - 1 downto 0)             := (others => '0');
+  signal int_distance        : integer range 0 to 2 ** C_POSITION_BITS - 1        := 0;
+  signal int_read_index      : integer range 0 to C_MAX_MATCH_LENGTH              := 0;
+  signal sl_window_pending   : std_logic                                          := '0';
+
+  -- Hash table BRAM. It contains the last position of each hash.
+  signal sl_hash_we       : std_logic                                      := '0';
+  signal slv_hash         : std_logic_vector(C_HASH_BITS - 1 downto 0)     := (others => '0');
+  signal slv_hash_out     : std_logic_vector(C_POSITION_BITS - 1 downto 0);
+  signal slv_position     : std_logic_vector(C_POSITION_BITS - 1 downto 0) := (others => '0');
+  signal sl_hash_possible : std_logic                                      := '0';
+  signal sl_lookahead_ok  : std_logic                                      := '0';
+
+begin
+
+  i_input_buffer : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_ADDR_WIDTH,
+      C_DATA_WIDTH => 8
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => isl_valid,
+      islv_waddr => slv_bram_waddr,
+      islv_data  => islv_data,
+
+      islv_raddr => slv_bram_raddr_next,
+      oslv_data  => slv_bram_data_out
+    );
+
+  i_search_buffer : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_WINDOW_ADDR_WIDTH,
+      C_DATA_WIDTH => 8
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => sl_window_we,
+      islv_waddr => slv_window_waddr,
+      islv_data  => slv_window_data_in,
+
+      islv_raddr => slv_window_raddr,
+      oslv_data  => slv_window_data_out
+    );
+
+  i_hash_table : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_HASH_BITS,
+      C_DATA_WIDTH => C_POSITION_BITS
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => sl_hash_we,
+      islv_waddr => slv_hash,
+      islv_data  => slv_position,
+
+      islv_raddr => slv_hash,
+      oslv_data  => slv_hash_out
+    );
+
+  slv_position <= std_logic_vector(u_position);
+
+  -- Fill the input buffer, whenever there is space.
+  sl_bram_pop         <= '1' when sl_bram_data_valid = '1' and int_fill /= C_INPUT_BUFFER_SIZE else
+                         '0';
+  slv_bram_raddr_next <= std_logic_vector(unsigned(slv_bram_raddr) + 1) when sl_bram_pop = '1' else
+                         slv_bram_raddr;
+
+  -- Hash of the first datums of the input buffer. See also zlib's UPDATE_HASH.
+  slv_hash <= std_logic_vector(shift_left(resize(unsigned(a_input_buffer(0)), C_HASH_BITS), 2 * C_HASH_SHIFT) xor
+                               shift_left(resize(unsigned(a_input_buffer(1)), C_HASH_BITS), C_HASH_SHIFT) xor
+                               resize(unsigned(a_input_buffer(2)), C_HASH_BITS));
+
+  sl_hash_possible <= '1' when int_fill >= C_HASH_LENGTH else
+                      '0';
+  -- A new position can be processed, if the input buffer is full or if there is no more input.
+  sl_lookahead_ok <= '1' when int_fill = C_INPUT_BUFFER_SIZE or (sl_input_done = '1' and int_fill /= 0) else
+                     '0';
+
+  -- Insert the current position into the hash table:
+  -- 1. When starting to search a match for the current position. The old value is read at the same time.
+  -- 2. When skipping the datums, covered by a match.
+  -- A position is inserted, if at least C_HASH_LENGTH datums remain. This doesn't depend on the input timing.
+  sl_hash_we <= '1' when (state = FILL and sl_lookahead_ok = '1' and sl_hash_possible = '1') or
+                         (state = SKIP and sl_hash_possible = '1') else
+                '0';
+
+  -- Read the search buffer in advance. The search buffer datum is needed only for
+  -- distances that are larger than the current match length.
+  slv_window_raddr <= std_logic_vector(resize(u_candidate + int_read_index, C_WINDOW_ADDR_WIDTH));
+
+  -- Leave some margin for the datums that are already on the way.
+  osl_rdy <= '1' when unsigned(slv_bram_waddr) - unsigned(slv_bram_raddr) < 2 ** C_ADDR_WIDTH - C_FIFO_MARGIN else
+             '0';
+
+  proc_lzss : process (isl_clk) is
+
+    variable v_a_input_buffer : t_slv_buffer;
+    variable v_int_fill       : integer range 0 to C_INPUT_BUFFER_SIZE;
+    variable v_sl_shift       : boolean;
+    variable v_u_distance     : unsigned(C_POSITION_BITS - 1 downto 0);
+    variable v_slv_source     : std_logic_vector(7 downto 0);
+    variable v_int_index      : integer range 0 to C_MAX_MATCH_LENGTH;
+
+  begin
+
+    if (rising_edge(isl_clk)) then
+      -- defaults
+      sl_finish    <= '0';
+      sl_valid_out <= '0';
+      sl_window_we <= '0';
+      v_sl_shift   := false;
+
+      if (isl_valid = '1') then
+        slv_bram_waddr <= std_logic_vector(unsigned(slv_bram_waddr) + 1);
+      end if;
+
+      -- One cycle read delay. The datum is valid, if it was written before.
+      slv_bram_raddr <= slv_bram_raddr_next;
+      if (slv_bram_raddr_next /= slv_bram_waddr) then
+        sl_bram_data_valid <= '1';
+      else
+        sl_bram_data_valid <= '0';
+      end if;
+
+      if (isl_flush = '1') then
+        sl_flush <= '1';
+      end if;
+
+      -- There is no more input, when all datums were read from the input FIFO.
+      if (sl_flush = '1' and sl_bram_data_valid = '0' and isl_valid = '0' and
+          slv_bram_raddr = slv_bram_waddr) then
+        sl_flush      <= '0';
+        sl_input_done <= '1';
+      end if;
+
+      case state is
+
+        when FILL =>
+
+          if (sl_lookahead_ok = '1') then
+            if (sl_hash_possible = '1') then
+              -- The hash table gets read and written in this cycle.
+              state <= HEAD;
+            else
+              -- Not enough datums for a match at the end.
+              rec_best_match <= (0, 0);
+              state          <= EMIT;
+            end if;
+          elsif (sl_input_done = '1' and int_fill = 0) then
+            sl_input_done <= '0';
+            sl_finish     <= '1';
+            u_position    <= (others => '0');
+            int_history   <= 0;
+          end if;
+
+        when HEAD =>
+
+          -- The distance is calculated modulo 2 ** C_POSITION_BITS. Outdated entries
+          -- of the hash table are no problem, because the match gets verified.
+          v_u_distance := u_position - unsigned(slv_hash_out);
+          if (v_u_distance > 0 and v_u_distance <= int_history and v_u_distance <= C_MAX_DISTANCE) then
+            u_candidate       <= unsigned(slv_hash_out);
+            int_distance      <= to_integer(v_u_distance);
+            int_read_index    <= 0;
+            sl_window_pending <= '0';
+            rec_best_match    <= (0, 0);
+            state             <= COMPARE;
+          else
+            rec_best_match <= (0, 0);
+            state          <= EMIT;
+          end if;
+
+        when COMPARE =>
+
+          -- Each cycle, one datum of the search buffer is read and compared.
+          if (int_read_index /= C_MAX_MATCH_LENGTH) then
+            int_read_index <= int_read_index + 1;
+          end if;
+          sl_window_pending <= '1';
+
+          if (sl_window_pending = '1') then
+            v_int_index := rec_best_match.int_length;
+            -- The match can overlap with the input buffer.
+            if (v_int_index < int_distance) then
+              v_slv_source := slv_window_data_out;
+            else
+              v_slv_source := a_input_buffer(v_int_index - int_distance);
+            end if;
+
+            if (v_int_index < int_fill and v_slv_source = a_input_buffer(v_int_index)) then
+              rec_best_match.int_length <= v_int_index + 1;
+              if (v_int_index + 1 = C_MAX_MATCH_LENGTH) then
+                rec_best_match.int_offset <= int_distance;
+                state                     <= EMIT;
+              end if;
+            else
+              if (v_int_index >= C_MIN_MATCH_LENGTH) then
+                rec_best_match.int_offset <= int_distance;
+              else
+                rec_best_match <= (0, 0);
+              end if;
+              state <= EMIT;
+            end if;
+          end if;
+
+        when EMIT =>
+
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_literal  <= a_input_buffer(0);
+            if (rec_best_match.int_offset = 0) then
+              v_sl_shift := true;
+              state      <= FILL;
+            else
+              int_datums_to_skip <= rec_best_match.int_length;
+              state              <= SKIP;
+            end if;
+          end if;
+
+        when SKIP =>
+
+          -- Shift out the datums, covered by the match. Their hashes are inserted into the hash table.
+          -- Wait for the datums of the hash, if the input FIFO runs empty.
+          if (sl_hash_possible = '1' or sl_input_done = '1') then
+            v_sl_shift         := true;
+            int_datums_to_skip <= int_datums_to_skip - 1;
+            if (int_datums_to_skip = 1) then
+              state <= FILL;
+            end if;
+          end if;
+
+      end case;
+
+      -- Shift the input buffer and append new datums from the input FIFO.
+      v_a_input_buffer := a_input_buffer;
+      v_int_fill       := int_fill;
+      if (v_sl_shift) then
+        v_a_input_buffer := a_input_buffer(1 to a_input_buffer'high) & x"00";
+        v_int_fill       := v_int_fill - 1;
+
+        -- Move the datum to the search buffer.
+        sl_window_we       <= '1';
+        slv_window_waddr   <= std_logic_vector(resize(u_position, C_WINDOW_ADDR_WIDTH));
+        slv_window_data_in <= a_input_buffer(0);
+        u_position         <= u_position + 1;
+        if (int_history /= C_SEARCH_BUFFER_SIZE) then
+          int_history <= int_history + 1;
+        end if;
+      end if;
+      if (sl_bram_pop = '1') then
+        v_a_input_buffer(v_int_fill) := slv_bram_data_out;
+        v_int_fill                   := v_int_fill + 1;
+      end if;
+      a_input_buffer <= v_a_input_buffer;
+      int_fill       <= v_int_fill;
+    end if;
+
+  end process proc_lzss;
+
+  -- In case of a literal (no match found), fill the output data with zeros.
+  slv_literal_data <= slv_literal & (slv_literal_data'high - slv_literal'length downto 0 => '0');
+  -- In case of a match, assure that the output bitwidth is at least 8.
+  -- 8 bits are needed to represent a literal.
+  slv_match_offset <= std_logic_vector(to_unsigned(rec_best_match.int_offset, max_int(log2(C_SEARCH_BUFFER_SIZE + 1), 8 - log2(C_MAX_MATCH_LENGTH + 1))));
+  slv_match_length <= std_logic_vector(to_unsigned(rec_best_match.int_length, log2(C_MAX_MATCH_LENGTH + 1)));
+
+  oslv_data  <= '0' & slv_literal_data when rec_best_match.int_offset = 0 else
+                '1' & slv_match_offset & slv_match_length;
+  osl_valid  <= sl_valid_out;
+  osl_finish <= sl_finish;
+
+end architecture behavioral;
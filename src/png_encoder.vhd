@@ -18,50 +18,109 @@ entity png_encoder is
     C_IMG_HEIGHT : integer := 480;
 
     -- allowed bit depths, depending on color type: 1, 2, 4, 8, 16
+    -- 1, 2, 4: one sample per input byte, in the least significant bits
+    -- 16: two bytes per sample, the most significant byte first
     C_IMG_BIT_DEPTH : integer range 1 to 16 := 8;
 
-    -- 0: greyscale
+    -- 0: greyscale (bit depth 1, 2, 4, 8, 16)
     -- 1: invalid
-    -- 2: truecolor
-    -- 3: indexed-color (not supported yet)
-    -- 4: greyscale with alpha
+    -- 2: truecolor (bit depth 8, 16)
+    -- 3: indexed-color (bit depth 1, 2, 4, 8)
+    -- 4: greyscale with alpha (bit depth 8, 16)
     -- 5: invalid
-    -- 6: truecolor with alpha
+    -- 6: truecolor with alpha (bit depth 8, 16)
     C_COLOR_TYPE : integer range 0 to 6 := 2;
 
+    -- C_COLOR_TYPE = 3: amount of palette entries, they are written by the palette port
+    C_PALETTE_SIZE : integer range 1 to 256 := 256;
+
+    -- bytes per input word, i. e. 1 for a byte or C_IMG_DEPTH for a pixel per word
+    -- The image size in bytes has to be a multiple of C_INPUT_BYTES.
+    -- C_IMG_BIT_DEPTH < 8: C_INPUT_BYTES has to be 1.
+    C_INPUT_BYTES : integer range 1 to 8 := 1;
+
     -- LZSS parameters
     -- maximum match length is limited by C_INPUT_BUFFER_SIZE and C_MAX_MATCH_LENGTH_USER
     C_INPUT_BUFFER_SIZE     : integer range 3 to 258   := 12;
     C_SEARCH_BUFFER_SIZE    : integer range 1 to 32768 := 12;
     C_MAX_MATCH_LENGTH_USER : integer                  := 7;
-
-    -- 0: no compression (not supported)
+    -- 0: first match
+    -- 1: longest match
+    -- 2: longest match with lazy matching
+    C_MATCH_MODE : integer range 0 to 2 := 0;
+    -- 0: search buffer in registers, all offsets are compared in parallel
+    -- 1: search buffer in BRAM, match candidates are obtained by a hash table
+    C_WINDOW_TYPE : integer range 0 to 1 := 0;
+
+    -- 0: no compression
     -- 1: huffman encoding with a fixed table
-    -- 2: huffman encoding with a dynamic table (not supported yet)
+    -- 2: huffman encoding with a dynamic table
     -- 3: not allowed
     C_BTYPE : integer range 0 to 3 := 1;
+    -- C_BTYPE = 0: Amount of bytes per block.
+    -- C_BTYPE = 2 or C_STORED_FALLBACK = 1: Amount of LZSS tokens per block.
+    C_BLOCK_SIZE : integer range 2 to 16384 := 1024;
+    -- 0: all blocks are encoded by C_BTYPE
+    -- 1: a block is sent uncompressed, if the encoded block would be larger
+    C_STORED_FALLBACK : integer range 0 to 1 := 0;
+
+    -- The image is split into C_LANES horizontal strips, which are compressed in parallel.
+    -- C_LANE_BUFFER_SIZE is the output buffer of each lane in bytes.
+    C_LANES            : integer range 1 to 8       := 1;
+    C_LANE_BUFFER_SIZE : integer range 512 to 65536 := 4096;
 
     -- 0: no filter
     -- 1: sub filter (subtract the previous byte)
-    -- 2-5: not supported yet
-    C_ROW_FILTER_TYPE : integer range 0 to 5 := 0
+    -- 2: up filter (subtract the byte above)
+    -- 3: average filter (subtract the average of the previous byte and the byte above)
+    -- 4: paeth filter (subtract the paeth predictor)
+    -- 5: adaptive filter (choose the filter type for each row, the output is delayed by one row)
+    C_ROW_FILTER_TYPE : integer range 0 to 5 := 0;
+
+    -- 0: one IDAT chunk, the headers are sent last
+    -- else: the headers are sent first, followed by IDAT chunks of up to C_IDAT_CHUNK_SIZE bytes
+    C_IDAT_CHUNK_SIZE : integer range 0 to 32768 := 0;
+
+    -- 0: the input is accepted only while a frame is compressed
+    -- else: input FIFO of C_FRAME_BUFFER_SIZE words (rounded up to a power of two).
+    --       The next frame is accepted while the previous frame is finished, i. e. while
+    --       zlib is flushed and the checksums, IEND and the headers are sent.
+    C_FRAME_BUFFER_SIZE : integer range 0 to 65536 := 0;
+
+    -- 0: no performance counters, oslv_counter is zero
+    -- 1: performance counters, selected by islv_counter_select (see doc/toplevel_interface.md)
+    C_PERF_COUNTERS : integer range 0 to 1 := 0
   );
   port (
     isl_clk    : in    std_logic;
     isl_start  : in    std_logic;
     isl_valid  : in    std_logic;
-    islv_data  : in    std_logic_vector(7 downto 0);
+    islv_data  : in    std_logic_vector(C_INPUT_BYTES * 8 - 1 downto 0);
     oslv_data  : out   std_logic_vector(7 downto 0);
     osl_valid  : out   std_logic;
     osl_rdy    : out   std_logic;
-    osl_finish : out   std_logic
+    osl_finish : out   std_logic;
+
+    -- The next stage is ready for output, which is sent one cycle later.
+    -- C_IDAT_CHUNK_SIZE = 0: zlib can send up to C_ZLIB_MAX_OVERRUN bytes more.
+    isl_get : in    std_logic;
+
+    -- palette of C_COLOR_TYPE = 3, the data is red & green & blue
+    -- It has to be written before the start of a frame.
+    isl_palette_we    : in    std_logic;
+    islv_palette_addr : in    std_logic_vector(7 downto 0);
+    islv_palette_data : in    std_logic_vector(23 downto 0);
+
+    -- performance counters, they are reset at the start of a frame
+    islv_counter_select : in    std_logic_vector(4 downto 0);
+    oslv_counter        : out   std_logic_vector(31 downto 0)
   );
 end entity png_encoder;
 
 architecture behavioral of png_encoder is
 
   -- constants
-  constant C_PNG_HEADER : std_logic_vector(8 * 8 - 1 downto 0) := x"89504e470d0a1a0a";
+  constant C_PNG_HEADER : std_logic_vector(8 * 8 - 1 downto 0) := x"89504E470D0A1A0A";
 
   constant C_IHDR_TYPE : std_logic_vector(4 * 8 - 1 downto 0) := x"49484452"; -- IHDR string encoded
   -- IHDR data composition:
@@ -81,26 +140,80 @@ architecture behavioral of png_encoder is
                                                                          x"00";
   constant C_IHDR      : std_logic_vector((13 + 12) * 8 - 1 downto 0) := generate_chunk(C_IHDR_TYPE, C_IHDR_DATA);
 
-  -- constant C_PLTE
+  -- PLTE
   -- This chunk must appear for color type 3, and can appear for color types 2 and 6;
   -- it must not appear for color types 0 and 4.
   -- If this chunk does appear, it must precede the first IDAT chunk.
+  -- Only sent for color type 3. The data is read from the palette BRAM at runtime.
+  constant C_PLTE_TYPE   : std_logic_vector(4 * 8 - 1 downto 0) := x"504C5445"; -- PLTE string encoded
+  constant C_PLTE_HEADER : std_logic_vector(8 * 8 - 1 downto 0) := std_logic_vector(to_unsigned(3 * C_PALETTE_SIZE, 32)) &
+                                                                   C_PLTE_TYPE;
+
+  type t_plte_states is (PLTE_HEADER, PLTE_DATA, PLTE_CRC);
+
+  signal plte_state           : t_plte_states                         := PLTE_HEADER;
+  signal sl_plte_sent         : std_logic                             := '0';
+  signal int_plte_entry       : integer range 0 to C_PALETTE_SIZE - 1 := 0;
+  signal int_plte_byte        : integer range 1 to 3                  := 3;
+  signal slv_palette_raddr    : std_logic_vector(7 downto 0)          := (others => '0');
+  signal slv_palette_data_out : std_logic_vector(23 downto 0)         := (others => '0');
 
   constant C_IDAT_TYPE : std_logic_vector(4 * 8 - 1 downto 0) := x"49444154"; -- IDAT string encoded
   -- length of data, data itself and crc of IDAT have to be obtained at runtime
 
   signal slv_full_header : std_logic_vector(44 * 8 - 1 downto 0) := (others => '0');
 
-  constant C_IEND_TYPE : std_logic_vector(4 * 8 - 1 downto 0)  := x"49454e44"; -- IEND string encoded
+  -- The signature and IHDR are sent first when streaming. The last 11 bytes are unused then.
+  constant C_STREAM_HEADER_END : integer := 11;
+
+  constant C_IEND_TYPE : std_logic_vector(4 * 8 - 1 downto 0)  := x"49454E44"; -- IEND string encoded
   constant C_IEND      : std_logic_vector(12 * 8 - 1 downto 0) := generate_chunk(C_IEND_TYPE, "");
 
   constant C_IMG_DEPTH : integer range 1 to 4 := get_img_depth(C_COLOR_TYPE);
 
+  -- Input bytes per row. Samples of less than eight bit are packed by the bit packer.
+  constant C_INPUT_ROW_BYTES : integer := C_IMG_WIDTH * C_IMG_DEPTH * max_int(1, C_IMG_BIT_DEPTH / 8);
+  constant C_WORDS           : integer := C_IMG_HEIGHT * C_INPUT_ROW_BYTES / C_INPUT_BYTES;
+  -- Bytes per row and bytes per pixel after packing, as seen by the row filter.
+  -- The row filter compares the bytes of neighbouring pixels. For bit depths less than eight,
+  -- the byte to the left is used.
+  constant C_ROW_BYTES       : integer := (C_IMG_WIDTH * C_IMG_DEPTH * C_IMG_BIT_DEPTH + 7) / 8;
+  constant C_BYTES_PER_PIXEL : integer := max_int(1, C_IMG_DEPTH * C_IMG_BIT_DEPTH / 8);
+
+  -- frame buffer
+  -- The read data is valid one cycle after writing, because the BRAM output is registered.
+  constant C_FRAME_BUFFER_ADDR_WIDTH : integer := max_int(1, log2(C_FRAME_BUFFER_SIZE));
+
+  signal slv_fb_waddr      : std_logic_vector(C_FRAME_BUFFER_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fb_waddr_d1   : std_logic_vector(C_FRAME_BUFFER_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fb_raddr      : std_logic_vector(C_FRAME_BUFFER_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fb_raddr_next : std_logic_vector(C_FRAME_BUFFER_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fb_data_out   : std_logic_vector(islv_data'range)                        := (others => '0');
+  signal sl_fb_we          : std_logic                                                := '0';
+  signal sl_fb_space       : std_logic                                                := '0';
+  signal sl_fb_valid       : std_logic                                                := '0';
+  signal sl_start_pending  : std_logic                                                := '0';
+
+  -- The words of the current frame. Words of the next frame stay in the frame buffer.
+  signal int_words_fed : integer range 0 to C_WORDS - 1 := 0;
+  signal sl_frame_fed  : std_logic                      := '0';
+
+  -- input of the compression pipeline, either the top level input or the frame buffer
+  signal sl_valid_in : std_logic                         := '0';
+  signal slv_data_in : std_logic_vector(islv_data'range) := (others => '0');
+  signal sl_rdy_in   : std_logic                         := '0';
+
+  -- row filter input, either the pipeline input or the packed bytes
+  signal sl_valid_in_row_filter : std_logic                         := '0';
+  signal slv_data_in_row_filter : std_logic_vector(islv_data'range) := (others => '0');
+  signal sl_rdy_packer          : std_logic                         := '0';
+
   -- row_filter
   signal sl_start_row_filter     : std_logic                    := '0';
   signal sl_valid_out_row_filter : std_logic                    := '0';
   signal slv_data_out_row_filter : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_rdy_row_filter       : std_logic                    := '0';
+  signal sl_finish_row_filter    : std_logic                    := '0';
 
   -- zlib
   signal sl_valid_in_zlib  : std_logic                    := '0';
@@ -109,80 +222,326 @@ architecture behavioral of png_encoder is
   signal sl_valid_out_zlib : std_logic                    := '0';
   signal sl_start_zlib     : std_logic                    := '0';
   signal sl_finish_zlib    : std_logic                    := '0';
+  signal sl_rdy_zlib       : std_logic                    := '0';
+  signal rec_stats_zlib    : t_deflate_stats              := C_DEFLATE_STATS_NONE;
 
   -- idat chunk
+  signal sl_start_crc32     : std_logic                            := '0';
   signal sl_valid_in_crc32  : std_logic                            := '0';
   signal slv_data_in_crc32  : std_logic_vector(7 downto 0)         := (others => '0');
   signal slv_data_out_crc32 : std_logic_vector(4 * 8 - 1 downto 0) := (others => '0');
   -- TODO: ghdl bug: 2 ** 31 - 1 = 2147483647
   signal int_idat_length : integer range 0 to 2147483647 := 0;
 
+  -- streaming idat chunks
+  -- The zlib output is buffered until a chunk is complete, since the chunk length is sent first.
+  -- zlib is stalled, when the free space is less than the bytes it can still output. The buffer
+  -- can contain the current and the next chunk. Thus zlib keeps running, while the chunk header
+  -- and CRC are sent.
+  constant C_IDAT_ADDR_WIDTH : integer := max_int(9, log2(C_IDAT_CHUNK_SIZE + C_ZLIB_MAX_OVERRUN + 2) + 1);
+
+  signal slv_idat_raddr      : std_logic_vector(C_IDAT_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_idat_raddr_next : std_logic_vector(C_IDAT_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_idat_waddr      : std_logic_vector(C_IDAT_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_idat_data_out   : std_logic_vector(7 downto 0)                     := (others => '0');
+  signal sl_idat_pop         : std_logic                                        := '0';
+  signal int_idat_fill       : integer range 0 to 2 ** C_IDAT_ADDR_WIDTH - 1    := 0;
+  signal sl_idat_space       : std_logic                                        := '0';
+  signal sl_get_zlib         : std_logic                                        := '0';
+
+  type t_chunk_states is (CHUNK_IDLE, CHUNK_HEADER, CHUNK_DATA, CHUNK_CRC);
+
+  signal chunk_state          : t_chunk_states                       := CHUNK_IDLE;
+  signal slv_chunk_header     : std_logic_vector(8 * 8 - 1 downto 0) := (others => '0');
+  signal int_chunk_remaining  : integer range 0 to C_IDAT_CHUNK_SIZE := 0;
+  signal sl_finish_zlib_saved : std_logic                            := '0';
+
   -- interface
   signal sl_valid_out : std_logic                    := '0';
   signal slv_data_out : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_finish    : std_logic                    := '0';
   signal sl_flush     : std_logic                    := '0';
+  signal sl_rdy       : std_logic                    := '0';
+  signal sl_rdy_core  : std_logic                    := '0';
+  signal sl_start     : std_logic                    := '0';
+
+  -- performance counters
+  constant C_COUNTERS : integer := 18;
+
+  type t_counters is array (0 to C_COUNTERS - 1) of unsigned(31 downto 0);
+
+  signal a_counters      : t_counters                    := (others => (others => '0'));
+  signal sl_frame_active : std_logic                     := '0';
+  signal slv_counter     : std_logic_vector(31 downto 0) := (others => '0');
 
   -- internal
 
-  type t_states is (IDLE, INIT_IDAT_CRC32, HEADERS, INIT_ROW_FILTER, ZLIB, IDAT_CRC, IEND);
+  type t_states is (IDLE, INIT_IDAT_CRC32, HEADERS, PLTE, INIT_ROW_FILTER, ZLIB, IDAT_CRC, IEND);
 
   signal state : t_states;
 
-  signal int_channel_cnt : integer range 0 to C_IMG_DEPTH - 1                := 0;
-  signal int_pixel_cnt   : integer range 0 to C_IMG_WIDTH * C_IMG_HEIGHT - 1 := 0;
-  signal int_index       : integer range 0 to slv_full_header'length / 8     := 0;
+  signal int_index : integer range 0 to slv_full_header'length / 8 := 0;
 
 begin
 
-  i_row_filter : entity png_lib.row_filter
+  -- synthesis translate_off
+  assert (C_IMG_HEIGHT * C_INPUT_ROW_BYTES) mod C_INPUT_BYTES = 0
+    report "The image size has to be a multiple of C_INPUT_BYTES."
+    severity failure;
+  assert (C_IMG_BIT_DEPTH = 8 or
+          (C_IMG_BIT_DEPTH = 16 and C_COLOR_TYPE /= 3) or
+          ((C_IMG_BIT_DEPTH = 1 or C_IMG_BIT_DEPTH = 2 or C_IMG_BIT_DEPTH = 4) and
+           (C_COLOR_TYPE = 0 or C_COLOR_TYPE = 3)))
+    report "Invalid combination of C_IMG_BIT_DEPTH and C_COLOR_TYPE."
+    severity failure;
+  assert C_IMG_BIT_DEPTH >= 8 or C_INPUT_BYTES = 1
+    report "Samples of less than eight bit have to be sent one per input word."
+    severity failure;
+  -- synthesis translate_on
+
+  i_row_filter : entity png_lib.row_filter(behavioral)
     generic map (
-      C_IMG_WIDTH       => C_IMG_WIDTH,
+      C_IMG_WIDTH       => C_ROW_BYTES / C_BYTES_PER_PIXEL,
       C_IMG_HEIGHT      => C_IMG_HEIGHT,
-      C_IMG_DEPTH       => C_IMG_DEPTH,
-      C_ROW_FILTER_TYPE => C_ROW_FILTER_TYPE
+      C_IMG_DEPTH       => C_BYTES_PER_PIXEL,
+      C_ROW_FILTER_TYPE => C_ROW_FILTER_TYPE,
+      C_INPUT_BYTES     => C_INPUT_BYTES
     )
     port map (
-      isl_clk   => isl_clk,
-      isl_start => sl_start_row_filter,
-      isl_get   => '1',
-      isl_valid => isl_valid,
-      islv_data => islv_data,
-      oslv_data => slv_data_out_row_filter,
-      osl_valid => sl_valid_out_row_filter,
-      osl_rdy   => sl_rdy_row_filter
+      isl_clk    => isl_clk,
+      isl_start  => sl_start_row_filter,
+      isl_get    => sl_rdy_zlib,
+      isl_valid  => sl_valid_in_row_filter,
+      islv_data  => slv_data_in_row_filter,
+      oslv_data  => slv_data_out_row_filter,
+      osl_valid  => sl_valid_out_row_filter,
+      osl_rdy    => sl_rdy_row_filter,
+      osl_finish => sl_finish_row_filter
     );
 
-  i_zlib : entity png_lib.zlib
+  -- The last lane gets the remaining rows.
+  i_zlib : entity png_lib.zlib(behavioral)
     generic map (
       C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
       C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
       C_BTYPE                 => C_BTYPE,
-      C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER
+      C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+      C_MATCH_MODE            => C_MATCH_MODE,
+      C_WINDOW_TYPE           => C_WINDOW_TYPE,
+      C_BLOCK_SIZE            => C_BLOCK_SIZE,
+      C_STORED_FALLBACK       => C_STORED_FALLBACK,
+      C_LANES                 => C_LANES,
+      C_LANE_SIZE             => C_IMG_HEIGHT / C_LANES * (C_ROW_BYTES + 1),
+      C_LANE_BUFFER_SIZE      => C_LANE_BUFFER_SIZE
     )
     port map (
       isl_clk    => isl_clk,
       isl_flush  => sl_flush,
       isl_start  => sl_start_zlib,
+      isl_get    => sl_get_zlib,
       isl_valid  => sl_valid_in_zlib,
       islv_data  => slv_data_in_zlib,
       oslv_data  => slv_data_out_zlib,
       osl_valid  => sl_valid_out_zlib,
-      osl_finish => sl_finish_zlib
+      osl_rdy    => sl_rdy_zlib,
+      osl_finish => sl_finish_zlib,
+      orec_stats => rec_stats_zlib
     );
 
-  i_crc32 : entity png_lib.crc32
+  i_crc32 : entity png_lib.crc32(behavioral)
     generic map (
       C_INPUT_BITWIDTH => slv_data_out_zlib'LENGTH
     )
     port map (
       isl_clk   => isl_clk,
+      isl_start => sl_start_crc32,
       isl_valid => sl_valid_in_crc32,
       islv_data => slv_data_in_crc32,
       oslv_data => slv_data_out_crc32
     );
 
+  gen_direct_input : if C_FRAME_BUFFER_SIZE = 0 generate
+
+    sl_start    <= isl_start;
+    sl_valid_in <= isl_valid;
+    slv_data_in <= islv_data;
+    sl_rdy      <= sl_rdy_in;
+
+  end generate gen_direct_input;
+
+  -- The frame buffer decouples the input from the compression core.
+  -- Only the words of the current frame are fed to the row filter. A start of the next frame
+  -- is saved until the current frame is finished.
+
+  gen_frame_buffer : if C_FRAME_BUFFER_SIZE /= 0 generate
+
+    i_frame_buffer : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => C_FRAME_BUFFER_ADDR_WIDTH,
+        C_DATA_WIDTH => islv_data'length
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => sl_fb_we,
+        islv_waddr => slv_fb_waddr,
+        islv_data  => islv_data,
+
+        islv_raddr => slv_fb_raddr_next,
+        oslv_data  => slv_fb_data_out
+      );
+
+    proc_frame_buffer : process (isl_clk) is
+    begin
+
+      if (rising_edge(isl_clk)) then
+        slv_fb_waddr_d1 <= slv_fb_waddr;
+        slv_fb_raddr    <= slv_fb_raddr_next;
+
+        if (sl_fb_we = '1') then
+          slv_fb_waddr <= std_logic_vector(unsigned(slv_fb_waddr) + 1);
+        end if;
+
+        -- synthesis translate_off
+        assert not (state /= IDLE and isl_start = '1' and sl_start_pending = '1')
+          report "Only the next frame can be started in advance."
+          severity error;
+        -- synthesis translate_on
+
+        if (state = IDLE) then
+          sl_start_pending <= '0';
+        elsif (isl_start = '1') then
+          sl_start_pending <= '1';
+        end if;
+
+        if (sl_start = '1' and state = IDLE) then
+          int_words_fed <= 0;
+          sl_frame_fed  <= '0';
+        elsif (sl_valid_in = '1') then
+          if (int_words_fed = C_WORDS - 1) then
+            sl_frame_fed <= '1';
+          else
+            int_words_fed <= int_words_fed + 1;
+          end if;
+        end if;
+      end if;
+
+    end process proc_frame_buffer;
+
+    sl_fb_space <= '1' when unsigned(slv_fb_waddr) - unsigned(slv_fb_raddr) < 2 ** C_FRAME_BUFFER_ADDR_WIDTH - 1 else
+                   '0';
+    sl_fb_we    <= isl_valid and sl_fb_space;
+    sl_fb_valid <= '1' when slv_fb_waddr_d1 /= slv_fb_raddr else
+                   '0';
+
+    sl_start          <= isl_start or sl_start_pending;
+    sl_valid_in       <= sl_fb_valid and sl_rdy_in and not sl_frame_fed;
+    slv_data_in       <= slv_fb_data_out;
+    slv_fb_raddr_next <= std_logic_vector(unsigned(slv_fb_raddr) + 1) when sl_valid_in = '1' else
+                         slv_fb_raddr;
+    sl_rdy            <= sl_fb_space;
+
+  end generate gen_frame_buffer;
+
+  gen_byte_samples : if C_IMG_BIT_DEPTH >= 8 generate
+
+    sl_valid_in_row_filter <= sl_valid_in;
+    slv_data_in_row_filter <= slv_data_in;
+    sl_rdy_in              <= sl_rdy_core;
+
+  end generate gen_byte_samples;
+
+  -- Samples of less than eight bit are packed, before they enter the row filter.
+  -- Thus the row filter and zlib process less bytes.
+
+  gen_bit_packer : if C_IMG_BIT_DEPTH < 8 generate
+
+    i_bit_packer : entity png_lib.bit_packer(behavioral)
+      generic map (
+        C_IMG_WIDTH => C_IMG_WIDTH * C_IMG_DEPTH,
+        C_BIT_DEPTH => C_IMG_BIT_DEPTH
+      )
+      port map (
+        isl_clk   => isl_clk,
+        isl_start => sl_start_row_filter,
+        isl_get   => sl_rdy_core,
+        isl_valid => sl_valid_in,
+        islv_data => slv_data_in,
+        oslv_data => slv_data_in_row_filter,
+        osl_valid => sl_valid_in_row_filter,
+        osl_rdy   => sl_rdy_packer
+      );
+
+    sl_rdy_in <= sl_rdy_packer when state = ZLIB else
+                 '0';
+
+  end generate gen_bit_packer;
+
+  gen_palette : if C_COLOR_TYPE = 3 generate
+
+    i_palette : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => 8,
+        C_DATA_WIDTH => 24
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => isl_palette_we,
+        islv_waddr => islv_palette_addr,
+        islv_data  => islv_palette_data,
+
+        islv_raddr => slv_palette_raddr,
+        oslv_data  => slv_palette_data_out
+      );
+
+  end generate gen_palette;
+
+  -- Prefetch the next entry, while the last byte of the current entry is sent.
+  slv_palette_raddr <= std_logic_vector(to_unsigned(int_plte_entry + 1, 8))
+                       when state = PLTE and plte_state = PLTE_DATA and int_plte_byte = 1 and
+                            int_plte_entry /= C_PALETTE_SIZE - 1 and isl_get = '1' else
+                       std_logic_vector(to_unsigned(int_plte_entry, 8));
+
+  gen_idat_buffer : if C_IDAT_CHUNK_SIZE /= 0 generate
+
+    i_idat_buffer : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => C_IDAT_ADDR_WIDTH,
+        C_DATA_WIDTH => 8
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => sl_valid_out_zlib,
+        islv_waddr => slv_idat_waddr,
+        islv_data  => slv_data_out_zlib,
+
+        islv_raddr => slv_idat_raddr_next,
+        oslv_data  => slv_idat_data_out
+      );
+
+  end generate gen_idat_buffer;
+
+  int_idat_fill <= to_integer(unsigned(slv_idat_waddr) - unsigned(slv_idat_raddr));
+  -- A byte, that gets written in this cycle, is considered by the margin of two bytes.
+  sl_idat_space <= '1' when C_IDAT_CHUNK_SIZE = 0 or
+                            int_idat_fill < 2 ** C_IDAT_ADDR_WIDTH - C_ZLIB_MAX_OVERRUN - 2 else
+                   '0';
+  -- Without IDAT chunks, zlib is stalled directly by the next stage.
+  sl_get_zlib <= isl_get when C_IDAT_CHUNK_SIZE = 0 else
+                 sl_idat_space;
+
+  sl_idat_pop         <= '1' when state = ZLIB and chunk_state = CHUNK_DATA and int_chunk_remaining /= 0 and
+                                  isl_get = '1' else
+                         '0';
+  slv_idat_raddr_next <= std_logic_vector(unsigned(slv_idat_raddr) + 1) when sl_idat_pop = '1' else
+                         slv_idat_raddr;
+
   proc_fsm : process (isl_clk) is
+
+    variable v_int_chunk_length : integer range 0 to C_IDAT_CHUNK_SIZE;
+
   begin
 
     if (rising_edge(isl_clk)) then
@@ -191,19 +550,38 @@ begin
       sl_finish           <= '0';
       sl_start_row_filter <= '0';
       sl_start_zlib       <= '0';
+      sl_start_crc32      <= '0';
       sl_valid_in_crc32   <= '0';
 
       if (sl_valid_out_zlib = '1') then
         int_idat_length <= int_idat_length + 1;
+        slv_idat_waddr  <= std_logic_vector(unsigned(slv_idat_waddr) + 1);
       end if;
+      slv_idat_raddr <= slv_idat_raddr_next;
+
+      -- synthesis translate_off
+      assert not (sl_valid_out_zlib = '1' and C_IDAT_CHUNK_SIZE /= 0 and int_idat_fill = 2 ** C_IDAT_ADDR_WIDTH - 1)
+        report "IDAT buffer overflow"
+        severity error;
+      -- synthesis translate_on
 
       case state is
 
         when IDLE =>
 
-          if (isl_start = '1') then
-            state     <= INIT_IDAT_CRC32;
-            int_index <= 4;
+          if (sl_start = '1') then
+            int_idat_length <= 0;
+            sl_plte_sent    <= '0';
+            sl_start_crc32  <= '1';
+            if (C_IDAT_CHUNK_SIZE = 0) then
+              state     <= INIT_IDAT_CRC32;
+              int_index <= 4;
+            else
+              state           <= HEADERS;
+              int_index       <= slv_full_header'length / 8;
+              slv_full_header <= C_PNG_HEADER & C_IHDR &
+                                 std_logic_vector(to_unsigned(0, C_STREAM_HEADER_END * 8));
+            end if;
           end if;
 
         when INIT_IDAT_CRC32 =>
@@ -224,35 +602,109 @@ begin
 
         when ZLIB =>
 
-          sl_valid_in_zlib  <= sl_valid_out_row_filter;
-          slv_data_in_zlib  <= slv_data_out_row_filter;
-          sl_valid_in_crc32 <= sl_valid_out_zlib;
-          slv_data_in_crc32 <= slv_data_out_zlib;
-          sl_valid_out      <= sl_valid_out_zlib;
-          slv_data_out      <= slv_data_out_zlib;
+          sl_valid_in_zlib <= sl_valid_out_row_filter;
+          slv_data_in_zlib <= slv_data_out_row_filter;
+
+          if (C_IDAT_CHUNK_SIZE = 0) then
+            sl_valid_in_crc32 <= sl_valid_out_zlib;
+            slv_data_in_crc32 <= slv_data_out_zlib;
+            sl_valid_out      <= sl_valid_out_zlib;
+            slv_data_out      <= slv_data_out_zlib;
+
+            if (sl_finish_zlib = '1') then
+              state     <= IDAT_CRC;
+              int_index <= 4;
+            end if;
+          else
+            if (sl_finish_zlib = '1') then
+              sl_finish_zlib_saved <= '1';
+            end if;
+
+            case chunk_state is
+
+              when CHUNK_IDLE =>
+
+                -- A chunk is sent, if it's complete or if there is no more data.
+                if (int_idat_fill >= C_IDAT_CHUNK_SIZE or
+                    (sl_finish_zlib_saved = '1' and int_idat_fill /= 0)) then
+                  v_int_chunk_length  := min_int(int_idat_fill, C_IDAT_CHUNK_SIZE);
+                  int_chunk_remaining <= v_int_chunk_length;
+                  slv_chunk_header    <= std_logic_vector(to_unsigned(v_int_chunk_length, 32)) & C_IDAT_TYPE;
+                  sl_start_crc32      <= '1';
+                  int_index           <= 8;
+                  chunk_state         <= CHUNK_HEADER;
+                elsif (sl_finish_zlib_saved = '1') then
+                  sl_finish_zlib_saved <= '0';
+                  state                <= IEND;
+                  int_index            <= 12;
+                end if;
+
+              when CHUNK_HEADER =>
+
+                if (int_index = 0) then
+                  chunk_state <= CHUNK_DATA;
+                elsif (isl_get = '1') then
+                  slv_data_out <= get_byte(slv_chunk_header, int_index);
+                  sl_valid_out <= '1';
+                  int_index    <= int_index - 1;
+
+                  -- The chunk length isn't part of the CRC.
+                  if (int_index <= 4) then
+                    sl_valid_in_crc32 <= '1';
+                    slv_data_in_crc32 <= get_byte(slv_chunk_header, int_index);
+                  end if;
+                end if;
+
+              when CHUNK_DATA =>
+
+                -- The IDAT buffer is read by sl_idat_pop.
+                if (int_chunk_remaining = 0) then
+                  chunk_state <= CHUNK_CRC;
+                  int_index   <= 4;
+                elsif (isl_get = '1') then
+                  slv_data_out        <= slv_idat_data_out;
+                  sl_valid_out        <= '1';
+                  slv_data_in_crc32   <= slv_idat_data_out;
+                  sl_valid_in_crc32   <= '1';
+                  int_chunk_remaining <= int_chunk_remaining - 1;
+                end if;
+
+              when CHUNK_CRC =>
+
+                if (int_index = 0) then
+                  chunk_state <= CHUNK_IDLE;
+                elsif (isl_get = '1') then
+                  slv_data_out <= get_byte(slv_data_out_crc32, int_index);
+                  sl_valid_out <= '1';
+                  int_index    <= int_index - 1;
+                end if;
+
+            end case;
 
-          if (sl_finish_zlib = '1') then
-            state     <= IDAT_CRC;
-            int_index <= 4;
           end if;
 
         when IDAT_CRC =>
 
-          if (int_index /= 0) then
+          if (int_index = 0) then
+            state     <= IEND;
+            int_index <= 12;
+          elsif (isl_get = '1') then
             int_index    <= int_index - 1;
             slv_data_out <= get_byte(slv_data_out_crc32, int_index);
             sl_valid_out <= '1';
-          else
-            state     <= IEND;
-            int_index <= 12;
           end if;
 
         when IEND =>
 
           if (int_index /= 0) then
-            slv_data_out <= get_byte(C_IEND, int_index);
-            sl_valid_out <= '1';
-            int_index    <= int_index - 1;
+            if (isl_get = '1') then
+              slv_data_out <= get_byte(C_IEND, int_index);
+              sl_valid_out <= '1';
+              int_index    <= int_index - 1;
+            end if;
+          elsif (C_IDAT_CHUNK_SIZE /= 0) then
+            state     <= IDLE;
+            sl_finish <= '1';
           else
             state     <= HEADERS;
             int_index <= slv_full_header'length / 8;
@@ -262,17 +714,87 @@ begin
 
         when HEADERS =>
 
-          -- send headers last, because length of idat is needed,
-          -- which can be obtained only after all data got received
-          if (int_index /= 0) then
+          -- One IDAT chunk: Send headers last, because length of idat is needed,
+          -- which can be obtained only after all data got received.
+          -- Streaming: Send the signature and IHDR first. The IDAT headers are part of each chunk.
+          -- Indexed-color: PLTE is sent between IHDR and the first IDAT chunk.
+          if (C_COLOR_TYPE = 3 and int_index = C_STREAM_HEADER_END and sl_plte_sent = '0') then
+            state          <= PLTE;
+            plte_state     <= PLTE_HEADER;
+            int_index      <= 8;
+            int_plte_entry <= 0;
+            int_plte_byte  <= 3;
+            sl_start_crc32 <= '1';
+          elsif (C_IDAT_CHUNK_SIZE /= 0 and int_index = C_STREAM_HEADER_END) then
+            state         <= INIT_ROW_FILTER;
+            sl_start_zlib <= '1';
+          elsif (int_index = 0) then
+            state     <= IDLE;
+            sl_finish <= '1';
+          elsif (isl_get = '1') then
             slv_data_out <= get_byte(slv_full_header, int_index);
             sl_valid_out <= '1';
             int_index    <= int_index - 1;
-          else
-            state     <= IDLE;
-            sl_finish <= '1';
           end if;
 
+        when PLTE =>
+
+          case plte_state is
+
+            when PLTE_HEADER =>
+
+              if (int_index = 0) then
+                plte_state <= PLTE_DATA;
+              elsif (isl_get = '1') then
+                slv_data_out <= get_byte(C_PLTE_HEADER, int_index);
+                sl_valid_out <= '1';
+                int_index    <= int_index - 1;
+
+                -- The chunk length isn't part of the CRC.
+                if (int_index <= 4) then
+                  sl_valid_in_crc32 <= '1';
+                  slv_data_in_crc32 <= get_byte(C_PLTE_HEADER, int_index);
+                end if;
+              end if;
+
+            when PLTE_DATA =>
+
+              if (isl_get = '1') then
+                slv_data_out      <= get_byte(slv_palette_data_out, int_plte_byte);
+                sl_valid_out      <= '1';
+                slv_data_in_crc32 <= get_byte(slv_palette_data_out, int_plte_byte);
+                sl_valid_in_crc32 <= '1';
+
+                if (int_plte_byte /= 1) then
+                  int_plte_byte <= int_plte_byte - 1;
+                elsif (int_plte_entry /= C_PALETTE_SIZE - 1) then
+                  int_plte_byte  <= 3;
+                  int_plte_entry <= int_plte_entry + 1;
+                else
+                  -- The CRC is valid one cycle after the last datum.
+                  plte_state <= PLTE_CRC;
+                  int_index  <= 5;
+                end if;
+              end if;
+
+            when PLTE_CRC =>
+
+              if (int_index /= 0) then
+                if (isl_get = '1') then
+                  int_index <= int_index - 1;
+                  if (int_index <= 4) then
+                    slv_data_out <= get_byte(slv_data_out_crc32, int_index);
+                    sl_valid_out <= '1';
+                  end if;
+                end if;
+              else
+                state        <= HEADERS;
+                sl_plte_sent <= '1';
+                int_index    <= C_STREAM_HEADER_END;
+              end if;
+
+          end case;
+
       end case;
 
     end if;
@@ -283,31 +805,103 @@ begin
   begin
 
     if (rising_edge(isl_clk)) then
-      sl_flush <= '0';
+      -- The row filter finishes together with its last output datum.
+      -- The row filter output is registered once more before zlib.
+      -- Delay the flush accordingly, so that it doesn't overtake the last datum.
+      sl_flush <= sl_finish_row_filter;
+    end if;
 
-      -- isl_valid -> int_pixel_cnt -> sl_flush -> sl_finish_zlib
-      if (isl_valid = '1') then
-        if (int_channel_cnt /= C_IMG_DEPTH - 1) then
-          int_channel_cnt <= int_channel_cnt + 1;
-        else
-          int_channel_cnt <= 0;
-          if (int_pixel_cnt /= C_IMG_WIDTH * C_IMG_HEIGHT - 1) then
-            int_pixel_cnt <= int_pixel_cnt + 1;
-          else
-            int_pixel_cnt <= 0;
-            sl_flush      <= '1';
+  end process proc_generate_flush_impulse;
+
+  -- The counters are active from the start until the end of a frame.
+  -- Busy and stall cycles are taken from the input handshake of each stage:
+  -- busy: input valid, stall: not ready. LZSS and huffman are summed over the lanes.
+  -- 0: cycles
+  -- 1: input stall cycles (osl_rdy = '0')
+  -- 2: row filter busy cycles
+  -- 3: row filter stall cycles
+  -- 4: zlib stall cycles (zlib input not ready while compressing)
+  -- 5: LZSS literals
+  -- 6: LZSS matches
+  -- 7: sum of the match lengths
+  -- 8: sum of the match offsets
+  -- 9: huffman stall cycles
+  -- 10: zlib output bytes
+  -- 11: adler32 busy cycles, i. e. zlib input bytes
+  -- 12: crc32 busy cycles
+  -- 13: output bytes
+  -- 14: LZSS busy cycles
+  -- 15: LZSS stall cycles
+  -- 16: huffman busy cycles, i. e. tokens
+  -- 17: huffman output bytes
+
+  gen_perf_counters : if C_PERF_COUNTERS = 1 generate
+
+    proc_perf_counters : process (isl_clk) is
+    begin
+
+      if (rising_edge(isl_clk)) then
+        if (sl_start = '1' and state = IDLE) then
+          sl_frame_active <= '1';
+          a_counters      <= (others => (others => '0'));
+        elsif (sl_frame_active = '1') then
+          if (sl_finish = '1') then
+            sl_frame_active <= '0';
+          end if;
+
+          a_counters(0) <= a_counters(0) + 1;
+          if (sl_rdy = '0') then
+            a_counters(1) <= a_counters(1) + 1;
+          end if;
+          if (sl_valid_in_row_filter = '1') then
+            a_counters(2) <= a_counters(2) + 1;
+          end if;
+          if (sl_rdy_row_filter = '0') then
+            a_counters(3) <= a_counters(3) + 1;
           end if;
+          if (state = ZLIB and sl_rdy_zlib = '0') then
+            a_counters(4) <= a_counters(4) + 1;
+          end if;
+          a_counters(5) <= a_counters(5) + rec_stats_zlib.int_literals;
+          a_counters(6) <= a_counters(6) + rec_stats_zlib.int_matches;
+          a_counters(7) <= a_counters(7) + rec_stats_zlib.int_match_length;
+          a_counters(8) <= a_counters(8) + rec_stats_zlib.int_match_offset;
+          a_counters(9) <= a_counters(9) + rec_stats_zlib.int_huffman_stall;
+          if (sl_valid_out_zlib = '1') then
+            a_counters(10) <= a_counters(10) + 1;
+          end if;
+          a_counters(11) <= a_counters(11) + rec_stats_zlib.int_adler32_busy;
+          if (sl_valid_in_crc32 = '1') then
+            a_counters(12) <= a_counters(12) + 1;
+          end if;
+          if (sl_valid_out = '1') then
+            a_counters(13) <= a_counters(13) + 1;
+          end if;
+          a_counters(14) <= a_counters(14) + rec_stats_zlib.int_lzss_busy;
+          a_counters(15) <= a_counters(15) + rec_stats_zlib.int_lzss_stall;
+          a_counters(16) <= a_counters(16) + rec_stats_zlib.int_huffman_busy;
+          a_counters(17) <= a_counters(17) + rec_stats_zlib.int_huffman_bytes;
+        end if;
+
+        if (to_integer(unsigned(islv_counter_select)) < C_COUNTERS) then
+          slv_counter <= std_logic_vector(a_counters(to_integer(unsigned(islv_counter_select))));
+        else
+          slv_counter <= (others => '0');
         end if;
       end if;
-    end if;
 
-  end process proc_generate_flush_impulse;
+    end process proc_perf_counters;
+
+  end generate gen_perf_counters;
 
   osl_valid <= sl_valid_out;
   oslv_data <= slv_data_out;
-  -- Adler and row filter can process only a word in two cycles.
-  osl_rdy    <= not isl_valid and sl_rdy_row_filter when state = ZLIB else
-                '0';
-  osl_finish <= sl_finish;
+  -- The row filter and the compression core can process a byte per cycle.
+  -- osl_rdy doesn't depend on isl_valid. Thus it can be used as AXI4-Stream TREADY.
+  sl_rdy_core  <= sl_rdy_row_filter and sl_rdy_zlib when state = ZLIB else
+                  '0';
+  osl_rdy      <= sl_rdy;
+  osl_finish   <= sl_finish;
+  oslv_counter <= slv_counter;
 
 end architecture behavioral;
@@ -0,0 +1,253 @@
+-- AXI4-Stream wrapper of the png encoder.
+-- The encoder output is buffered in a FIFO. The encoder gets stalled, if the FIFO
+-- has no space for the bytes that zlib can still send (see C_ZLIB_MAX_OVERRUN).
+-- The stall propagates to the input.
+
+library ieee;
+  use ieee.std_logic_1164.all;
+  use ieee.numeric_std.all;
+
+library png_lib;
+
+library util;
+  use util.math_pkg.all;
+  use util.png_pkg.all;
+
+entity png_encoder_axis is
+  generic (
+    -- See png_encoder for a description of the generics.
+    C_IMG_WIDTH             : integer                    := 800;
+    C_IMG_HEIGHT            : integer                    := 480;
+    C_IMG_BIT_DEPTH         : integer range 1 to 16      := 8;
+    C_COLOR_TYPE            : integer range 0 to 6       := 2;
+    C_PALETTE_SIZE          : integer range 1 to 256     := 256;
+    C_INPUT_BYTES           : integer range 1 to 8       := 1;
+    C_INPUT_BUFFER_SIZE     : integer range 3 to 258     := 12;
+    C_SEARCH_BUFFER_SIZE    : integer range 1 to 32768   := 12;
+    C_MAX_MATCH_LENGTH_USER : integer                    := 7;
+    C_MATCH_MODE            : integer range 0 to 2       := 0;
+    C_WINDOW_TYPE           : integer range 0 to 1       := 0;
+    C_BTYPE                 : integer range 0 to 3       := 1;
+    C_BLOCK_SIZE            : integer range 2 to 16384   := 1024;
+    C_STORED_FALLBACK       : integer range 0 to 1       := 0;
+    C_LANES                 : integer range 1 to 8       := 1;
+    C_LANE_BUFFER_SIZE      : integer range 512 to 65536 := 4096;
+    C_ROW_FILTER_TYPE       : integer range 0 to 5       := 0;
+    C_IDAT_CHUNK_SIZE       : integer range 0 to 32768   := 0;
+    C_FRAME_BUFFER_SIZE     : integer range 0 to 65536   := 0;
+    C_PERF_COUNTERS         : integer range 0 to 1       := 0;
+
+    -- Additional space of the output FIFO in bytes. The FIFO gets at least
+    -- C_OUTPUT_FIFO_SIZE bytes more than zlib can send after the encoder got stalled.
+    C_OUTPUT_FIFO_SIZE : integer range 0 to 65536 := 1024
+  );
+  port (
+    isl_clk : in    std_logic;
+
+    -- A frame starts with the first input word. TLAST can mark the last word of a frame.
+    -- It is optional and only checked in simulation, because the frame size is given by the generics.
+    -- C_FRAME_BUFFER_SIZE > 0: The next frame can start directly after the last word of the current frame.
+    isl_s_axis_tvalid : in    std_logic;
+    osl_s_axis_tready : out   std_logic;
+    islv_s_axis_tdata : in    std_logic_vector(C_INPUT_BYTES * 8 - 1 downto 0);
+    isl_s_axis_tlast  : in    std_logic;
+
+    -- TLAST marks the last byte of a PNG image.
+    osl_m_axis_tvalid : out   std_logic;
+    isl_m_axis_tready : in    std_logic;
+    oslv_m_axis_tdata : out   std_logic_vector(7 downto 0);
+    osl_m_axis_tlast  : out   std_logic;
+
+    -- palette of C_COLOR_TYPE = 3, see png_encoder
+    isl_palette_we    : in    std_logic;
+    islv_palette_addr : in    std_logic_vector(7 downto 0);
+    islv_palette_data : in    std_logic_vector(23 downto 0);
+
+    -- performance counters, see png_encoder
+    islv_counter_select : in    std_logic_vector(4 downto 0);
+    oslv_counter        : out   std_logic_vector(31 downto 0)
+  );
+end entity png_encoder_axis;
+
+architecture behavioral of png_encoder_axis is
+
+  constant C_IMG_DEPTH : integer := get_img_depth(C_COLOR_TYPE);
+  -- input bytes per row
+  constant C_ROW_BYTES : integer := C_IMG_WIDTH * C_IMG_DEPTH * max_int(1, C_IMG_BIT_DEPTH / 8);
+  constant C_WORDS     : integer := C_IMG_HEIGHT * C_ROW_BYTES / C_INPUT_BYTES;
+
+  -- The encoder stops sending one cycle after it got stalled. Only zlib can send
+  -- C_ZLIB_MAX_OVERRUN bytes more, if its output isn't buffered for the IDAT chunks.
+  -- The margin of four bytes covers the byte requested by the last isl_get, the output
+  -- registers of zlib and png_encoder and the pending byte.
+  constant C_MAX_OVERRUN     : integer := C_ZLIB_MAX_OVERRUN;
+  constant C_FIFO_ADDR_WIDTH : integer := log2(C_MAX_OVERRUN + C_OUTPUT_FIFO_SIZE + 5);
+
+  signal sl_start     : std_logic                      := '0';
+  signal sl_active    : std_logic                      := '0';
+  signal sl_valid_in  : std_logic                      := '0';
+  signal sl_rdy       : std_logic                      := '0';
+  signal sl_space     : std_logic                      := '0';
+  signal int_word_cnt : integer range 0 to C_WORDS - 1 := 0;
+  -- frames, that were started and aren't finished yet
+  signal int_frames : integer range 0 to 2 := 0;
+
+  signal slv_data_out : std_logic_vector(7 downto 0) := (others => '0');
+  signal sl_valid_out : std_logic                    := '0';
+  signal sl_finish    : std_logic                    := '0';
+
+  -- The last byte is known only at the finish impulse. Thus the bytes are written delayed.
+  signal slv_pending       : std_logic_vector(7 downto 0) := (others => '0');
+  signal sl_pending_valid  : std_logic                    := '0';
+  signal sl_fifo_we        : std_logic                    := '0';
+  signal slv_fifo_data_in  : std_logic_vector(8 downto 0) := (others => '0');
+  signal slv_fifo_data_out : std_logic_vector(8 downto 0) := (others => '0');
+
+  signal slv_fifo_waddr      : std_logic_vector(C_FIFO_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fifo_waddr_d1   : std_logic_vector(C_FIFO_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fifo_raddr      : std_logic_vector(C_FIFO_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_fifo_raddr_next : std_logic_vector(C_FIFO_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal sl_fifo_pop         : std_logic                                        := '0';
+  signal sl_m_axis_tvalid    : std_logic                                        := '0';
+
+begin
+
+  i_png_encoder : entity png_lib.png_encoder(behavioral)
+    generic map (
+      C_IMG_WIDTH             => C_IMG_WIDTH,
+      C_IMG_HEIGHT            => C_IMG_HEIGHT,
+      C_IMG_BIT_DEPTH         => C_IMG_BIT_DEPTH,
+      C_COLOR_TYPE            => C_COLOR_TYPE,
+      C_PALETTE_SIZE          => C_PALETTE_SIZE,
+      C_INPUT_BYTES           => C_INPUT_BYTES,
+      C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
+      C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
+      C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+      C_MATCH_MODE            => C_MATCH_MODE,
+      C_WINDOW_TYPE           => C_WINDOW_TYPE,
+      C_BTYPE                 => C_BTYPE,
+      C_BLOCK_SIZE            => C_BLOCK_SIZE,
+      C_STORED_FALLBACK       => C_STORED_FALLBACK,
+      C_LANES                 => C_LANES,
+      C_LANE_BUFFER_SIZE      => C_LANE_BUFFER_SIZE,
+      C_ROW_FILTER_TYPE       => C_ROW_FILTER_TYPE,
+      C_IDAT_CHUNK_SIZE       => C_IDAT_CHUNK_SIZE,
+      C_FRAME_BUFFER_SIZE     => C_FRAME_BUFFER_SIZE,
+      C_PERF_COUNTERS         => C_PERF_COUNTERS
+    )
+    port map (
+      isl_clk    => isl_clk,
+      isl_start  => sl_start,
+      isl_valid  => sl_valid_in,
+      islv_data  => islv_s_axis_tdata,
+      oslv_data  => slv_data_out,
+      osl_valid  => sl_valid_out,
+      osl_rdy    => sl_rdy,
+      osl_finish => sl_finish,
+      isl_get    => sl_space,
+
+      isl_palette_we    => isl_palette_we,
+      islv_palette_addr => islv_palette_addr,
+      islv_palette_data => islv_palette_data,
+
+      islv_counter_select => islv_counter_select,
+      oslv_counter        => oslv_counter
+    );
+
+  i_output_fifo : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_FIFO_ADDR_WIDTH,
+      C_DATA_WIDTH => 9
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => sl_fifo_we,
+      islv_waddr => slv_fifo_waddr,
+      islv_data  => slv_fifo_data_in,
+
+      islv_raddr => slv_fifo_raddr_next,
+      oslv_data  => slv_fifo_data_out
+    );
+
+  -- The encoder output is stored together with the last flag.
+  sl_fifo_we       <= sl_pending_valid and (sl_valid_out or sl_finish);
+  slv_fifo_data_in <= sl_finish & slv_pending;
+
+  sl_space <= '1' when unsigned(slv_fifo_waddr) - unsigned(slv_fifo_raddr) <
+                       2 ** C_FIFO_ADDR_WIDTH - C_MAX_OVERRUN - 4 else
+              '0';
+
+  -- osl_rdy of the encoder doesn't depend on isl_valid. Thus there is no combinational loop.
+  osl_s_axis_tready <= sl_active and sl_rdy;
+  sl_valid_in       <= isl_s_axis_tvalid and sl_active and sl_rdy;
+
+  -- The written data can be read one cycle later.
+  sl_m_axis_tvalid    <= '1' when slv_fifo_waddr_d1 /= slv_fifo_raddr else
+                         '0';
+  sl_fifo_pop         <= sl_m_axis_tvalid and isl_m_axis_tready;
+  slv_fifo_raddr_next <= std_logic_vector(unsigned(slv_fifo_raddr) + 1) when sl_fifo_pop = '1' else
+                         slv_fifo_raddr;
+
+  proc_axis : process (isl_clk) is
+  begin
+
+    if (rising_edge(isl_clk)) then
+      sl_start <= '0';
+
+      -- A frame gets started by the first input word. Without frame buffer, the previous
+      -- frame has to be finished. Else only the next frame can be started in advance.
+      if (sl_active = '0' and sl_start = '0' and isl_s_axis_tvalid = '1' and
+          (int_frames = 0 or (C_FRAME_BUFFER_SIZE /= 0 and int_frames = 1))) then
+        sl_start <= '1';
+      end if;
+      if (sl_start = '1') then
+        sl_active <= '1';
+      end if;
+
+      if (sl_start = '1' and sl_finish = '0') then
+        int_frames <= int_frames + 1;
+      elsif (sl_start = '0' and sl_finish = '1') then
+        int_frames <= int_frames - 1;
+      end if;
+
+      if (sl_valid_in = '1') then
+        if (int_word_cnt = C_WORDS - 1) then
+          int_word_cnt <= 0;
+          sl_active    <= '0';
+        else
+          int_word_cnt <= int_word_cnt + 1;
+        end if;
+      end if;
+
+      -- synthesis translate_off
+      assert not (sl_valid_in = '1' and isl_s_axis_tlast = '1' and int_word_cnt /= C_WORDS - 1)
+        report "TLAST before the end of the image"
+        severity warning;
+      assert not (sl_valid_out = '1' and sl_finish = '1');
+      assert not (sl_fifo_we = '1' and unsigned(slv_fifo_waddr) + 1 = unsigned(slv_fifo_raddr))
+        report "output FIFO overflow"
+        severity error;
+      -- synthesis translate_on
+
+      if (sl_valid_out = '1') then
+        slv_pending      <= slv_data_out;
+        sl_pending_valid <= '1';
+      elsif (sl_finish = '1') then
+        sl_pending_valid <= '0';
+      end if;
+
+      if (sl_fifo_we = '1') then
+        slv_fifo_waddr <= std_logic_vector(unsigned(slv_fifo_waddr) + 1);
+      end if;
+      slv_fifo_waddr_d1 <= slv_fifo_waddr;
+      slv_fifo_raddr    <= slv_fifo_raddr_next;
+    end if;
+
+  end process proc_axis;
+
+  osl_m_axis_tvalid <= sl_m_axis_tvalid;
+  oslv_m_axis_tdata <= slv_fifo_data_out(7 downto 0);
+  osl_m_axis_tlast  <= slv_fifo_data_out(8);
+
+end architecture behavioral;
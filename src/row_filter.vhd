@@ -2,132 +2,334 @@ library ieee;
   use ieee.std_logic_1164.all;
   use ieee.numeric_std.all;
 
+library png_lib;
+
 library util;
   use util.png_pkg.all;
   use util.math_pkg.all;
 
 entity row_filter is
   generic (
-    -- TODO: row filter type is allowed to change row wise -> signal
-    C_ROW_FILTER_TYPE : integer range 0 to 4 := 1;
+    -- 0 - 4: fixed filter type for all rows
+    -- 5: adaptive filter type, chosen for each row separately
+    C_ROW_FILTER_TYPE : integer range 0 to 5 := 1;
     C_IMG_WIDTH       : integer              := 10;
     C_IMG_HEIGHT      : integer              := 10;
-    C_IMG_DEPTH       : integer              := 1
+    C_IMG_DEPTH       : integer              := 1;
+    -- bytes per input word, the first byte is in the most significant bits
+    C_INPUT_BYTES : integer range 1 to 8 := 1
   );
   port (
-    isl_clk   : in    std_logic;
-    isl_start : in    std_logic;
-    isl_get   : in    std_logic;
-    isl_valid : in    std_logic;
-    islv_data : in    std_logic_vector(7 downto 0);
-    oslv_data : out   std_logic_vector(7 downto 0);
-    osl_valid : out   std_logic;
-    osl_rdy   : out   std_logic
+    isl_clk    : in    std_logic;
+    isl_start  : in    std_logic;
+    isl_get    : in    std_logic;
+    isl_valid  : in    std_logic;
+    islv_data  : in    std_logic_vector(C_INPUT_BYTES * 8 - 1 downto 0);
+    oslv_data  : out   std_logic_vector(7 downto 0);
+    osl_valid  : out   std_logic;
+    osl_rdy    : out   std_logic;
+    osl_finish : out   std_logic
   );
 end entity row_filter;
 
 architecture behavioral of row_filter is
 
-  signal int_column_cnt  : integer range 0 to C_IMG_WIDTH - 1  := 0;
-  signal int_row_cnt     : integer range 0 to C_IMG_HEIGHT - 1 := 0;
-  signal int_channel_cnt : integer range 0 to C_IMG_DEPTH - 1  := 0;
+  constant C_ROW_BYTES  : integer := C_IMG_WIDTH * C_IMG_DEPTH;
+  constant C_ADDR_WIDTH : integer := max_int(1, log2(C_ROW_BYTES));
+
+  signal int_byte_cnt      : integer range 0 to C_ROW_BYTES - 1  := 0;
+  signal int_byte_cnt_next : integer range 0 to C_ROW_BYTES - 1  := 0;
+  signal int_row_cnt       : integer range 0 to C_IMG_HEIGHT - 1 := 0;
+  signal int_channel_cnt   : integer range 0 to C_IMG_DEPTH - 1  := 0;
+  signal sl_next_byte      : std_logic                           := '0';
+
+  -- The input words are split into bytes.
+  signal sl_valid_byte  : std_logic                                        := '0';
+  signal slv_data_byte  : std_logic_vector(7 downto 0)                     := (others => '0');
+  signal slv_word       : std_logic_vector(C_INPUT_BYTES * 8 - 1 downto 0) := (others => '0');
+  signal int_word_bytes : integer range 0 to C_INPUT_BYTES                 := 0;
 
   -- Row filter is applied pixel-wise. I. e. for each channel separately.
 
   type t_last_pixel is array(0 to C_IMG_DEPTH - 1) of std_logic_vector(7 downto 0);
 
+  -- a: left, b: above, c: upper left
   signal a_last_pixel : t_last_pixel                 := (others => (others => '0'));
+  signal a_last_above : t_last_pixel                 := (others => (others => '0'));
+  signal slv_above    : std_logic_vector(7 downto 0) := (others => '0');
+  signal sl_first_row : std_logic                    := '0';
+
+  -- The line buffer contains the unfiltered previous row.
+  signal slv_line_buffer_raddr : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_line_buffer_waddr : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_line_buffer_out   : std_logic_vector(7 downto 0)                := (others => '0');
+
+  -- adaptive filter type
+  -- The whole row is needed to choose the filter type. Thus the row gets
+  -- delayed by the row buffer and the filter is applied in a second pass.
+  signal slv_row_buffer_out : std_logic_vector(7 downto 0) := (others => '0');
+
+  type t_filter_sums is array(0 to 4) of integer range 0 to C_ROW_BYTES * 128;
+
+  signal a_filter_sums : t_filter_sums := (others => 0);
+
+  -- The adaptive filter type gets chosen per row. Else it's constant.
+  signal int_filter_type : integer range 0 to 4 := min_int(C_ROW_FILTER_TYPE, 4);
+
+  -- input of the filter stage
+  signal sl_valid_filter : std_logic                    := '0';
+  signal slv_data_filter : std_logic_vector(7 downto 0) := (others => '0');
+
   signal sl_valid_out : std_logic                    := '0';
   signal slv_data_out : std_logic_vector(7 downto 0) := (others => '0');
   signal sl_rdy       : std_logic                    := '0';
+  signal sl_rdy_word  : std_logic                    := '0';
+  signal sl_finish    : std_logic                    := '0';
 
-  type t_states is (IDLE, SEND_FILTER_TYPE, APPLY_FILTER, DELAY);
+  type t_states is (IDLE, COLLECT, SELECT_FILTER, SEND_FILTER_TYPE, APPLY_FILTER);
 
   signal state : t_states;
 
 begin
 
+  gen_byte_input : if C_INPUT_BYTES = 1 generate
+    sl_valid_byte <= isl_valid;
+    slv_data_byte <= islv_data;
+    sl_rdy_word   <= sl_rdy;
+  end generate gen_byte_input;
+
+  -- The bytes of a word are processed one after another, one byte per cycle.
+  -- A new word can be accepted when the last byte of the current word is processed.
+
+  gen_word_input : if C_INPUT_BYTES > 1 generate
+    sl_valid_byte <= '1' when int_word_bytes /= 0 and sl_rdy = '1' and isl_get = '1' else
+                     '0';
+    slv_data_byte <= slv_word(slv_word'high downto slv_word'high - 7);
+    sl_rdy_word   <= '1' when int_word_bytes = 0 or (int_word_bytes = 1 and sl_valid_byte = '1') else
+                     '0';
+
+    proc_word_input : process (isl_clk) is
+    begin
+
+      if (rising_edge(isl_clk)) then
+        if (isl_valid = '1') then
+          slv_word       <= islv_data;
+          int_word_bytes <= C_INPUT_BYTES;
+        elsif (sl_valid_byte = '1') then
+          slv_word       <= slv_word(slv_word'high - 8 downto 0) & x"00";
+          int_word_bytes <= int_word_bytes - 1;
+        end if;
+      end if;
+
+    end process proc_word_input;
+
+  end generate gen_word_input;
+
+  -- The line buffer is only needed by the filters that use the previous row.
+
+  gen_line_buffer : if C_ROW_FILTER_TYPE >= 2 generate
+
+    i_line_buffer : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => C_ADDR_WIDTH,
+        C_DATA_WIDTH => 8
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => sl_valid_filter,
+        islv_waddr => slv_line_buffer_waddr,
+        islv_data  => slv_data_filter,
+
+        islv_raddr => slv_line_buffer_raddr,
+        oslv_data  => slv_line_buffer_out
+      );
+
+  end generate gen_line_buffer;
+
+  gen_row_buffer : if C_ROW_FILTER_TYPE = 5 generate
+
+    i_row_buffer : entity png_lib.bram(rtl)
+      generic map (
+        C_ADDR_WIDTH => C_ADDR_WIDTH,
+        C_DATA_WIDTH => 8
+      )
+      port map (
+        isl_clk => isl_clk,
+
+        isl_we     => sl_valid_byte,
+        islv_waddr => slv_line_buffer_waddr,
+        islv_data  => slv_data_byte,
+
+        islv_raddr => slv_line_buffer_raddr,
+        oslv_data  => slv_row_buffer_out
+      );
+
+  end generate gen_row_buffer;
+
+  -- Fixed filter type: The input is filtered directly.
+  -- Adaptive filter type: The delayed row is filtered, when the compression core is ready.
+  sl_valid_filter <= sl_valid_byte when state = APPLY_FILTER and C_ROW_FILTER_TYPE /= 5 else
+                     isl_get when state = APPLY_FILTER else
+                     '0';
+  slv_data_filter <= slv_row_buffer_out when C_ROW_FILTER_TYPE = 5 else
+                     slv_data_byte;
+
+  sl_next_byte      <= sl_valid_byte when state = COLLECT else
+                       sl_valid_filter;
+  int_byte_cnt_next <= int_byte_cnt when sl_next_byte = '0' else
+                       0 when int_byte_cnt = C_ROW_BYTES - 1 else
+                       int_byte_cnt + 1;
+
+  -- Prefetch the byte of the next column.
+  slv_line_buffer_raddr <= std_logic_vector(to_unsigned(int_byte_cnt_next, C_ADDR_WIDTH));
+  slv_line_buffer_waddr <= std_logic_vector(to_unsigned(int_byte_cnt, C_ADDR_WIDTH));
+
+  -- pixel above the first scanline are treated as 0
+  slv_above <= (others => '0') when sl_first_row = '1' else
+               slv_line_buffer_out;
+
   proc_row_filter : process (isl_clk) is
+
+    variable v_int_best_type : integer range 0 to 4;
+
   begin
 
     if (rising_edge(isl_clk)) then
       -- defaults
       sl_valid_out <= '0';
       sl_rdy       <= '0';
+      sl_finish    <= '0';
+
+      int_byte_cnt <= int_byte_cnt_next;
+      if (sl_next_byte = '1') then
+        if (int_channel_cnt /= C_IMG_DEPTH - 1) then
+          int_channel_cnt <= int_channel_cnt + 1;
+        else
+          int_channel_cnt <= 0;
+        end if;
+      end if;
 
       case state is
 
         when IDLE =>
 
           if (isl_start = '1') then
-            state <= SEND_FILTER_TYPE;
+            sl_first_row <= '1';
+            if (C_ROW_FILTER_TYPE = 5) then
+              -- pixel left of the first scanline pixel are treated as 0
+              a_last_pixel <= (others => (others => '0'));
+              a_last_above <= (others => (others => '0'));
+              state        <= COLLECT;
+            else
+              state <= SEND_FILTER_TYPE;
+            end if;
           end if;
 
+        when COLLECT =>
+
+          -- Heuristic of the PNG specification: Choose the filter type
+          -- with the minimum sum of absolute differences.
+          -- The filtered bytes are treated as signed values.
+          sl_rdy <= '1';
+
+          if (sl_valid_byte = '1') then
+
+            for filter_type in 0 to 4 loop
+
+              a_filter_sums(filter_type) <= a_filter_sums(filter_type) +
+                                            abs(to_integer(signed(apply_row_filter(filter_type,
+                                                                                   slv_data_byte,
+                                                                                   a_last_pixel(int_channel_cnt),
+                                                                                   slv_above,
+                                                                                   a_last_above(int_channel_cnt)))));
+
+            end loop;
+
+            a_last_pixel(int_channel_cnt) <= slv_data_byte;
+            a_last_above(int_channel_cnt) <= slv_above;
+
+            if (int_byte_cnt = C_ROW_BYTES - 1) then
+              sl_rdy <= '0';
+              state  <= SELECT_FILTER;
+            end if;
+          end if;
+
+        when SELECT_FILTER =>
+
+          -- On equal sums, the lower filter type is preferred.
+          v_int_best_type := 0;
+
+          for filter_type in 1 to 4 loop
+
+            if (a_filter_sums(filter_type) < a_filter_sums(v_int_best_type)) then
+              v_int_best_type := filter_type;
+            end if;
+
+          end loop;
+
+          int_filter_type <= v_int_best_type;
+          a_filter_sums   <= (others => 0);
+          state           <= SEND_FILTER_TYPE;
+
         when SEND_FILTER_TYPE =>
 
           if (isl_get = '1') then
             sl_valid_out <= '1';
-            slv_data_out <= std_logic_vector(to_unsigned(C_ROW_FILTER_TYPE, 8));
+            slv_data_out <= std_logic_vector(to_unsigned(int_filter_type, 8));
 
             -- pixel left of the first scanline pixel are treated as 0
             a_last_pixel <= (others => (others => '0'));
+            a_last_above <= (others => (others => '0'));
             state        <= APPLY_FILTER;
           end if;
 
         when APPLY_FILTER =>
 
-          sl_rdy <= '1';
-
-          if (C_ROW_FILTER_TYPE = 0) then
-            slv_data_out <= islv_data;
-          elsif (C_ROW_FILTER_TYPE = 1) then
-            -- unsigned arithmetic modulo 256 is used -> fits to 8 bit
-            slv_data_out <= std_logic_vector(unsigned(islv_data) -
-                                             unsigned(a_last_pixel(int_channel_cnt)));
-            if (isl_valid = '1') then
-              a_last_pixel(int_channel_cnt) <= islv_data;
-            end if;
-          else
-            report "Row filter type " & to_string(C_ROW_FILTER_TYPE) & " not yet implemented."
-              severity error;
+          if (C_ROW_FILTER_TYPE /= 5) then
+            sl_rdy <= '1';
           end if;
 
-          if (isl_valid = '1') then
-            sl_valid_out <= '1';
-            if (int_channel_cnt /= C_IMG_DEPTH - 1) then
-              int_channel_cnt <= int_channel_cnt + 1;
-            else
-              int_channel_cnt <= 0;
-              if (int_column_cnt /= C_IMG_WIDTH - 1) then
-                int_column_cnt <= int_column_cnt + 1;
-              else
-                int_column_cnt <= 0;
-                if (int_row_cnt /= C_IMG_HEIGHT - 1) then
-                  -- Adler can only handle one input in two cycles.
-                  -- Slow it down here and at the DELAY state.
-                  sl_rdy      <= '0';
-                  state       <= DELAY;
-                  int_row_cnt <= int_row_cnt + 1;
+          slv_data_out <= apply_row_filter(int_filter_type,
+                                           slv_data_filter,
+                                           a_last_pixel(int_channel_cnt),
+                                           slv_above,
+                                           a_last_above(int_channel_cnt));
+
+          if (sl_valid_filter = '1') then
+            sl_valid_out                  <= '1';
+            a_last_pixel(int_channel_cnt) <= slv_data_filter;
+            a_last_above(int_channel_cnt) <= slv_above;
+
+            if (int_byte_cnt = C_ROW_BYTES - 1) then
+              sl_first_row <= '0';
+              if (int_row_cnt /= C_IMG_HEIGHT - 1) then
+                sl_rdy      <= '0';
+                int_row_cnt <= int_row_cnt + 1;
+                if (C_ROW_FILTER_TYPE = 5) then
+                  a_last_pixel <= (others => (others => '0'));
+                  a_last_above <= (others => (others => '0'));
+                  state        <= COLLECT;
                 else
-                  state       <= IDLE;
-                  int_row_cnt <= 0;
+                  state <= SEND_FILTER_TYPE;
                 end if;
+              else
+                state       <= IDLE;
+                int_row_cnt <= 0;
+                sl_finish   <= '1';
               end if;
             end if;
           end if;
 
-        when DELAY =>
-
-          state <= SEND_FILTER_TYPE;
-
       end case;
 
     end if;
 
   end process proc_row_filter;
 
-  oslv_data <= slv_data_out;
-  osl_valid <= sl_valid_out;
-  osl_rdy   <= sl_rdy;
+  oslv_data  <= slv_data_out;
+  osl_valid  <= sl_valid_out;
+  osl_rdy    <= sl_rdy_word;
+  osl_finish <= sl_finish;
 
 end architecture behavioral;
@@ -0,0 +1,200 @@
+-- RFC 1951, 3.2.4. Non-compressed blocks (BTYPE=00)
+-- The input data is buffered until a block is complete. Then the block header,
+-- LEN, NLEN and the data are sent with one byte per cycle, while the next stage is ready.
+-- The latency is limited by the block size.
+-- If C_FINAL_BLOCK = 0, the last block isn't marked as final. Stored blocks end
+-- at a byte boundary, so another deflate stream can be appended directly.
+
+library ieee;
+  use ieee.std_logic_1164.all;
+  use ieee.numeric_std.all;
+
+library png_lib;
+
+library util;
+  use util.math_pkg.all;
+
+entity stored is
+  generic (
+    C_BLOCK_SIZE  : integer range 2 to 65535 := 1024;
+    C_FINAL_BLOCK : integer range 0 to 1     := 1
+  );
+  port (
+    isl_clk   : in    std_logic;
+    isl_flush : in    std_logic;
+    -- The next stage is ready for output. If it's inactive, no output is sent in the next cycle.
+    isl_get    : in    std_logic;
+    isl_valid  : in    std_logic;
+    islv_data  : in    std_logic_vector(7 downto 0);
+    oslv_data  : out   std_logic_vector(7 downto 0);
+    osl_valid  : out   std_logic;
+    osl_rdy    : out   std_logic;
+    osl_finish : out   std_logic
+  );
+end entity stored;
+
+architecture behavioral of stored is
+
+  -- The buffer can contain the current and the next block.
+  constant C_ADDR_WIDTH  : integer := max_int(6, log2(C_BLOCK_SIZE) + 1);
+  constant C_FIFO_MARGIN : integer := 16;
+
+  signal slv_bram_raddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_bram_raddr_next : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_bram_waddr      : std_logic_vector(C_ADDR_WIDTH - 1 downto 0) := (others => '0');
+  signal slv_bram_data_out   : std_logic_vector(7 downto 0);
+  signal sl_bram_pop         : std_logic                                   := '0';
+  signal int_fill            : integer range 0 to 2 ** C_ADDR_WIDTH - 1    := 0;
+
+  type t_states is (IDLE, HEADER, LEN_LOW, LEN_HIGH, NLEN_LOW, NLEN_HIGH, DATA);
+
+  signal state : t_states := IDLE;
+
+  signal slv_length    : std_logic_vector(15 downto 0)   := (others => '0');
+  signal int_remaining : integer range 0 to C_BLOCK_SIZE := 0;
+  signal sl_final      : std_logic                       := '0';
+  signal sl_bfinal     : std_logic                       := '0';
+  signal sl_flush      : std_logic                       := '0';
+  signal sl_finish     : std_logic                       := '0';
+  signal sl_valid_out  : std_logic                       := '0';
+  signal slv_data_out  : std_logic_vector(7 downto 0)    := (others => '0');
+
+begin
+
+  i_buffer : entity png_lib.bram(rtl)
+    generic map (
+      C_ADDR_WIDTH => C_ADDR_WIDTH,
+      C_DATA_WIDTH => 8
+    )
+    port map (
+      isl_clk => isl_clk,
+
+      isl_we     => isl_valid,
+      islv_waddr => slv_bram_waddr,
+      islv_data  => islv_data,
+
+      islv_raddr => slv_bram_raddr_next,
+      oslv_data  => slv_bram_data_out
+    );
+
+  int_fill <= to_integer(unsigned(slv_bram_waddr) - unsigned(slv_bram_raddr));
+
+  sl_bram_pop         <= '1' when state = DATA and int_remaining /= 0 and isl_get = '1' else
+                         '0';
+  slv_bram_raddr_next <= std_logic_vector(unsigned(slv_bram_raddr) + 1) when sl_bram_pop = '1' else
+                         slv_bram_raddr;
+
+  proc_stored : process (isl_clk) is
+  begin
+
+    if (rising_edge(isl_clk)) then
+      -- defaults
+      sl_finish    <= '0';
+      sl_valid_out <= '0';
+
+      if (isl_valid = '1') then
+        slv_bram_waddr <= std_logic_vector(unsigned(slv_bram_waddr) + 1);
+      end if;
+      slv_bram_raddr <= slv_bram_raddr_next;
+
+      -- Preserve the flush impulse, since it might be not processed directly.
+      if (isl_flush = '1') then
+        sl_flush <= '1';
+      end if;
+
+      case state is
+
+        when IDLE =>
+
+          -- A block is sent, if it's complete or if there is no more input.
+          -- A complete block is only sent as non-final, if more input follows.
+          -- Else it waits for the flush and gets the final block. Otherwise
+          -- an input of a multiple of C_BLOCK_SIZE would end by an empty block.
+          if (sl_flush = '1' and isl_valid = '0' and int_fill <= C_BLOCK_SIZE) then
+            sl_flush      <= '0';
+            sl_final      <= '1';
+            slv_length    <= std_logic_vector(to_unsigned(int_fill, slv_length'length));
+            int_remaining <= int_fill;
+            state         <= HEADER;
+            if (C_FINAL_BLOCK = 1) then
+              sl_bfinal <= '1';
+            end if;
+          elsif (int_fill > C_BLOCK_SIZE or (int_fill = C_BLOCK_SIZE and isl_valid = '1')) then
+            slv_length    <= std_logic_vector(to_unsigned(C_BLOCK_SIZE, slv_length'length));
+            int_remaining <= C_BLOCK_SIZE;
+            state         <= HEADER;
+          end if;
+
+        when HEADER =>
+
+          -- BFINAL, BTYPE and padding
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= "0000000" & sl_bfinal;
+            state        <= LEN_LOW;
+          end if;
+
+        when LEN_LOW =>
+
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= slv_length(7 downto 0);
+            state        <= LEN_HIGH;
+          end if;
+
+        when LEN_HIGH =>
+
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= slv_length(15 downto 8);
+            state        <= NLEN_LOW;
+          end if;
+
+        when NLEN_LOW =>
+
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= not slv_length(7 downto 0);
+            state        <= NLEN_HIGH;
+          end if;
+
+        when NLEN_HIGH =>
+
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= not slv_length(15 downto 8);
+            state        <= DATA;
+          end if;
+
+        when DATA =>
+
+          if (int_remaining /= 0) then
+            if (isl_get = '1') then
+              sl_valid_out  <= '1';
+              slv_data_out  <= slv_bram_data_out;
+              int_remaining <= int_remaining - 1;
+            end if;
+          elsif (sl_final = '1') then
+            sl_final  <= '0';
+            sl_bfinal <= '0';
+            sl_finish <= '1';
+            state     <= IDLE;
+          else
+            state <= IDLE;
+          end if;
+
+      end case;
+
+    end if;
+
+  end process proc_stored;
+
+  -- Leave some margin for the datums that are already on the way.
+  osl_rdy <= '1' when int_fill < 2 ** C_ADDR_WIDTH - C_FIFO_MARGIN else
+             '0';
+
+  oslv_data  <= slv_data_out;
+  osl_valid  <= sl_valid_out;
+  osl_finish <= sl_finish;
+
+end architecture behavioral;
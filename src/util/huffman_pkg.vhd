@@ -42,6 +42,41 @@ package huffman_pkg is
     raw_value : integer
   ) return t_code;
 
+  -- All code parts of a token, merged to a single code.
+  -- The bits are right aligned. They are in transmission order, starting at the most significant bit.
+  -- A match has at most 8 + 5 + 5 + 13 = 31 bits.
+  constant C_MAX_TOKEN_BITS : integer := 31;
+
+  type t_token_code is record
+    bits  : integer range 0 to C_MAX_TOKEN_BITS;
+    value : unsigned(C_MAX_TOKEN_BITS - 1 downto 0);
+  end record t_token_code;
+
+  function get_fixed_literal_token (
+    raw_value : integer
+  ) return t_token_code;
+
+  function get_fixed_match_token (
+    length   : integer;
+    distance : integer
+  ) return t_token_code;
+
+  -- RFC 1951, 3.2.7. Compression with dynamic Huffman codes (BTYPE=10)
+
+  type t_int_array is array (natural range <>) of integer;
+
+  constant C_CODE_LENGTH_ORDER : t_int_array(0 to 18) := (16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15);
+
+  function get_code_length (
+    freq  : integer;
+    total : integer
+  ) return integer;
+
+  function revert_bits (
+    value : integer;
+    bits  : integer
+  ) return integer;
+
 end package huffman_pkg;
 
 package body huffman_pkg is
@@ -59,7 +94,7 @@ package body huffman_pkg is
     assert (minimum <= value and value <= maximum)
       report "invalid " & name & " " & to_string(value);
 
-  end procedure;
+  end procedure assert_in_range;
 
   -- Assert a huffman code is valid.
   -- For details, see RFC1951 3.2.5. Compressed blocks (length and distance codes)
@@ -86,7 +121,7 @@ package body huffman_pkg is
       assert_in_range("distance extra value", 0, 2 ** 13 - 1, huffman_code.distance.value);
     end if;
 
-  end procedure;
+  end procedure assert_huffman_code_valid;
 
   function get_literal_code (
     raw_value : integer
@@ -104,7 +139,7 @@ package body huffman_pkg is
 
     return v_code;
 
-  end function;
+  end function get_literal_code;
 
   function get_length_code (
     raw_value : integer
@@ -174,7 +209,7 @@ package body huffman_pkg is
 
     return v_code;
 
-  end function;
+  end function get_length_code;
 
   function get_length_extra_code (
     raw_value : integer
@@ -188,7 +223,7 @@ package body huffman_pkg is
     if (raw_value <= 2) then
       report "invalid length " & to_string(raw_value)
         severity error;
-    elsif (raw_value <= 10 or raw_value = 285) then
+    elsif (raw_value <= 10 or raw_value = 258) then
       v_code := (0, 0);
       return v_code;
     end if;
@@ -216,7 +251,7 @@ package body huffman_pkg is
     v_code.value := raw_value - v_int_start_value;
     return v_code;
 
-  end function;
+  end function get_length_extra_code;
 
   function get_distance_code (
     raw_value : integer
@@ -292,7 +327,7 @@ package body huffman_pkg is
     v_code.bits := 5;
     return v_code;
 
-  end function;
+  end function get_distance_code;
 
   function get_distance_extra_code (
     raw_value : integer
@@ -350,7 +385,7 @@ package body huffman_pkg is
       v_int_start_value := 8193;
     elsif (raw_value <= 32768) then
       v_code.bits       := 13;
-      v_int_start_value := 16384;
+      v_int_start_value := 16385;
     else
       report "invalid distance " & to_string(raw_value)
         severity error;
@@ -359,6 +394,128 @@ package body huffman_pkg is
     v_code.value := raw_value - v_int_start_value;
     return v_code;
 
-  end function;
+  end function get_distance_extra_code;
+
+  -- Append a code to a token. The value has to fit into the bits of the code.
+  -- Huffman codes are transmitted starting at the most significant bit,
+  -- extra bits starting at the least significant bit.
+
+  function append_code (
+    token     : t_token_code;
+    code      : t_code;
+    lsb_first : boolean
+  ) return t_token_code is
+
+    variable v_token      : t_token_code;
+    variable v_uns_code   : unsigned(12 downto 0);
+    variable v_uns_revert : unsigned(12 downto 0);
+
+  begin
+
+    v_uns_code := to_unsigned(code.value, v_uns_code'length);
+
+    if (lsb_first) then
+
+      for bit_index in v_uns_code'range loop
+
+        v_uns_revert(bit_index) := v_uns_code(v_uns_code'high - bit_index);
+
+      end loop;
+
+      v_uns_code := shift_right(v_uns_revert, v_uns_code'length - code.bits);
+    end if;
+
+    -- Barrel shift the previous parts to make room for the new code.
+    v_token.bits  := token.bits + code.bits;
+    v_token.value := shift_left(token.value, code.bits) or resize(v_uns_code, C_MAX_TOKEN_BITS);
+    return v_token;
+
+  end function append_code;
+
+  function get_fixed_literal_token (
+    raw_value : integer
+  ) return t_token_code is
+  begin
+
+    return append_code((0, (others => '0')), get_literal_code(raw_value), false);
+
+  end function get_fixed_literal_token;
+
+  -- Look up all code parts of a match at once.
+
+  function get_fixed_match_token (
+    length   : integer;
+    distance : integer
+  ) return t_token_code is
+
+    variable v_token : t_token_code;
+    variable v_code  : t_code;
+
+  begin
+
+    -- get_length_code() returns the symbol. Convert it to the fixed huffman code.
+    -- RFC 1951, 3.2.6: 256 - 279 are coded by 7 bit, 280 - 287 by 8 bit starting at 11000000.
+    v_code := get_length_code(length);
+
+    if (v_code.value <= 279) then
+      v_code.value := v_code.value - 256;
+    else
+      v_code.value := v_code.value - 280 + 192;
+    end if;
+
+    v_token := append_code((0, (others => '0')), v_code, false);
+    v_token := append_code(v_token, get_length_extra_code(length), true);
+    v_token := append_code(v_token, get_distance_code(distance), false);
+    v_token := append_code(v_token, get_distance_extra_code(distance), true);
+    return v_token;
+
+  end function get_fixed_match_token;
+
+  -- Length of a Shannon code: The smallest length, for which freq * 2 ** length >= total.
+  -- The lengths always fulfill the Kraft inequality.
+
+  function get_code_length (
+    freq  : integer;
+    total : integer
+  ) return integer is
+  begin
+
+    for int_length in 0 to 15 loop
+
+      if (freq * 2 ** int_length >= total) then
+        return int_length;
+      end if;
+
+    end loop;
+
+    report "invalid code length for frequency " & to_string(freq) & " and total " & to_string(total)
+      severity error;
+    return 15;
+
+  end function get_code_length;
+
+  -- Revert the order of the lowest bits of an integer.
+  -- Needed for values that are transmitted starting with the least significant bit.
+
+  function revert_bits (
+    value : integer;
+    bits  : integer
+  ) return integer is
+
+    variable v_int_result : integer;
+
+  begin
+
+    v_int_result := 0;
+
+    for bit_index in 0 to bits - 1 loop
+
+      v_int_result := v_int_result * 2 + (value / 2 ** bit_index) mod 2;
+
+    end loop;
+
+    return v_int_result;
+
+  end function revert_bits;
 
 end package body huffman_pkg;
@@ -7,6 +7,38 @@ library util;
 
 package png_pkg is
 
+  -- Statistics of the deflate modules for the performance counters.
+  -- The values are valid for a single cycle and summed over all lanes.
+  -- Busy and stall are taken from the input handshake of each stage:
+  -- busy: input valid, stall: not ready. The huffman bytes include the block headers.
+
+  type t_deflate_stats is record
+    int_literals      : integer range 0 to 8;
+    int_matches       : integer range 0 to 8;
+    int_match_length  : integer range 0 to 8 * 258;
+    int_match_offset  : integer range 0 to 8 * 32768;
+    int_lzss_busy     : integer range 0 to 8;
+    int_lzss_stall    : integer range 0 to 8;
+    int_huffman_busy  : integer range 0 to 8;
+    int_huffman_stall : integer range 0 to 8;
+    int_huffman_bytes : integer range 0 to 8;
+    -- only set by zlib, which contains the adler32 checksums
+    int_adler32_busy : integer range 0 to 8;
+  end record t_deflate_stats;
+
+  type t_deflate_stats_array is array (natural range <>) of t_deflate_stats;
+
+  constant C_DEFLATE_STATS_NONE : t_deflate_stats := (0, 0, 0, 0, 0, 0, 0, 0, 0, 0);
+
+  -- Bytes, that zlib still outputs after isl_get was deasserted. The deflate stages
+  -- are stalled by isl_get, but the deflate output is registered once more in zlib.
+  constant C_ZLIB_MAX_OVERRUN : integer := 1;
+
+  function sum_deflate_stats (
+    stats : t_deflate_stats_array;
+    adler32_valid : std_logic_vector
+  ) return t_deflate_stats;
+
   function get_byte (
     vector: std_logic_vector;
     int_byte_index : natural
@@ -53,10 +85,63 @@ package png_pkg is
     constant max_match_length_user : integer
   ) return integer;
 
+  function paeth_predictor (
+    a,
+    b,
+    c : std_logic_vector(7 downto 0)
+  ) return std_logic_vector;
+
+  function apply_row_filter (
+    filter_type : integer range 0 to 4;
+    x,
+    a,
+    b,
+    c : std_logic_vector(7 downto 0)
+  ) return std_logic_vector;
+
 end package png_pkg;
 
 package body png_pkg is
 
+  -- sum the statistics of all lanes and count the busy adler32 checksums
+
+  function sum_deflate_stats (
+    stats : t_deflate_stats_array;
+    adler32_valid : std_logic_vector
+  ) return t_deflate_stats is
+
+    variable v_rec_sum : t_deflate_stats;
+
+  begin
+
+    v_rec_sum := C_DEFLATE_STATS_NONE;
+
+    for index in stats'range loop
+
+      v_rec_sum.int_literals      := v_rec_sum.int_literals + stats(index).int_literals;
+      v_rec_sum.int_matches       := v_rec_sum.int_matches + stats(index).int_matches;
+      v_rec_sum.int_match_length  := v_rec_sum.int_match_length + stats(index).int_match_length;
+      v_rec_sum.int_match_offset  := v_rec_sum.int_match_offset + stats(index).int_match_offset;
+      v_rec_sum.int_lzss_busy     := v_rec_sum.int_lzss_busy + stats(index).int_lzss_busy;
+      v_rec_sum.int_lzss_stall    := v_rec_sum.int_lzss_stall + stats(index).int_lzss_stall;
+      v_rec_sum.int_huffman_busy  := v_rec_sum.int_huffman_busy + stats(index).int_huffman_busy;
+      v_rec_sum.int_huffman_stall := v_rec_sum.int_huffman_stall + stats(index).int_huffman_stall;
+      v_rec_sum.int_huffman_bytes := v_rec_sum.int_huffman_bytes + stats(index).int_huffman_bytes;
+
+    end loop;
+
+    for index in adler32_valid'range loop
+
+      if (adler32_valid(index) = '1') then
+        v_rec_sum.int_adler32_busy := v_rec_sum.int_adler32_busy + 1;
+      end if;
+
+    end loop;
+
+    return v_rec_sum;
+
+  end function sum_deflate_stats;
+
   function get_byte (
     vector: std_logic_vector;
     int_byte_index : natural
@@ -65,7 +150,7 @@ package body png_pkg is
 
     return vector(int_byte_index * 8 - 1 downto (int_byte_index - 1) * 8);
 
-  end function;
+  end function get_byte;
 
   -- get the image depth, based on the color type
 
@@ -79,7 +164,7 @@ package body png_pkg is
     elsif (color_type = 2) then
       return 3; -- RGB
     elsif (color_type = 3) then
-      return 1; -- palette (TODO: is this correct?)
+      return 1; -- palette index
     elsif (color_type = 4) then
       return 2; -- gray with alpha
     elsif (color_type = 6) then
@@ -89,7 +174,7 @@ package body png_pkg is
         severity error;
     end if;
 
-  end function;
+  end function get_img_depth;
 
   -- xor two vectors
 
@@ -132,7 +217,7 @@ package body png_pkg is
 
     return v_slv_reverted;
 
-  end function;
+  end function revert_vector;
 
   function calculate_crc32 (
     data : std_logic_vector;
@@ -142,7 +227,7 @@ package body png_pkg is
 
     return calculate_crc32(data, x"00000000", revert);
 
-  end function;
+  end function calculate_crc32;
 
   -- TODO: CRC lut (https://www.w3.org/TR/PNG-CRCAppendix.html)
 
@@ -246,10 +331,8 @@ package body png_pkg is
 
     -- TODO: not supported (ignored) by ghdl synthesis yet
     -- synthesis translate_off
-    if (chunk_type = x"49454e44") then
-      assert v_chunk_crc = x"ae426082"
-        report to_hstring(v_chunk_crc);
-    end if;
+    assert chunk_type /= x"49454E44" or v_chunk_crc = x"AE426082"
+      report to_hstring(v_chunk_crc);
     -- synthesis translate_on
 
     return v_chunk_length & chunk_type & chunk_data & v_chunk_crc;
@@ -265,7 +348,7 @@ package body png_pkg is
 
     return log2(min_int(input_buffer_size, max_match_length_user) + 1);
 
-  end function;
+  end function calc_match_bits;
 
   function calc_huffman_bitwidth (
     constant btype : integer range 0 to 3;
@@ -279,14 +362,14 @@ package body png_pkg is
 
   begin
 
-    -- TODO: add btype = 2
+    -- btype = 1 and btype = 2 use the same LZSS output format.
 
     if (btype = 0) then
       return 8;
     end if;
 
     -- 1 bit match, distance/offset, length
-    v_int_match_offset := log2(search_buffer_size);
+    v_int_match_offset := log2(search_buffer_size + 1);
     v_int_match_length := calc_match_bits(input_buffer_size, max_match_length_user);
     -- At least 8 bit are needed to represent a literal.
     if (v_int_match_offset + v_int_match_length < 8) then
@@ -297,6 +380,80 @@ package body png_pkg is
 
     return 1 + v_int_match_offset + v_int_match_length;
 
-  end function;
+  end function calc_huffman_bitwidth;
+
+  -- http://www.libpng.org/pub/png/spec/1.2/PNG-Filters.html#Filter-type-4-Paeth
+  -- a: left, b: above, c: upper left
+
+  function paeth_predictor (
+    a,
+    b,
+    c : std_logic_vector(7 downto 0)
+  ) return std_logic_vector is
+
+    variable v_p  : integer range -255 to 510;
+    variable v_pa : integer range 0 to 510;
+    variable v_pb : integer range 0 to 510;
+    variable v_pc : integer range 0 to 510;
+
+  begin
+
+    v_p  := to_integer(unsigned(a)) + to_integer(unsigned(b)) - to_integer(unsigned(c));
+    v_pa := abs(v_p - to_integer(unsigned(a)));
+    v_pb := abs(v_p - to_integer(unsigned(b)));
+    v_pc := abs(v_p - to_integer(unsigned(c)));
+
+    -- The order of the comparisons is specified and mustn't be changed.
+    if (v_pa <= v_pb and v_pa <= v_pc) then
+      return a;
+    elsif (v_pb <= v_pc) then
+      return b;
+    else
+      return c;
+    end if;
+
+  end function paeth_predictor;
+
+  -- Filter a single byte. Unsigned arithmetic modulo 256 is used -> fits to 8 bit.
+  -- x: current byte, a: left, b: above, c: upper left
+
+  function apply_row_filter (
+    filter_type : integer range 0 to 4;
+    x,
+    a,
+    b,
+    c : std_logic_vector(7 downto 0)
+  ) return std_logic_vector is
+
+    variable v_average : unsigned(8 downto 0);
+
+  begin
+
+    case filter_type is
+
+      when 0 =>
+
+        return x;
+
+      when 1 =>
+
+        return std_logic_vector(unsigned(x) - unsigned(a));
+
+      when 2 =>
+
+        return std_logic_vector(unsigned(x) - unsigned(b));
+
+      when 3 =>
+
+        v_average := ('0' & unsigned(a)) + ('0' & unsigned(b));
+        return std_logic_vector(unsigned(x) - v_average(8 downto 1));
+
+      when others =>
+
+        return std_logic_vector(unsigned(x) - unsigned(paeth_predictor(a, b, c)));
+
+    end case;
+
+  end function apply_row_filter;
 
 end package body png_pkg;
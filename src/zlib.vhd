@@ -13,17 +13,34 @@ entity zlib is
     C_INPUT_BUFFER_SIZE     : integer range 3 to 258   := 10;
     C_SEARCH_BUFFER_SIZE    : integer range 1 to 32768 := 12;
     C_BTYPE                 : integer range 0 to 3     := 1;
-    C_MAX_MATCH_LENGTH_USER : integer                  := 8
+    C_MAX_MATCH_LENGTH_USER : integer                  := 8;
+    C_MATCH_MODE            : integer range 0 to 2     := 0;
+    C_WINDOW_TYPE           : integer range 0 to 1     := 0;
+    C_BLOCK_SIZE            : integer range 2 to 16384 := 1024;
+    C_STORED_FALLBACK       : integer range 0 to 1     := 0;
+    -- The input is split into C_LANES strips, which are compressed in parallel.
+    -- Lane 0 to C_LANES - 2 get C_LANE_SIZE bytes each. The last lane gets the remaining bytes.
+    C_LANES     : integer range 1 to 8 := 1;
+    C_LANE_SIZE : positive             := 1024;
+    -- The output of a lane is buffered until all previous lanes are sent.
+    -- The lane output is stalled when the buffer is full.
+    C_LANE_BUFFER_SIZE : integer range 512 to 65536 := 4096
   );
   port (
-    isl_clk    : in    std_logic;
-    isl_flush  : in    std_logic;
-    isl_start  : in    std_logic;
+    isl_clk   : in    std_logic;
+    isl_flush : in    std_logic;
+    isl_start : in    std_logic;
+    -- The output is stalled while isl_get is '0'. Up to C_ZLIB_MAX_OVERRUN bytes
+    -- can still follow, since the deflate output is registered once more.
+    isl_get    : in    std_logic;
     isl_valid  : in    std_logic;
     islv_data  : in    std_logic_vector(7 downto 0);
     oslv_data  : out   std_logic_vector(7 downto 0);
     osl_valid  : out   std_logic;
-    osl_finish : out   std_logic
+    osl_rdy    : out   std_logic;
+    osl_finish : out   std_logic;
+    -- statistics for the performance counters, summed over all lanes
+    orec_stats : out   t_deflate_stats
   );
 end entity zlib;
 
@@ -53,9 +70,59 @@ architecture behavioral of zlib is
   signal sl_finish_deflate      : std_logic                    := '0';
   signal sl_finish_deflate_save : std_logic                    := '0';
   signal sl_finish              : std_logic                    := '0';
+  signal sl_rdy_deflate         : std_logic                    := '0';
+  -- Deflate data is only accepted after the zlib header was sent.
+  signal sl_get_deflate : std_logic := '0';
 
   signal slv_data_adler32 : std_logic_vector(31 downto 0) := (others => '0');
 
+  -- lanes
+  constant C_ADLER_BASE      : integer := 65521;
+  constant C_LANE_ADDR_WIDTH : integer := log2(C_LANE_BUFFER_SIZE);
+
+  type t_lane_data is array (0 to C_LANES - 1) of std_logic_vector(7 downto 0);
+
+  type t_lane_addr is array (0 to C_LANES - 1) of std_logic_vector(C_LANE_ADDR_WIDTH - 1 downto 0);
+
+  type t_lane_adler32 is array (0 to C_LANES - 1) of std_logic_vector(31 downto 0);
+
+  type t_lane_length is array (0 to C_LANES - 1) of integer range 0 to C_ADLER_BASE - 1;
+
+  signal slv_lane_valid_in     : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_flush        : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_rdy          : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_get          : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_valid_out    : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_finish       : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_finish_saved : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal slv_lane_pop          : std_logic_vector(C_LANES - 1 downto 0)  := (others => '0');
+  signal a_lane_data_out       : t_lane_data                             := (others => (others => '0'));
+  signal a_lane_buffer_out     : t_lane_data                             := (others => (others => '0'));
+  signal a_lane_adler32        : t_lane_adler32                          := (others => (others => '0'));
+  signal a_lane_stats          : t_deflate_stats_array(0 to C_LANES - 1) := (others => C_DEFLATE_STATS_NONE);
+  -- The lane lengths are only needed modulo the adler base.
+  signal a_lane_length : t_lane_length := (others => 0);
+
+  signal a_lane_waddr      : t_lane_addr := (others => (others => '0'));
+  signal a_lane_waddr_d1   : t_lane_addr := (others => (others => '0'));
+  signal a_lane_raddr      : t_lane_addr := (others => (others => '0'));
+  signal a_lane_raddr_next : t_lane_addr := (others => (others => '0'));
+
+  signal int_input_lane    : integer range 0 to C_LANES - 1     := 0;
+  signal int_output_lane   : integer range 0 to C_LANES - 1     := 0;
+  signal int_lane_byte_cnt : integer range 0 to C_LANE_SIZE - 1 := 0;
+
+  type t_merge_states is (MERGE, COMBINE_INIT, COMBINE_MULTIPLY, COMBINE_ADD, COMBINE_DONE);
+
+  signal merge_state : t_merge_states := MERGE;
+
+  -- combination of the adler32 checksums
+  signal int_combine_lane : integer range 0 to C_LANES - 1      := 0;
+  signal int_combine_bit  : integer range 0 to 15               := 0;
+  signal u_rem            : unsigned(15 downto 0)               := (others => '0');
+  signal int_product      : integer range 0 to C_ADLER_BASE - 1 := 0;
+  signal slv_adler32_comb : std_logic_vector(31 downto 0)       := (others => '0');
+
   type t_states is (IDLE, HEADER_CMF, HEADER_FLG, DEFLATE, ADLER32);
 
   signal state : t_states;
@@ -66,34 +133,285 @@ architecture behavioral of zlib is
 
 begin
 
-  i_deflate : entity png_lib.deflate
-    generic map (
-      C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
-      C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
-      C_BTYPE                 => C_BTYPE,
-      C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER
-    )
-    port map (
-      isl_clk    => isl_clk,
-      isl_flush  => isl_flush,
-      isl_valid  => isl_valid,
-      islv_data  => islv_data,
-      oslv_data  => slv_data_deflate,
-      osl_valid  => sl_valid_deflate,
-      osl_finish => sl_finish_deflate
-    );
-
-  i_adler32 : entity png_lib.adler32
-    generic map (
-      C_INPUT_BITWIDTH => islv_data'LENGTH
-    )
-    port map (
-      isl_clk   => isl_clk,
-      isl_start => isl_start,
-      isl_valid => isl_valid,
-      islv_data => islv_data,
-      oslv_data => slv_data_adler32
-    );
+  gen_single_lane : if C_LANES = 1 generate
+
+    i_deflate : entity png_lib.deflate(behavioral)
+      generic map (
+        C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
+        C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
+        C_BTYPE                 => C_BTYPE,
+        C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+        C_MATCH_MODE            => C_MATCH_MODE,
+        C_WINDOW_TYPE           => C_WINDOW_TYPE,
+        C_BLOCK_SIZE            => C_BLOCK_SIZE,
+        C_STORED_FALLBACK       => C_STORED_FALLBACK
+      )
+      port map (
+        isl_clk    => isl_clk,
+        isl_flush  => isl_flush,
+        isl_get    => sl_get_deflate,
+        isl_valid  => isl_valid,
+        islv_data  => islv_data,
+        oslv_data  => slv_data_deflate,
+        osl_valid  => sl_valid_deflate,
+        osl_rdy    => sl_rdy_deflate,
+        osl_finish => sl_finish_deflate,
+        orec_stats => a_lane_stats(0)
+      );
+
+    osl_rdy <= sl_rdy_deflate;
+
+    -- The adler32 checksum gets the same input as the single lane.
+    slv_lane_valid_in(0) <= isl_valid;
+
+    i_adler32 : entity png_lib.adler32(behavioral)
+      generic map (
+        C_INPUT_BITWIDTH => islv_data'LENGTH
+      )
+      port map (
+        isl_clk   => isl_clk,
+        isl_start => isl_start,
+        isl_valid => isl_valid,
+        islv_data => islv_data,
+        oslv_data => slv_data_adler32
+      );
+
+  end generate gen_single_lane;
+
+  -- Each lane compresses its strip to a separate deflate stream. All lanes, except of the last,
+  -- end at a byte boundary without the final block. Thus the streams can be concatenated.
+  -- The adler32 checksums of the lanes are combined at the end.
+
+  gen_lanes : if C_LANES > 1 generate
+
+    gen_lane : for lane in 0 to C_LANES - 1 generate
+
+      i_deflate : entity png_lib.deflate(behavioral)
+        generic map (
+          C_INPUT_BUFFER_SIZE     => C_INPUT_BUFFER_SIZE,
+          C_SEARCH_BUFFER_SIZE    => C_SEARCH_BUFFER_SIZE,
+          C_BTYPE                 => C_BTYPE,
+          C_MAX_MATCH_LENGTH_USER => C_MAX_MATCH_LENGTH_USER,
+          C_MATCH_MODE            => C_MATCH_MODE,
+          C_WINDOW_TYPE           => C_WINDOW_TYPE,
+          C_BLOCK_SIZE            => C_BLOCK_SIZE,
+          C_STORED_FALLBACK       => C_STORED_FALLBACK,
+          -- only the last lane contains the final block
+          C_FINAL_BLOCK => (lane + 1) / C_LANES
+        )
+        port map (
+          isl_clk    => isl_clk,
+          isl_flush  => slv_lane_flush(lane),
+          isl_get    => slv_lane_get(lane),
+          isl_valid  => slv_lane_valid_in(lane),
+          islv_data  => islv_data,
+          oslv_data  => a_lane_data_out(lane),
+          osl_valid  => slv_lane_valid_out(lane),
+          osl_rdy    => slv_lane_rdy(lane),
+          osl_finish => slv_lane_finish(lane),
+          orec_stats => a_lane_stats(lane)
+        );
+
+      i_adler32 : entity png_lib.adler32(behavioral)
+        generic map (
+          C_INPUT_BITWIDTH => islv_data'LENGTH
+        )
+        port map (
+          isl_clk   => isl_clk,
+          isl_start => isl_start,
+          isl_valid => slv_lane_valid_in(lane),
+          islv_data => islv_data,
+          oslv_data => a_lane_adler32(lane)
+        );
+
+      i_lane_buffer : entity png_lib.bram(rtl)
+        generic map (
+          C_ADDR_WIDTH => C_LANE_ADDR_WIDTH,
+          C_DATA_WIDTH => 8
+        )
+        port map (
+          isl_clk => isl_clk,
+
+          isl_we     => slv_lane_valid_out(lane),
+          islv_waddr => a_lane_waddr(lane),
+          islv_data  => a_lane_data_out(lane),
+
+          islv_raddr => a_lane_raddr_next(lane),
+          oslv_data  => a_lane_buffer_out(lane)
+        );
+
+      slv_lane_valid_in(lane) <= isl_valid when int_input_lane = lane else
+                                 '0';
+      -- The lanes get flushed with their last datum.
+      slv_lane_flush(lane) <= isl_flush when lane = C_LANES - 1 else
+                              '1' when int_input_lane = lane and isl_valid = '1' and int_lane_byte_cnt = C_LANE_SIZE - 1 else
+                              '0';
+
+      -- The byte, which is currently written, and the byte of the next cycle need space, too.
+      slv_lane_get(lane) <= '1' when unsigned(a_lane_waddr(lane)) - unsigned(a_lane_raddr(lane)) < 2 ** C_LANE_ADDR_WIDTH - 2 else
+                            '0';
+
+      -- The written data can be read one cycle later.
+      slv_lane_pop(lane)      <= '1' when merge_state = MERGE and int_output_lane = lane and sl_get_deflate = '1' and
+                                          a_lane_waddr_d1(lane) /= a_lane_raddr(lane) else
+                                 '0';
+      a_lane_raddr_next(lane) <= std_logic_vector(unsigned(a_lane_raddr(lane)) + 1) when slv_lane_pop(lane) = '1' else
+                                 a_lane_raddr(lane);
+
+    end generate gen_lane;
+
+    proc_lanes : process (isl_clk) is
+
+      variable v_int_sum : integer range 0 to 4 * C_ADLER_BASE;
+      variable v_int_s1  : integer range 0 to 4 * C_ADLER_BASE;
+      variable v_int_s2  : integer range 0 to 4 * C_ADLER_BASE;
+
+    begin
+
+      if (rising_edge(isl_clk)) then
+        sl_valid_deflate  <= '0';
+        sl_finish_deflate <= '0';
+
+        for lane in 0 to C_LANES - 1 loop
+
+          if (slv_lane_valid_out(lane) = '1') then
+            a_lane_waddr(lane) <= std_logic_vector(unsigned(a_lane_waddr(lane)) + 1);
+          end if;
+          a_lane_waddr_d1(lane) <= a_lane_waddr(lane);
+          a_lane_raddr(lane)    <= a_lane_raddr_next(lane);
+
+          if (slv_lane_finish(lane) = '1') then
+            slv_lane_finish_saved(lane) <= '1';
+          end if;
+
+        end loop;
+
+        -- Split the input into strips.
+        if (isl_start = '1') then
+          int_input_lane    <= 0;
+          int_lane_byte_cnt <= 0;
+          a_lane_length     <= (others => 0);
+        elsif (isl_valid = '1') then
+          if (a_lane_length(int_input_lane) = C_ADLER_BASE - 1) then
+            a_lane_length(int_input_lane) <= 0;
+          else
+            a_lane_length(int_input_lane) <= a_lane_length(int_input_lane) + 1;
+          end if;
+
+          if (int_input_lane /= C_LANES - 1) then
+            if (int_lane_byte_cnt = C_LANE_SIZE - 1) then
+              int_lane_byte_cnt <= 0;
+              int_input_lane    <= int_input_lane + 1;
+            else
+              int_lane_byte_cnt <= int_lane_byte_cnt + 1;
+            end if;
+          end if;
+        end if;
+
+        -- Send the lanes in order.
+        case merge_state is
+
+          when MERGE =>
+
+            sl_valid_deflate <= slv_lane_pop(int_output_lane);
+            slv_data_deflate <= a_lane_buffer_out(int_output_lane);
+
+            -- A lane is done, when it's finished and its buffer is empty.
+            if (slv_lane_finish_saved(int_output_lane) = '1' and
+                a_lane_waddr_d1(int_output_lane) = a_lane_raddr(int_output_lane)) then
+              slv_lane_finish_saved(int_output_lane) <= '0';
+              if (int_output_lane /= C_LANES - 1) then
+                int_output_lane <= int_output_lane + 1;
+              else
+                int_output_lane  <= 0;
+                int_combine_lane <= 1;
+                slv_adler32_comb <= a_lane_adler32(0);
+                merge_state      <= COMBINE_INIT;
+              end if;
+            end if;
+
+          -- Combine the checksums like adler32_combine() of zlib:
+          -- s1 = s1_a + s1_b - 1
+          -- s2 = s2_a + s2_b + length_b * (s1_a - 1)
+          -- The multiplication is done bitwise, modulo the adler base.
+          when COMBINE_INIT =>
+
+            u_rem           <= to_unsigned(a_lane_length(int_combine_lane), 16);
+            int_product     <= 0;
+            int_combine_bit <= 15;
+            merge_state     <= COMBINE_MULTIPLY;
+
+          when COMBINE_MULTIPLY =>
+
+            v_int_sum := 2 * int_product;
+            if (u_rem(int_combine_bit) = '1') then
+              v_int_sum := v_int_sum + to_integer(unsigned(slv_adler32_comb(15 downto 0)));
+            end if;
+
+            if (v_int_sum >= 2 * C_ADLER_BASE) then
+              int_product <= v_int_sum - 2 * C_ADLER_BASE;
+            elsif (v_int_sum >= C_ADLER_BASE) then
+              int_product <= v_int_sum - C_ADLER_BASE;
+            else
+              int_product <= v_int_sum;
+            end if;
+
+            if (int_combine_bit /= 0) then
+              int_combine_bit <= int_combine_bit - 1;
+            else
+              merge_state <= COMBINE_ADD;
+            end if;
+
+          when COMBINE_ADD =>
+
+            v_int_s1 := to_integer(unsigned(slv_adler32_comb(15 downto 0))) +
+                        to_integer(unsigned(a_lane_adler32(int_combine_lane)(15 downto 0))) +
+                        C_ADLER_BASE - 1;
+            if (v_int_s1 >= 2 * C_ADLER_BASE) then
+              v_int_s1 := v_int_s1 - 2 * C_ADLER_BASE;
+            elsif (v_int_s1 >= C_ADLER_BASE) then
+              v_int_s1 := v_int_s1 - C_ADLER_BASE;
+            end if;
+
+            v_int_s2 := int_product +
+                        to_integer(unsigned(slv_adler32_comb(31 downto 16))) +
+                        to_integer(unsigned(a_lane_adler32(int_combine_lane)(31 downto 16))) +
+                        C_ADLER_BASE - to_integer(u_rem);
+            if (v_int_s2 >= 2 * C_ADLER_BASE) then
+              v_int_s2 := v_int_s2 - 2 * C_ADLER_BASE;
+            end if;
+            if (v_int_s2 >= C_ADLER_BASE) then
+              v_int_s2 := v_int_s2 - C_ADLER_BASE;
+            end if;
+
+            slv_adler32_comb <= std_logic_vector(to_unsigned(v_int_s2, 16)) &
+                                std_logic_vector(to_unsigned(v_int_s1, 16));
+
+            if (int_combine_lane /= C_LANES - 1) then
+              int_combine_lane <= int_combine_lane + 1;
+              merge_state      <= COMBINE_INIT;
+            else
+              merge_state <= COMBINE_DONE;
+            end if;
+
+          when COMBINE_DONE =>
+
+            sl_finish_deflate <= '1';
+            merge_state       <= MERGE;
+
+        end case;
+
+      end if;
+
+    end process proc_lanes;
+
+    slv_data_adler32 <= slv_adler32_comb;
+    osl_rdy          <= slv_lane_rdy(int_input_lane);
+
+  end generate gen_lanes;
+
+  -- The adler32 checksums are busy, when their lane gets a datum.
+  orec_stats <= sum_deflate_stats(a_lane_stats, slv_lane_valid_in);
 
   proc_fsm : process (isl_clk) is
   begin
@@ -118,15 +436,19 @@ begin
 
         when HEADER_CMF =>
 
-          sl_valid_out <= '1';
-          slv_data_out <= C_CMF;
-          state        <= HEADER_FLG;
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= C_CMF;
+            state        <= HEADER_FLG;
+          end if;
 
         when HEADER_FLG =>
 
-          sl_valid_out <= '1';
-          slv_data_out <= C_FLG;
-          state        <= DEFLATE;
+          if (isl_get = '1') then
+            sl_valid_out <= '1';
+            slv_data_out <= C_FLG;
+            state        <= DEFLATE;
+          end if;
 
         when DEFLATE =>
 
@@ -142,9 +464,11 @@ begin
         when ADLER32 =>
 
           if (int_output_byte_index /= 0) then
-            sl_valid_out          <= '1';
-            slv_data_out          <= get_byte(slv_data_adler32, int_output_byte_index);
-            int_output_byte_index <= int_output_byte_index - 1;
+            if (isl_get = '1') then
+              sl_valid_out          <= '1';
+              slv_data_out          <= get_byte(slv_data_adler32, int_output_byte_index);
+              int_output_byte_index <= int_output_byte_index - 1;
+            end if;
           else
             state     <= IDLE;
             sl_finish <= '1';
@@ -156,6 +480,9 @@ begin
 
   end process proc_fsm;
 
+  sl_get_deflate <= isl_get when state = DEFLATE else
+                    '0';
+
   osl_valid  <= sl_valid_out;
   oslv_data  <= slv_data_out;
   osl_finish <= sl_finish;
@@ -13,12 +13,16 @@ ghdl -a --std=08 --work=util "$ROOT/src/util/math_pkg.vhd"
 ghdl -a --std=08 --work=util "$ROOT/src/util/png_pkg.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/bram.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/lzss.vhd"
+ghdl -a --std=08 --work=png_lib "$ROOT/src/lzss_hash.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/adler32.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/crc32.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/huffman.vhd"
+ghdl -a --std=08 --work=png_lib "$ROOT/src/huffman_block.vhd"
+ghdl -a --std=08 --work=png_lib "$ROOT/src/stored.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/deflate.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/zlib.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/row_filter.vhd"
+ghdl -a --std=08 --work=png_lib "$ROOT/src/bit_packer.vhd"
 ghdl -a --std=08 --work=png_lib "$ROOT/src/png_encoder.vhd"
 # ghdl --synth --std=08 --work=png_lib png_encoder
 yosys -m ghdl -p 'ghdl --std=08 --work=png_lib --no-formal png_encoder; synth_ice40 -json png_encoder.json'
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""Synthesize and place the png encoder for a sweep of generics.
+
+Each point of the sweep is synthesized by Yosys (with the GHDL plugin) and
+placed and routed by nextpnr for a fixed target. The LUT, FF and BRAM counts
+and the achieved Fmax are combined with the cycles per input byte into a
+throughput per LUT. The results are written to a JSON and a CSV file.
+Optionally, they are compared with a baseline. The run fails, if the area
+grew or the Fmax dropped.
+
+The cycles per byte are taken from the results of "sim/benchmark.py"
+(--cycles), averaged over the corpus images. Points without simulation
+result are roughly estimated by the reference model ("cycles_source").
+
+Examples:
+    ./synth_benchmark.py -j4 --baseline synth_baseline.json
+    ./synth_benchmark.py -j4 --save-baseline synth_baseline.json
+    ./synth_benchmark.py --target ecp5 --cycles ../sim/benchmark.json
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import itertools
+import json
+import os
+from os.path import join, dirname, abspath
+import subprocess
+import sys
+from typing import Dict, List
+
+sys.path.insert(0, join(dirname(abspath(__file__)), "..", "sim"))
+import png_model  # noqa: E402 pylint: disable=wrong-import-position
+import stimuli  # noqa: E402 pylint: disable=wrong-import-position
+
+
+ROOT = join(dirname(abspath(__file__)), "..")
+BUILD_DIR = join(dirname(abspath(__file__)), "build", "benchmark")
+
+# In order of the dependencies. See also "synth.sh".
+SOURCES = {
+    "util": ("huffman_pkg", "math_pkg", "png_pkg"),
+    "png_lib": ("bram", "lzss", "lzss_hash", "adler32", "crc32", "huffman",
+                "huffman_block", "stored", "deflate", "zlib", "row_filter",
+                "bit_packer", "png_encoder"),
+}
+
+TARGETS = {
+    "ice40": {
+        "synth": "synth_ice40",
+        "pnr": ["nextpnr-ice40", "--hx8k", "--package", "ct256"],
+        "lut": ("SB_LUT4",),
+        "ff": ("SB_DFF",),  # prefix of all flip-flop variants
+        "bram": ("SB_RAM40_4K",),
+    },
+    "ecp5": {
+        "synth": "synth_ecp5",
+        "pnr": ["nextpnr-ecp5", "--85k", "--package", "CABGA381"],
+        "lut": ("LUT4",),
+        "ff": ("TRELLIS_FF",),
+        "bram": ("DP16KD",),
+    },
+}
+
+# The image size affects only the row buffer of the row filter.
+IMAGE_SIZE = (800, 480)
+
+SWEEP = {
+    "search_buffer_size": (12, 24),
+    "input_buffer_size": (12, 16),
+    "color_type": (0, 2, 6),
+    "row_filter_type": (0, 5),
+}
+
+# The cycles are estimated on the corpus of "sim/benchmark.py".
+CORPUS_SIZE = (32, 24)
+CORPUS = ("gradient", "tiles", "noise", "sensor")
+
+
+class SynthesisError(Exception):
+    """Yosys or nextpnr failed."""
+
+
+class Point:
+    """A single synthesis run, i. e. a set of generics."""
+
+    def __init__(self, **kwargs):
+        self.generics = png_model.Generics(*IMAGE_SIZE, **kwargs)
+
+    @property
+    def id_(self) -> str:
+        generics = self.generics
+        return (f"synth_ib_{generics.input_buffer_size}_"
+                f"sb_{generics.search_buffer_size}_"
+                f"row_filter_{generics.row_filter_type}_"
+                f"color_{generics.color_type}")
+
+    @property
+    def build_dir(self) -> str:
+        return join(BUILD_DIR, self.id_)
+
+    def estimate_cycles_per_byte(self) -> float:
+        """Average of the corpus images, estimated by the reference model."""
+        generics = png_model.Generics(*CORPUS_SIZE, **{
+            key: getattr(self.generics, key) for key in SWEEP})
+        cycles_per_byte = []
+        for image in CORPUS:
+            data_in = list(stimuli.to_bytes(stimuli.Stimulus(
+                image, *CORPUS_SIZE, generics.depth)))
+            cycles_per_byte.append(
+                png_model.estimate_cycles(data_in, generics) / len(data_in))
+        return sum(cycles_per_byte) / len(cycles_per_byte)
+
+
+def create_points() -> List[Point]:
+    return [Point(**dict(zip(SWEEP, values)))
+            for values in itertools.product(*SWEEP.values())]
+
+
+def run(command: List[str], cwd: str, logfile: str):
+    with open(join(cwd, logfile), "w") as outfile:
+        result = subprocess.run(command, cwd=cwd, stdout=outfile,
+                                stderr=subprocess.STDOUT, check=False)
+    if result.returncode != 0:
+        raise SynthesisError(f"{command[0]} failed, see {join(cwd, logfile)}")
+
+
+def analyze():
+    """Analyze the sources once. The work libraries are shared by all points."""
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    for library, names in SOURCES.items():
+        for name in names:
+            subfolder = "util" if library == "util" else ""
+            run(["ghdl", "-a", "--std=08", f"--work={library}",
+                 join(ROOT, "src", subfolder, f"{name}.vhd")],
+                BUILD_DIR, "analyze.log")
+
+
+def count_cells(cells: Dict[str, int], prefixes) -> int:
+    return sum(count for cell, count in cells.items()
+               if cell.startswith(prefixes))
+
+
+def synthesize(point: Point, target: str, frequency: float, seed: int) -> Dict:
+    """Synthesize, place and route a point. Return the resources and Fmax."""
+    os.makedirs(point.build_dir, exist_ok=True)
+    config = TARGETS[target]
+
+    generics = " ".join(f"-g{name}={value}"
+                        for name, value in point.generics.to_vhdl().items())
+    script = (f"ghdl --std=08 --workdir={BUILD_DIR} -P{BUILD_DIR} "
+              f"--work=png_lib --no-formal {generics} png_encoder; "
+              f"{config['synth']} -top png_encoder -json png_encoder.json; "
+              "tee -q -o stat.json stat -json")
+    run(["yosys", "-m", "ghdl", "-p", script], point.build_dir, "yosys.log")
+    run(config["pnr"] + ["--json", "png_encoder.json", "--report", "report.json",
+                         "--freq", str(frequency), "--seed", str(seed)],
+        point.build_dir, "nextpnr.log")
+
+    with open(join(point.build_dir, "stat.json")) as infile:
+        stat = json.load(infile)
+    # "design" summarizes the hierarchy. It's missing for a flat design.
+    if "design" not in stat:
+        stat["design"] = next(iter(stat["modules"].values()))
+    cells = stat["design"]["num_cells_by_type"]
+    with open(join(point.build_dir, "report.json")) as infile:
+        report = json.load(infile)
+    # The design has a single clock. Take the worst, in case there are more.
+    fmax = min(clock["achieved"] for clock in report["fmax"].values())
+    return {
+        "lut": count_cells(cells, config["lut"]),
+        "ff": count_cells(cells, config["ff"]),
+        "bram": count_cells(cells, config["bram"]),
+        "fmax_mhz": fmax,
+    }
+
+
+def load_simulated_cycles(filename: str) -> Dict[tuple, float]:
+    """Average cycles per byte of the "sim/benchmark.py" results, keyed by
+    the swept generics."""
+    with open(filename) as infile:
+        rows = json.load(infile)
+    default = png_model.Generics()
+    cycles_per_byte: Dict[tuple, List[float]] = {}
+    for row in rows:
+        # Only the default match length is synthesized.
+        if row["max_match_length_user"] != default.max_match_length_user:
+            continue
+        key = tuple(row[name] for name in SWEEP)
+        cycles_per_byte.setdefault(key, []).append(row["cycles_per_byte"])
+    return {key: sum(values) / len(values)
+            for key, values in cycles_per_byte.items()}
+
+
+def result(point: Point, resources: Dict,
+           simulated_cycles: Dict[tuple, float]) -> Dict:
+    row = {"id": point.id_}
+    row.update({key: getattr(point.generics, key) for key in SWEEP})
+    row.update(resources)
+
+    key = tuple(getattr(point.generics, name) for name in SWEEP)
+    if key in simulated_cycles:
+        row["cycles_per_byte"] = simulated_cycles[key]
+        row["cycles_source"] = "simulation"
+    else:
+        row["cycles_per_byte"] = point.estimate_cycles_per_byte()
+        row["cycles_source"] = "model"
+    row["throughput_mbyte_s"] = row["fmax_mhz"] / row["cycles_per_byte"]
+    row["throughput_per_lut"] = row["throughput_mbyte_s"] / max(1, row["lut"])
+    return row
+
+
+def write_results(results: Dict[str, Dict], basename: str):
+    rows = [results[id_] for id_ in sorted(results)]
+    with open(f"{basename}.json", "w") as outfile:
+        json.dump(rows, outfile, indent=2)
+    if rows:
+        with open(f"{basename}.csv", "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def print_table(results: Dict[str, Dict]):
+    print(f"{'id':44} {'LUT':>6} {'FF':>6} {'BRAM':>4} {'Fmax':>7} "
+          f"{'cyc/B':>6} {'MB/s':>7} {'kB/s/LUT':>8}")
+    for id_, row in sorted(results.items()):
+        print(f"{id_:44} {row['lut']:6} {row['ff']:6} {row['bram']:4} "
+              f"{row['fmax_mhz']:7.2f} {row['cycles_per_byte']:6.2f} "
+              f"{row['throughput_mbyte_s']:7.2f} "
+              f"{1000 * row['throughput_per_lut']:8.2f}")
+
+
+def compare_with_baseline(results: Dict[str, Dict], filename: str,
+                          tolerance: float) -> bool:
+    """Check the resources and the Fmax for regressions."""
+    with open(filename) as infile:
+        baseline = {row["id"]: row for row in json.load(infile)}
+
+    ok = True
+    for id_, row in sorted(results.items()):
+        if id_ not in baseline:
+            print(f"{id_}: not in baseline")
+            continue
+        reference = baseline[id_]
+        for resource in ("lut", "ff", "bram"):
+            if row[resource] > reference[resource] * (1 + tolerance):
+                print(f"{id_}: area regression, {resource} "
+                      f"{reference[resource]} -> {row[resource]}")
+                ok = False
+        if row["fmax_mhz"] < reference["fmax_mhz"] * (1 - tolerance):
+            print(f"{id_}: timing regression, Fmax "
+                  f"{reference['fmax_mhz']:.2f} MHz -> {row['fmax_mhz']:.2f} MHz")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    PARSER.add_argument("--target", choices=sorted(TARGETS), default="ice40")
+    PARSER.add_argument("--freq", type=float, default=50,
+                        help="target frequency of place and route in MHz")
+    PARSER.add_argument("--seed", type=int, default=1,
+                        help="seed of place and route, for reproducible results")
+    PARSER.add_argument("-j", "--jobs", type=int, default=1,
+                        help="amount of points to synthesize in parallel")
+    PARSER.add_argument("--cycles",
+                        help="JSON results of sim/benchmark.py")
+    PARSER.add_argument("--output", default="synth_benchmark",
+                        help="basename of the JSON and CSV result files")
+    PARSER.add_argument("--baseline", help="JSON file to compare with")
+    PARSER.add_argument("--save-baseline", help="JSON file to save the results as baseline")
+    PARSER.add_argument(
+        "--tolerance", type=float, default=0.02,
+        help="relative tolerance of the comparison with the baseline")
+    ARGS = PARSER.parse_args()
+
+    SIMULATED_CYCLES: Dict[tuple, float] = {}
+    if ARGS.cycles:
+        SIMULATED_CYCLES = load_simulated_cycles(ARGS.cycles)
+
+    analyze()
+    POINTS = create_points()
+    with ThreadPoolExecutor(max_workers=ARGS.jobs) as executor:
+        RESOURCES = executor.map(
+            lambda point: synthesize(point, ARGS.target, ARGS.freq, ARGS.seed),
+            POINTS)
+        RESULTS = {point.id_: result(point, resources, SIMULATED_CYCLES)
+                   for point, resources in zip(POINTS, RESOURCES)}
+
+    print_table(RESULTS)
+    write_results(RESULTS, ARGS.output)
+    if ARGS.save_baseline:
+        write_results(RESULTS, os.path.splitext(ARGS.save_baseline)[0])
+    if ARGS.baseline and not compare_with_baseline(
+            RESULTS, ARGS.baseline, ARGS.tolerance):
+        sys.exit(1)